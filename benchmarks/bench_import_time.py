@@ -0,0 +1,74 @@
+# encoding=utf-8
+"""
+Import-time benchmark based on `python -X importtime`.
+
+Measures the cumulative import time of `roald` (and of the modules needed to
+load a Roald3 file) in fresh interpreters, and checks that the heavy
+dependencies are not imported. Exits with status 1 if the budget is exceeded,
+so it can be used as a guard in CI.
+
+Usage:
+
+    python benchmarks/bench_import_time.py [--budget-ms 60] [--runs 7]
+"""
+from __future__ import print_function
+import argparse
+import re
+import subprocess
+import sys
+
+HEAVY_MODULES = ['rdflib', 'skosify', 'otsrdflib', 'lxml', 'xmlwitch', 'isodate', 'requests', 'iso639']
+
+SCENARIOS = [
+    ('import roald', 'import roald'),
+    ('roald3 reader', 'import roald; from roald.adapters.registry import formats; formats.get("roald3")'),
+]
+
+line_re = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$')
+
+
+def run_once(statement):
+    """
+    Returns a dict of cumulative import time (in microseconds) per top-level
+    module imported by `statement`, and the list of all imported modules.
+    """
+    code = statement + '; import sys; print(",".join(sorted(sys.modules)))'
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        m = line_re.match(line)
+        if m and len(m.group(3)) == 1:  # only top-level imports
+            cumulative[m.group(4)] = int(m.group(2))
+    return cumulative, proc.stdout.strip().split(',')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=60.0,
+                        help='max median cumulative import time of roald per scenario (default: 60)')
+    parser.add_argument('--runs', type=int, default=7)
+    args = parser.parse_args()
+
+    failed = False
+    for name, statement in SCENARIOS:
+        timings = []
+        modules = []
+        for _ in range(args.runs):
+            cumulative, modules = run_once(statement)
+            timings.append(cumulative.get('roald', 0) / 1000.)
+        median = sorted(timings)[len(timings) // 2]
+
+        heavy = [x for x in HEAVY_MODULES if x in modules]
+        ok = median <= args.budget_ms and not heavy
+        failed = failed or not ok
+        print('{:<16} median {:6.1f} ms  min {:6.1f} ms  budget {:6.1f} ms  {}'.format(
+            name, median, min(timings), args.budget_ms, 'OK' if ok else 'FAIL'))
+        if heavy:
+            print('    heavy modules imported: {}'.format(', '.join(heavy)))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
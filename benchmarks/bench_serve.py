@@ -0,0 +1,171 @@
+# encoding=utf-8
+"""
+Load test for `roald serve`.
+
+Starts `python -m roald serve` on a synthetic vocabulary in a separate process,
+and sends a mix of /id, /term, /search and /authorize requests from a number
+of client threads, each keeping its connection open. Prints the throughput
+and the latency percentiles for each kind of request.
+
+With --reload, the vocabulary file is replaced a quarter into the run, and
+the run fails unless the server swapped in the new vocabulary without any
+request failing.
+
+Usage:
+
+    python benchmarks/bench_serve.py [--size 20000] [--clients 8] [--threads 8]
+                                     [--duration 10] [--reload]
+"""
+from __future__ import division, print_function
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from six.moves.http_client import HTTPConnection
+from six.moves.urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import generator  # noqa: E402
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def queries(resources, n, seed=1):
+    """Returns `n` (kind, path) requests for labels and IDs in the vocabulary."""
+    rnd = random.Random(seed)
+    simple = generator.simple_resources(resources)
+    out = []
+    for _ in range(n):
+        resource = rnd.choice(simple)
+        label = resource['prefLabel']['nb']['value']
+        kind = rnd.choice(['id', 'term', 'search', 'authorize'])
+        if kind == 'id':
+            out.append((kind, '/id/' + resource['id']))
+        elif kind == 'term':
+            out.append((kind, '/term?q=' + quote(label.encode('utf-8'))))
+        elif kind == 'search':
+            out.append((kind, '/search?q=' + quote(label[:3].encode('utf-8')) + '&limit=10'))
+        else:
+            out.append((kind, '/authorize?q=' + quote(label.encode('utf-8'))))
+    return out
+
+
+def request(conn, path):
+    conn.request('GET', path)
+    response = conn.getresponse()
+    body = response.read()
+    return response.status, body
+
+
+def wait_until_ready(port, timeout=300):
+    t0 = time.time()
+    while time.time() - t0 < timeout:
+        try:
+            conn = HTTPConnection('127.0.0.1', port)
+            status, body = request(conn, '/status')
+            conn.close()
+            if json.loads(body.decode('utf-8'))['resources']:
+                return time.time() - t0
+        except (socket.error, ValueError):
+            pass
+        time.sleep(0.1)
+    raise RuntimeError('The server did not start')
+
+
+def client(port, requests, deadline, results):
+    conn = HTTPConnection('127.0.0.1', port)
+    n = 0
+    while time.time() < deadline:
+        kind, path = requests[n % len(requests)]
+        n += 1
+        t0 = time.time()
+        try:
+            status, _ = request(conn, path)
+        except (socket.error, IOError):
+            conn.close()
+            conn = HTTPConnection('127.0.0.1', port)
+            status = None
+        results.append((kind, time.time() - t0, status))
+    conn.close()
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--size', type=int, default=20000, help='Number of resources')
+    parser.add_argument('--clients', type=int, default=8, help='Number of client threads')
+    parser.add_argument('--threads', type=int, default=8, help='Number of server threads')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run')
+    parser.add_argument('--reload', action='store_true', help='Replace the vocabulary during the run')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    filename = os.path.join(tmp, 'vocabulary.json')
+    resources = generator.generate(args.size)
+    generator.write_roald3(resources, filename)
+    requests = queries(resources, 10000)
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-m', 'roald', 'serve', filename, '--port', str(port),
+                               '--threads', str(args.threads), '--interval', '0.5'])
+    try:
+        print('Loaded %d resources in %.1f s' % (args.size, wait_until_ready(port)))
+        results = []
+        deadline = time.time() + args.duration
+        clients = [threading.Thread(target=client, args=(port, requests[n::args.clients], deadline, results))
+                   for n in range(args.clients)]
+        for thread in clients:
+            thread.start()
+        if args.reload:
+            time.sleep(args.duration / 4)
+            generator.write_roald3(generator.generate(args.size, seed=43), filename + '.tmp')
+            os.rename(filename + '.tmp', filename)
+        for thread in clients:
+            thread.join()
+
+        # Loading takes a while, so the new vocabulary may not be in place yet
+        t0 = time.time()
+        while True:
+            conn = HTTPConnection('127.0.0.1', port)
+            status = json.loads(request(conn, '/status')[1].decode('utf-8'))
+            conn.close()
+            if not args.reload or status['reloads'] > 1 or time.time() - t0 > 300:
+                break
+            time.sleep(0.1)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(tmp)
+
+    failed = [x for x in results if x[2] not in (200, 404)]
+    print('%d requests in %.1f s: %.0f req/s, %d failed, %d clients, %d server threads, %d reloads' % (
+        len(results), args.duration, len(results) / args.duration, len(failed), args.clients, args.threads,
+        status['reloads'] - 1))
+    print('{:<10} {:>8} {:>9} {:>9} {:>9}'.format('', 'n', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for kind in ['id', 'term', 'search', 'authorize', 'all']:
+        times = sorted([x[1] * 1e3 for x in results if kind in (x[0], 'all')])
+        if times:
+            print('{:<10} {:>8} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+                kind, len(times), percentile(times, 50), percentile(times, 95), percentile(times, 99)))
+    if failed or (args.reload and status['reloads'] < 2):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
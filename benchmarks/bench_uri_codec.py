@@ -0,0 +1,59 @@
+# encoding=utf-8
+"""
+Microbenchmark for the URI codec used by `Vocabulary.uri` and `Vocabulary.id_from_uri`.
+
+Compares the cached codec with the previous implementation, which ran
+`re.sub` and compiled a fresh pattern on every call.
+
+Usage:
+
+    python benchmarks/bench_uri_codec.py [n_ids] [repeat]
+"""
+from __future__ import print_function
+import re
+import sys
+import timeit
+
+from roald.models.uri import UriCodec
+
+URI_FORMAT = 'http://data.ub.uio.no/realfagstermer/c{id}'
+
+
+def uncached_uri(id, uri_format=URI_FORMAT):
+    if id.startswith('http://'):
+        return id
+    numeric_id = re.sub('[^0-9]', '', id)
+    return uri_format.format(id=numeric_id)
+
+
+def uncached_id_from_uri(uri, uri_format=URI_FORMAT, id_prefix='REAL'):
+    pattern = uri_format.format(id='([0-9]+)')
+    m = re.match(pattern, uri)
+    if m is None:
+        return None
+    return id_prefix + m.group(1)
+
+
+def main(n_ids=20000, repeat=5):
+    # Every ID is converted several times, like in the exporters
+    ids = ['REAL%06d' % (x % n_ids) for x in range(n_ids * 5)]
+    uris = [uncached_uri(x) for x in ids]
+    codec = UriCodec(URI_FORMAT, 'REAL')
+
+    assert [codec.uri(x) for x in ids] == uris
+    assert [codec.id_from_uri(x) for x in uris] == ids
+
+    cases = [
+        ('uri (uncached)', lambda: [uncached_uri(x) for x in ids]),
+        ('uri (codec)', lambda: [codec.uri(x) for x in ids]),
+        ('id_from_uri (uncached)', lambda: [uncached_id_from_uri(x) for x in uris]),
+        ('id_from_uri (codec)', lambda: [codec.id_from_uri(x) for x in uris]),
+    ]
+    print('%d conversions per run, best of %d runs' % (len(ids), repeat))
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=1, repeat=repeat))
+        print('{:<25} {:8.1f} ms  {:6.0f} ns/call'.format(name, best * 1e3, best * 1e9 / len(ids)))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:3]])
@@ -0,0 +1,51 @@
+# encoding=utf-8
+"""
+Compare two reports from `benchmarks.run`.
+
+Usage:
+
+    python -m benchmarks.compare baseline.json new.json
+"""
+from __future__ import print_function
+import io
+import json
+import sys
+
+
+def load(filename):
+    with io.open(filename, encoding='utf-8') as f:
+        report = json.load(f)
+    return report, dict(((x['case'], x['size']), x) for x in report['results'])
+
+
+def ratio(new, old):
+    if not old:
+        return '     -'
+    return '{:5.2f}x'.format(new / old)
+
+
+def main(baseline_filename, new_filename):
+    baseline, old_results = load(baseline_filename)
+    new, new_results = load(new_filename)
+    print('Baseline: %s (%s)' % (baseline_filename, baseline.get('revision')))
+    print('New:      %s (%s)' % (new_filename, new.get('revision')))
+    print()
+    print('{:<24} {:>8} {:>10} {:>10} {:>7} {:>10} {:>10} {:>7}'.format(
+        'case', 'size', 'old s', 'new s', 'time', 'old MB', 'new MB', 'memory'))
+    for key in sorted(new_results.keys(), key=lambda k: (k[1], k[0])):
+        if key not in old_results:
+            continue
+        a, b = old_results[key], new_results[key]
+        if 'error' in a or 'error' in b:
+            print('{:<24} {:>8} failed'.format(key[0], key[1]))
+            continue
+        print('{:<24} {:>8} {:>10.2f} {:>10.2f} {:>7} {:>10.1f} {:>10.1f} {:>7}'.format(
+            key[0], key[1], a['seconds'], b['seconds'], ratio(b['seconds'], a['seconds']),
+            a['peak_rss_mb'], b['peak_rss_mb'], ratio(b['peak_rss_mb'], a['peak_rss_mb'])))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,360 @@
+# encoding=utf-8
+"""
+Deterministic generator of synthetic vocabularies for the benchmarks.
+
+The generated vocabularies look roughly like Realfagstermer: mostly topics with
+labels in nb/nn/en, some places, forms and periods, compound headings built from
+other concepts, broader/related links, mappings to dewey.info and Wikidata, and
+a few categories. The same seed and size always give the same vocabulary.
+
+Besides Roald3 JSON, the vocabulary can be written in the input formats read by
+the Roald2, Marc21, Mesh and Bibsys adapters.
+"""
+from __future__ import print_function
+import io
+import json
+import os
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+SYLLABLES = ['ka', 'ne', 'ri', 'mo', 'sa', 'tu', 'le', 'vi', 'go', 'da', 'pe', 'lu', 'fi', 'ro', 'ma',
+             'sto', 'ber', 'gen', 'lik', 'ens', 'trø', 'skå', 'bæ', 'nor', 'dal']
+
+TYPES = [('Topic', 80), ('Geographic', 8), ('GenreForm', 5), ('Temporal', 4), ('CompoundHeading', 3)]
+
+MAPPING_TYPES = ['exactMatch', 'closeMatch', 'broadMatch', 'narrowMatch', 'relatedMatch']
+
+URI_FORMAT = 'http://data.ub.uio.no/realfagstermer/c{id}'
+
+N_CATEGORIES = 20
+
+
+def word(n):
+    """Returns a unique pseudo-word for each non-negative integer."""
+    out = []
+    while True:
+        out.append(SYLLABLES[n % len(SYLLABLES)])
+        n //= len(SYLLABLES)
+        if n == 0:
+            return ''.join(out)
+
+
+def resource_id(n):
+    return 'REAL%06d' % n
+
+
+def category_id(n):
+    return 'http://data.ub.uio.no/realfagstermer/category/c%d' % n
+
+
+def date(rnd, start_year=2005):
+    return '%04d-%02d-%02dT%02d:%02d:%02dZ' % (start_year + rnd.randint(0, 14), rnd.randint(1, 12), rnd.randint(1, 28),
+                                               rnd.randint(0, 23), rnd.randint(0, 59), rnd.randint(0, 59))
+
+
+def pick_type(rnd):
+    x = rnd.randint(1, 100)
+    for name, weight in TYPES:
+        if x <= weight:
+            return name
+        x -= weight
+    return TYPES[0][0]
+
+
+def generate(n, seed=42):
+    """
+    Returns a list of `n` resources (plus some categories) as Roald3 dicts.
+    """
+    rnd = random.Random(seed)
+    resources = []
+    simple = []  # indexes of resources that can be used as components
+
+    for c in range(N_CATEGORIES):
+        resources.append({
+            'id': category_id(c),
+            'type': ['Category'],
+            'prefLabel': {'nb': {'value': 'Kategori %s' % word(c).capitalize()}},
+        })
+
+    for i in range(n):
+        rid = resource_id(i + 1)
+        rtype = pick_type(rnd)
+        created = date(rnd)
+        res = {
+            'id': rid,
+            'type': [rtype],
+            'created': created,
+        }
+        if rnd.random() < 0.5:
+            res['modified'] = max(created, date(rnd, 2012))
+
+        if rtype == 'CompoundHeading' and len(simple) > 10:
+            components = [resources[x]['id'] for x in rnd.sample(simple, rnd.choice([2, 2, 2, 3]))]
+            res['component'] = components
+            res['prefLabel'] = {}
+            if rnd.random() < 0.3:
+                res['type'] = ['VirtualCompoundHeading']
+            resources.append(res)
+            continue
+        elif rtype == 'CompoundHeading':
+            rtype = 'Topic'
+            res['type'] = [rtype]
+
+        label = word(i).capitalize()
+        res['prefLabel'] = {'nb': {'value': label}}
+        if rnd.random() < 0.6:
+            res['prefLabel']['nn'] = {'value': label + 'ar'}
+        if rnd.random() < 0.7:
+            res['prefLabel']['en'] = {'value': label + 'ing'}
+
+        n_alt = rnd.choice([0, 0, 1, 1, 2, 3])
+        if n_alt:
+            res['altLabel'] = {'nb': [{'value': '%s %s' % (label, word(i * 7 + x))} for x in range(n_alt)]}
+            if rnd.random() < 0.2:
+                res['altLabel']['nb'][0]['hasAcronym'] = label[:3].upper()
+
+        if rnd.random() < 0.2:
+            res['definition'] = {'nb': 'Definisjon av %s' % label.lower()}
+        if rnd.random() < 0.1:
+            res['editorialNote'] = ['Merknad %d' % i]
+        if rnd.random() < 0.1:
+            res['libCode'] = [rnd.choice(['ureal', 'umn', 'uhs'])]
+
+        if simple and rnd.random() < 0.7:
+            # Only link to earlier resources, so the hierarchy has no cycles
+            res['broader'] = [resources[rnd.choice(simple)]['id']]
+        if simple and rnd.random() < 0.2:
+            res['related'] = [resources[rnd.choice(simple)]['id']]
+        if rnd.random() < 0.4:
+            res['memberOf'] = [category_id(rnd.randrange(N_CATEGORIES))]
+
+        if rnd.random() < 0.3:
+            # A few outliers with lots of mappings
+            n_mappings = 100 if rnd.random() < 0.001 else rnd.choice([1, 1, 2, 3])
+            mappings = {}
+            for x in range(n_mappings):
+                mapping_type = rnd.choice(MAPPING_TYPES)
+                ddc = '%03d.%d' % (rnd.randint(0, 999), rnd.randint(1, 999))
+                mappings.setdefault(mapping_type, []).append('http://dewey.info/class/%s/e23/' % ddc)
+            if rnd.random() < 0.2:
+                mappings.setdefault('closeMatch', []).append('http://www.wikidata.org/entity/Q%d' % rnd.randint(1, 10 ** 7))
+            res['mappings'] = mappings
+
+        if simple and rnd.random() < 0.01:
+            res['deprecated'] = date(rnd, 2018)
+            res['replacedBy'] = [resources[rnd.choice(simple)]['id']]
+
+        simple.append(len(resources))
+        resources.append(res)
+
+    return resources
+
+
+def simple_resources(resources):
+    return [x for x in resources if 'component' not in x and x['type'][0] != 'Category']
+
+
+def write_roald3(resources, filename):
+    data = {
+        'default_language': 'nb',
+        'uri_format': URI_FORMAT,
+        'resources': resources,
+    }
+    with io.open(filename, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False))
+
+
+def write_scheme(filename):
+    with io.open(filename, 'w', encoding='utf-8') as f:
+        f.write(u'<http://data.ub.uio.no/realfagstermer/> a <http://www.w3.org/2004/02/skos/core#ConceptScheme> .\n')
+
+
+def write_roald2(resources, path):
+    files = {
+        'Topic': 'idtermer.txt',
+        'GenreForm': 'idformer.txt',
+        'Temporal': 'idtider.txt',
+        'Geographic': 'idsteder.txt',
+        'CompoundHeading': 'idstrenger.txt',
+        'VirtualCompoundHeading': 'idstrenger.txt',
+    }
+    streams = {}
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    try:
+        for res in resources:
+            filename = files.get(res['type'][0])
+            if filename is None:
+                continue
+            if filename not in streams:
+                streams[filename] = io.open(os.path.join(path, filename), 'w', encoding='utf-8')
+            lines = ['id= %s' % res['id']]
+            if 'nb' in res['prefLabel']:
+                lines.append('te= %s' % res['prefLabel']['nb']['value'])
+            for lang in ['nn', 'en']:
+                if lang in res['prefLabel']:
+                    lines.append('%s= %s' % (lang, res['prefLabel'][lang]['value']))
+            for label in res.get('altLabel', {}).get('nb', []):
+                lines.append('bf= %s' % label['value'])
+            for value in res.get('broader', []):
+                lines.append('ot= %s' % value)
+            for value in res.get('related', []):
+                lines.append('so= %s' % value)
+            for value in res.get('replacedBy', []):
+                lines.append('fly= %s' % value)
+            for key, value in [('de', res.get('definition', {}).get('nb')), ('tio', res.get('created')),
+                               ('tie', res.get('modified')), ('tis', res.get('deprecated'))]:
+                if value is not None:
+                    lines.append('%s= %s' % (key, value))
+            for value in res.get('editorialNote', []):
+                lines.append('no= %s' % value)
+            components = res.get('component', [])
+            sf = 'dx' if res['type'][0] == 'VirtualCompoundHeading' else 'db'
+            for n, value in enumerate(components):
+                lines.append('%s= %s' % ('da' if n == 0 else sf, value))
+            streams[filename].write(u'\n'.join(lines) + u'\n\n')
+    finally:
+        for stream in streams.values():
+            stream.close()
+
+
+def marc_datafield(tag, subfields):
+    return u'<datafield tag="%s" ind1=" " ind2=" ">%s</datafield>' % (tag, ''.join(
+        u'<subfield code="%s">%s</subfield>' % (code, escape(value)) for code, value in subfields
+    ))
+
+
+def write_marc21(resources, filename):
+    """Writes simple resources as MARC21 authority records in the layout read by `Marc21.load`."""
+    tags = {'Topic': '50', 'Geographic': '51', 'GenreForm': '55', 'Temporal': '48'}
+    with io.open(filename, 'w', encoding='utf-8') as f:
+        f.write(u'<?xml version="1.0" encoding="UTF-8"?>\n<collection>\n')
+        for res in simple_resources(resources):
+            tag = tags[res['type'][0]]
+            modified = res.get('modified', res['created'])
+            fields = [
+                u'<leader>00000%sz  a2200000n  4500</leader>' % ('d' if 'deprecated' in res else 'n'),
+                u'<controlfield tag="005">%s.0</controlfield>' % modified[:19].replace('-', '').replace('T', '').replace(':', ''),
+                u'<controlfield tag="008">%s|||anz|nbabn          |a|ana|||| d</controlfield>' % res['created'][2:10].replace('-', ''),
+                marc_datafield('035', [('a', '(NO-TrBIB)%s' % res['id'])]),
+                marc_datafield('1' + tag, [('a', res['prefLabel']['nb']['value'])]),
+            ]
+            if 'en' in res['prefLabel']:
+                fields.append(marc_datafield('4' + tag, [('a', res['prefLabel']['en']['value']), ('9', 'eng1')]))
+            for label in res.get('altLabel', {}).get('nb', []):
+                fields.append(marc_datafield('4' + tag, [('a', label['value'])]))
+            for value in res.get('broader', []):
+                fields.append(marc_datafield('550', [('a', '-'), ('w', 'g'), ('0', '(NO-TrBIB)%s' % value)]))
+            for value in res.get('related', []):
+                fields.append(marc_datafield('550', [('a', '-'), ('0', '(NO-TrBIB)%s' % value)]))
+            for value in res.get('editorialNote', []):
+                fields.append(marc_datafield('667', [('a', value)]))
+            if 'definition' in res:
+                fields.append(marc_datafield('677', [('a', res['definition']['nb'])]))
+            f.write(u'<record>%s</record>\n' % ''.join(fields))
+        f.write(u'</collection>\n')
+
+
+def write_mesh(resources, filename, topnodes_filename):
+    """Writes simple resources as MeSH descriptor records, with tree numbers following the broader links."""
+    simple = simple_resources(resources)
+    tree_numbers = {}
+    with io.open(topnodes_filename, 'w', encoding='utf-8') as f:
+        f.write(u'<DescriptorRecordSet>\n')
+        for letter in 'ABCDEFGH':
+            f.write(u'<DescriptorRecord><DescriptorUI>%s</DescriptorUI><DescriptorName><String>Topp %s[Top %s]</String>'
+                    u'</DescriptorName><TreeNumberList><TreeNumber>%s</TreeNumber></TreeNumberList></DescriptorRecord>\n'
+                    % (letter, letter, letter, letter))
+        f.write(u'</DescriptorRecordSet>\n')
+
+    with io.open(filename, 'w', encoding='utf-8') as f:
+        f.write(u'<DescriptorRecordSet>\n')
+        for n, res in enumerate(simple):
+            parent = res.get('broader', [None])[0]
+            if parent in tree_numbers:
+                tree_number = '%s.%03d' % (tree_numbers[parent], n % 1000)
+            else:
+                tree_number = '%s%02d' % ('ABCDEFGH'[n % 8], n % 100)
+            tree_numbers[res['id']] = tree_number
+            year, month, day = res['created'][:10].split('-')
+            descriptor_class = {'GenreForm': '2', 'Geographic': '4'}.get(res['type'][0], '1')
+            terms = [u'<Term ConceptPreferredTermYN="Y"><TermUI>nor%d</TermUI><String>%s</String></Term>'
+                     % (n, escape(res['prefLabel']['nb']['value']))]
+            if 'en' in res['prefLabel']:
+                terms.append(u'<Term ConceptPreferredTermYN="Y"><TermUI>T%d</TermUI><String>%s</String></Term>'
+                             % (n, escape(res['prefLabel']['en']['value'])))
+            for label in res.get('altLabel', {}).get('nb', []):
+                terms.append(u'<Term ConceptPreferredTermYN="N"><TermUI>nor%da</TermUI><String>%s</String></Term>'
+                             % (n, escape(label['value'])))
+            related = ''.join(u'<SeeRelatedDescriptor><DescriptorReferredTo><DescriptorUI>%s</DescriptorUI>'
+                              u'</DescriptorReferredTo></SeeRelatedDescriptor>' % x for x in res.get('related', []))
+            f.write(u'<DescriptorRecord DescriptorClass=%s><DescriptorUI>%s</DescriptorUI>'
+                    u'<DateCreated><Year>%s</Year><Month>%s</Month><Day>%s</Day></DateCreated>'
+                    u'<TreeNumberList><TreeNumber>%s</TreeNumber></TreeNumberList>'
+                    u'<SeeRelatedList>%s</SeeRelatedList>'
+                    u'<ConceptList><Concept PreferredConceptYN="Y"><TermList>%s</TermList></Concept></ConceptList>'
+                    u'</DescriptorRecord>\n' % (quoteattr(descriptor_class), res['id'], year, month, day,
+                                                 tree_number, related, ''.join(terms)))
+        f.write(u'</DescriptorRecordSet>\n')
+
+
+def write_bibsys(resources, filename):
+    """Writes simple resources as Bibsys 'post' records, with a 'se-id' record per alternative label."""
+    types = {'Geographic': 'G', 'Temporal': 'T'}
+    n_refs = 0
+    with io.open(filename, 'w', encoding='utf-8') as f:
+        f.write(u'<?xml version="1.0" encoding="UTF-8"?>\n<poster>\n')
+        for res in simple_resources(resources):
+            label = res['prefLabel']['nb']['value']
+            if res['type'][0] == 'GenreForm':
+                label += ' (Form)'
+            parts = [u'<term-id>%s</term-id>' % res['id'],
+                     u'<hovedemnefrase>%s</hovedemnefrase>' % escape(label),
+                     u'<dato>%s</dato>' % res.get('modified', res['created'])[:10]]
+            if res['type'][0] in types:
+                parts.append(u'<type>%s</type>' % types[res['type'][0]])
+            for value in res.get('broader', []):
+                parts.append(u'<overordnetterm-id>%s</overordnetterm-id>' % value)
+            for value in res.get('related', []):
+                parts.append(u'<se-ogsa-id>%s</se-ogsa-id>' % value)
+            if 'definition' in res:
+                parts.append(u'<definisjon>%s</definisjon>' % escape(res['definition']['nb']))
+            f.write(u'<post>%s</post>\n' % ''.join(parts))
+            for label in res.get('altLabel', {}).get('nb', []):
+                n_refs += 1
+                f.write(u'<post><term-id>SE%d</term-id><se-id>%s</se-id><hovedemnefrase>%s</hovedemnefrase>'
+                        u'<dato>2015-01-01</dato></post>\n' % (n_refs, res['id'], escape(label['value'])))
+        f.write(u'</poster>\n')
+
+
+def write_all(n, path, seed=42):
+    """
+    Writes a vocabulary of size `n` in all the input formats to `path`, unless
+    it has been written before. Returns a dict of filenames.
+    """
+    files = {
+        'roald3': os.path.join(path, 'vocabulary.json'),
+        'scheme': os.path.join(path, 'scheme.ttl'),
+        'roald2': os.path.join(path, 'roald2') + os.sep,
+        'marc21': os.path.join(path, 'authorities.marc21.xml'),
+        'mesh': os.path.join(path, 'mesh.xml'),
+        'mesh_topnodes': os.path.join(path, 'mesh-topnodes.xml'),
+        'bibsys': os.path.join(path, 'bibsys.xml'),
+    }
+    done = os.path.join(path, '.complete')
+    if os.path.exists(done):
+        return files
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    resources = generate(n, seed)
+    write_roald3(resources, files['roald3'])
+    write_scheme(files['scheme'])
+    write_roald2(resources, files['roald2'])
+    write_marc21(resources, files['marc21'])
+    write_mesh(resources, files['mesh'], files['mesh_topnodes'])
+    write_bibsys(resources, files['bibsys'])
+
+    with open(done, 'w') as f:
+        f.write('%d %d\n' % (n, seed))
+    return files
@@ -0,0 +1,237 @@
+# encoding=utf-8
+"""
+Benchmark suite timing the adapters and export paths on synthetic vocabularies.
+
+Each case runs in a fresh interpreter, so that the peak memory of one case
+doesn't affect the next. For each case and size the report contains the wall
+and CPU time of the measured operation, the peak RSS of the process, and how
+much the operation raised the peak RSS above what the setup needed.
+
+The vocabularies are made by `benchmarks.generator` and cached in the data
+directory, so only the first run for a given size pays for generating them.
+
+Usage:
+
+    python -m benchmarks.run [--sizes 10k,100k,1M] [--cases marc21.serialize,skos.prepare]
+                             [--data-dir benchmarks/data] [--output report.json]
+
+Compare two reports with `python -m benchmarks.compare`.
+"""
+from __future__ import print_function
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from . import generator
+
+
+def load_roald3(files):
+    from roald.adapters.roald3 import Roald3
+    from roald.models.vocabulary import Vocabulary
+    vocabulary = Vocabulary()
+    Roald3(vocabulary).load(files['roald3'])
+    return vocabulary
+
+
+def empty_vocabulary(files):
+    from iso639 import languages
+    from roald.models.vocabulary import Vocabulary
+    vocabulary = Vocabulary()
+    vocabulary.default_language = languages.get(alpha2='nb')
+    vocabulary.uri_format = generator.URI_FORMAT
+    return vocabulary
+
+
+def prepared_skos(files):
+    from roald.adapters.skos import Skos
+    skos = Skos(load_roald3(files), include=[files['scheme']])
+    return skos, skos.prepare()['graph']
+
+
+def roald3_load(files, vocabulary):
+    from roald.adapters.roald3 import Roald3
+    Roald3(vocabulary).load(files['roald3'])
+    return len(vocabulary.resources), os.path.getsize(files['roald3'])
+
+
+def roald3_save(files, vocabulary):
+    from roald.adapters.roald3 import Roald3
+    Roald3(vocabulary).save(files['out'])
+    return len(vocabulary.resources), os.path.getsize(files['out'])
+
+
+def roald2_load(files, vocabulary):
+    from roald.adapters.roald2 import Roald2
+    Roald2(vocabulary).load(files['roald2'])
+    return len(vocabulary.resources), None
+
+
+def marc21_load(files, vocabulary):
+    from roald.adapters.marc21 import Marc21
+    Marc21(vocabulary).load(files['marc21'])
+    return len(vocabulary.resources), os.path.getsize(files['marc21'])
+
+
+def marc21_serialize(files, vocabulary):
+    from roald.adapters.marc21 import Marc21
+    data = Marc21(vocabulary, vocabulary_code='noubomn', created_by='NoOU',
+                  include_narrower=True, include_memberships=True).serialize()
+    return len(vocabulary.resources), len(data)
+
+
+def skos_prepare(files, vocabulary):
+    from roald.adapters.skos import Skos
+    graph = Skos(vocabulary, include=[files['scheme']]).prepare()['graph']
+    return len(graph), None
+
+
+def skos_serialize(format):
+    def serialize(files, prepared):
+        skos, graph = prepared
+        return len(graph), len(skos.serialize(graph, format=format))
+    return serialize
+
+
+def mesh_load(files, vocabulary):
+    from roald.adapters.mesh import Mesh
+    Mesh(vocabulary).load(files['mesh'], files['mesh_topnodes'])
+    return len(vocabulary.resources), os.path.getsize(files['mesh'])
+
+
+def bibsys_load(files, vocabulary):
+    from roald.adapters.bibsys import Bibsys
+    Bibsys(vocabulary).load(files['bibsys'])
+    return len(vocabulary.resources), os.path.getsize(files['bibsys'])
+
+
+# name: (setup, operation). The setup is not included in the measurements.
+CASES = {
+    'roald3.load': (empty_vocabulary, roald3_load),
+    'roald3.save': (load_roald3, roald3_save),
+    'roald2.load': (empty_vocabulary, roald2_load),
+    'marc21.load': (empty_vocabulary, marc21_load),
+    'marc21.serialize': (load_roald3, marc21_serialize),
+    'skos.prepare': (load_roald3, skos_prepare),
+    'skos.serialize.turtle': (prepared_skos, skos_serialize('turtle')),
+    'skos.serialize.nt': (prepared_skos, skos_serialize('nt')),
+    'mesh.load': (empty_vocabulary, mesh_load),
+    'bibsys.load': (empty_vocabulary, bibsys_load),
+}
+
+
+def parse_size(value):
+    value = value.strip().lower()
+    for suffix, factor in [('k', 1000), ('m', 1000000)]:
+        if value.endswith(suffix):
+            return int(float(value[:-1]) * factor)
+    return int(value)
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / 1024. / 1024.  # bytes
+    return rss / 1024.  # kilobytes
+
+
+def run_case(name, files):
+    """Runs a single case in the current process and returns the measurements."""
+    setup, operation = CASES[name]
+    state = setup(files)
+    rss0 = max_rss_mb()
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    items, size = operation(files, state)
+    seconds = time.perf_counter() - t0
+    cpu_seconds = time.process_time() - cpu0
+    rss1 = max_rss_mb()
+    return {
+        'seconds': round(seconds, 4),
+        'cpu_seconds': round(cpu_seconds, 4),
+        'peak_rss_mb': round(rss1, 1),
+        'peak_rss_increase_mb': round(rss1 - rss0, 1),
+        'items': items,
+        'bytes': size,
+    }
+
+
+def run_isolated(name, files):
+    """Runs a case in a fresh interpreter."""
+    proc = subprocess.run([sys.executable, '-m', 'benchmarks.run', '--worker', name,
+                           '--files', json.dumps(files)],
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'exit %d' % proc.returncode}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], universal_newlines=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10k,100k,1M', help='comma-separated vocabulary sizes (default: 10k,100k,1M)')
+    parser.add_argument('--cases', default=','.join(sorted(CASES.keys())), help='comma-separated cases (default: all)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(__file__), 'data'))
+    parser.add_argument('--output', default='benchmark-report.json')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--files', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        logging.disable(logging.CRITICAL)
+        print(json.dumps(run_case(args.worker, json.loads(args.files))))
+        return
+
+    cases = [x.strip() for x in args.cases.split(',') if x.strip()]
+    for name in cases:
+        if name not in CASES:
+            parser.error('Unknown case: %s' % name)
+
+    report = {
+        'created': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'results': [],
+    }
+
+    for size in [parse_size(x) for x in args.sizes.split(',')]:
+        path = os.path.join(args.data_dir, 'n%d-s%d' % (size, args.seed))
+        print('Generating vocabulary with %d concepts in %s' % (size, path))
+        files = generator.write_all(size, path, args.seed)
+        files['out'] = os.path.join(path, 'out.json')
+
+        for name in cases:
+            result = run_isolated(name, files)
+            result.update({'case': name, 'size': size})
+            report['results'].append(result)
+            if 'error' in result:
+                print('  {:<24} FAILED: {}'.format(name, result['error']))
+            else:
+                print('  {:<24} {:9.2f} s  {:9.2f} s cpu  {:8.1f} MB peak  {:+8.1f} MB'.format(
+                    name, result['seconds'], result['cpu_seconds'], result['peak_rss_mb'],
+                    result['peak_rss_increase_mb']))
+
+    with io.open(args.output, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(report, indent=2, sort_keys=True))
+    print('Wrote %s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,2 @@
 from .roald import Roald
+from .changes import diff
@@ -1,6 +1,26 @@
-from .bibsys import Bibsys
-from .marc21 import Marc21
-from .roald2 import Roald2
-from .roald3 import Roald3
-from .skos import Skos
-from .mesh import Mesh
+# The adapters are imported on first use, since several of them depend on
+# packages that are slow to import (rdflib, skosify, lxml).
+import importlib
+
+__all__ = ['Bibsys', 'Marc21', 'Roald2', 'Roald3', 'Skos', 'Mesh']
+
+_modules = {
+    'Bibsys': '.bibsys',
+    'Marc21': '.marc21',
+    'Roald2': '.roald2',
+    'Roald3': '.roald3',
+    'Skos': '.skos',
+    'Mesh': '.mesh',
+}
+
+
+def __getattr__(name):
+    if name not in _modules:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module(_modules[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + __all__)
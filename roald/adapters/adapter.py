@@ -1,8 +1,3 @@
-from rdflib.graph import Graph, Literal
-from rdflib.namespace import Namespace, URIRef, OWL, RDF, DC, DCTERMS, FOAF, XSD, SKOS, RDFS
-import skosify
-
-
 class Adapter(object):
 
     def extFromFilename(self, fn):
@@ -13,6 +8,11 @@ class Adapter(object):
         return 'xml'
 
     def load_mappings(self, filename, graph=None):
+        # Imported here, since rdflib and skosify are slow to import and not needed by Marc21
+        from rdflib.graph import Graph
+        from rdflib.namespace import SKOS
+        import skosify
+
         tmp = Graph()
         if graph is None:
             graph = Graph()
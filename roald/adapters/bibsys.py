@@ -1,12 +1,11 @@
 # encoding=utf-8
-import isodate
-import xmlwitch
 import codecs
 import os
 import re
 from lxml import etree
 from ..models.resources import Concept, Collection, Label
 from ..util import AlreadyExists
+from ..instrumentation import track
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,12 +18,20 @@ class Bibsys(object):
 
     encoding = 'latin1'
     vocabulary = None
+    sets_default_language = True
 
     def __init__(self, vocabulary):
         super(Bibsys, self).__init__()
         self.vocabulary = vocabulary
 
     def load(self, filename, exclude_underemne=False):
+        n0 = len(self.vocabulary.resources)
+        self.vocabulary.resources.load(self.iter_resources(filename, exclude_underemne))
+        logger.info('Loaded %d concepts from %s', len(self.vocabulary.resources) - n0, filename)
+
+    def iter_resources(self, filename, exclude_underemne=False):
+        # Relations are resolved in separate passes over the file, so the records
+        # can't be yielded until the whole file has been read.
         language = self.vocabulary.default_language.alpha2
         self.exclude_underemne = exclude_underemne
         resources = []
@@ -33,16 +40,19 @@ class Bibsys(object):
         uf_terms = {}  # term lookup hash
         parents = {}
         if not os.path.isfile(filename):
-            return {}
+            return
 
         # First pass
-        for _, record in etree.iterparse(filename, tag='post'):
-            resource = self.process_record(record, language, parents)
-            if resource is not None:
-                resources.append(resource)
-                ids[resource['id']] = len(resources) - 1
-                terms[resource.get('prefLabel.nb').value] = len(resources) - 1
-            record.clear()
+        size = float(os.path.getsize(filename)) or 1.
+        with open(filename, 'rb') as stream:
+            records = etree.iterparse(stream, tag='post')
+            for _, record in track(records, 'bibsys', fraction=lambda: stream.tell() / size):
+                resource = self.process_record(record, language, parents)
+                if resource is not None:
+                    resources.append(resource)
+                    ids[resource['id']] = len(resources) - 1
+                    terms[resource.get('prefLabel.nb').value] = len(resources) - 1
+                record.clear()
 
         # Second pass
         for _, record in etree.iterparse(filename, tag='post'):
@@ -59,9 +69,8 @@ class Bibsys(object):
             resource = self.process_second_level_relations(record, resources, ids, terms, uf_terms)
             record.clear()
 
-
-        self.vocabulary.resources.load(resources)
-        logger.info('Loaded %d concepts from %s', len(resources), filename)
+        for res in resources:
+            yield res
 
     def get_label(self, record):
         label = record.find('hovedemnefrase').text
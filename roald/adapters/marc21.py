@@ -8,14 +8,16 @@ import os
 import logging
 import traceback
 from collections import OrderedDict
+from io import BytesIO
 from datetime import datetime
-from six import text_type
+from six import string_types, text_type
 from lxml import etree
-from rdflib import URIRef
-from rdflib.graph import Graph, Literal
-from rdflib.namespace import SKOS
 import re
 from ..models.resources import Concept, Collection, Label
+from ..instrumentation import phase, track
+from ..profiling import CountingStream
+from ..manifest import Manifest, content_hash, label_data
+from ..export import ResourceValues
 from .adapter import Adapter
 
 logger = logging.getLogger(__name__)
@@ -34,6 +36,12 @@ class Marc21(Adapter):
     MARC21 exporter
 
     URIs are included if `uri_format` is set on the Vocabulary.
+
+    If `manifest` is set to a filename, only records for resources that are new
+    or have changed since the previous export with the same manifest are written,
+    together with deletion records (leader status `d`) for resources that have
+    been removed. The manifest is saved by `commit`, which the caller must call
+    once the output is safely written, so that an interrupted export is redone.
     """
 
     vocabulary = None
@@ -43,14 +51,28 @@ class Marc21(Adapter):
     vocabulary_code = None  # Vocabulary code, 040 $f
     language = None  # Default language code for 040 $b
     include_d9 = None  # Whether to include $9 language and $9 rank codes
+    sets_default_language = True  # Roald.load sets the vocabulary language from its `language` argument
+
+    ddc_matcher = re.compile(r'http://dewey.info/class/(([1-9])--)?([0-9.]+)')
+    vocab_matcher = re.compile(r'http://data.ub.uio.no/([a-z]+)/c([0-9]+)')
 
     def __init__(self, vocabulary, created_by=None, vocabulary_code=None, language=None, include_d9=False,
                  include_memberships=False, include_narrower=False, include_uris=True, mailer=None,
-                 id_validator=None):
+                 id_validator=None, profiler=None, manifest=None):
+        """
+            - language : an `iso639` language, or a code like 'nb' (as given in a
+                         JSON pipeline). Default: the vocabulary's default language.
+            - profiler : optional `roald.profiling.RecordProfiler` to measure the
+                         time spent on, and bytes written for, each resource
+            - manifest : optional filename of a manifest of content hashes, for
+                         incremental export (see `roald.manifest.Manifest`)
+        """
         super(Marc21, self).__init__()
         self.vocabulary = vocabulary
         self.created_by = created_by
         self.vocabulary_code = vocabulary_code
+        if isinstance(language, string_types):
+            language = iso639.languages.get(alpha2=language)  # KeyError for unknown codes
         self.language = language or self.vocabulary.default_language
         self.include_d9 = include_d9
         self.include_memberships = include_memberships
@@ -58,29 +80,42 @@ class Marc21(Adapter):
         self.include_uris = include_uris
         self.mailer = mailer
         self.id_validator = id_validator
+        self.profiler = profiler
+        self.manifest = manifest
+        self.hashes = None  # the new manifest, see `has_changed` and `commit`
+        self.selection = None
+
+    supports_selection = True
+
+    def load(self, filename, vocabulary_code=None, id_validator=None, selection=None):
+        self.vocabulary.resources.load(self.iter_resources(filename, vocabulary_code, id_validator, selection))
 
-    def load(self, filename, vocabulary_code=None, id_validator=None):
+    def iter_resources(self, filename, vocabulary_code=None, id_validator=None, selection=None):
+        """
+            - selection : optional `roald.selection.Selection`. Records that are not
+                          selected are skipped before their fields are parsed.
+        """
         if vocabulary_code is not None:
             self.vocabulary_code = vocabulary_code
         if id_validator is not None:
             self.id_validator = id_validator
-        language = self.vocabulary.default_language.alpha2
-        resources = []
-        ids = {}  # index lookup hash
-        parents = {}
+        self.selection = selection
         if not os.path.isfile(filename):
-            return {}
+            return
 
         errors = []
+        size = float(os.path.getsize(filename)) or 1.
+
+        with open(filename, 'rb') as stream:
+            records = etree.iterparse(stream, tag='record')  # {http://www.loc.gov/MARC21/slim}
+            for _, record in track(records, 'marc21', fraction=lambda: stream.tell() / size):
+                resource, err = self.load_record(record)
+                record.clear()
+                if resource is not None:
+                    yield resource
+                if err is not None:
+                    errors.append(err)
 
-        for _, record in etree.iterparse(filename, tag='record'):  # {http://www.loc.gov/MARC21/slim}
-            resource, err = self.load_record(record)
-            if resource is not None:
-                resources.append(resource)
-            if err is not None:
-                errors.append(err)
-            record.clear()
-        
         if len(errors) != 0:
             hline = '\n\n-----------------------------------------------------\n\n'
             if self.mailer is not None:
@@ -90,20 +125,58 @@ class Marc21(Adapter):
                 )
             raise Exception("Errors occured during import. Mail sent.")
 
-        self.vocabulary.resources.load(resources)
-
-    def serialize(self):
-
-        if self.language is None:
-            raise RuntimeError('MARC21 serialization needs language.')
-
-        if type(self.language) != iso639.iso639._Language:
-            raise RuntimeError('MARC21 language must be an instance of iso639.iso639._Language.')
-
+    def serialize(self, stream=None):
+        """
+        Serialize the vocabulary as MARC21 XML.
+
+            - stream : optional binary file object to write the records to as they are
+                       generated. If not given, the serialized document is returned as bytes.
+        """
+        self.begin(stream)
+        self.build_indexes()
+        with phase('serialize', format='marc21') as p:
+            for resource in track(self.vocabulary.resources, 'marc21'):
+                self.write_resource(resource)
+            p.items = len(self.vocabulary.resources)
+        return self.end()
+
+    def write_resources(self, resources, sink):
+        self.begin(sink)
+        self.build_indexes()
+        with phase('write', format='marc21') as p:
+            p.items = 0
+            for resource in track(resources, 'marc21'):
+                self.write_resource(resource)
+                p.items += 1
+        self.end()
+
+    def build_indexes(self, shared=None):
+        """
+        Build the lookup tables needed by `convert_resource`.
+
+            - shared : optional dict used to share the tables between several
+                       Marc21 instances exporting the same vocabulary.
+        """
+        if shared is None:
+            shared = {}
+
+        with phase('index', format='marc21') as p:
+            key = ('marc21.narrower', self.include_narrower, self.include_memberships)
+            if key not in shared:
+                shared[key] = self.build_narrower()
+            self.narrower = shared[key]
+
+            if 'marc21.replaces' not in shared:
+                shared['marc21.replaces'] = self.build_replaces()
+            self.replaces = shared['marc21.replaces']
+            p.items = len(self.narrower) + len(self.replaces)
+
+    def build_narrower(self):
         # Make a dictionary of 'narrower' (reverse 'broader') for fast lookup
-        self.narrower = {}
+        narrower = {}
         if self.include_narrower:
-            for c in self.vocabulary.resources:
+            # From the full vocabulary, so a view gives the same records as a full export
+            for c in self.vocabulary.base.resources:
 
                 has_member_of = False
 
@@ -111,34 +184,145 @@ class Marc21(Adapter):
 
                     for x in c.get('memberOf', []):
                         has_member_of = True
-                        self.narrower[x] = self.narrower.get(x, []) + [c['id']]
+                        narrower.setdefault(x, []).append(c['id'])
 
                     for x in c.get('superOrdinate', []):
                         hasSuperOrdinates = True
-                        self.narrower[x] = self.narrower.get(x, []) + [c['id']]
+                        narrower.setdefault(x, []).append(c['id'])
 
                 if not has_member_of:
                     for x in c.get('broader', []):
-                        self.narrower[x] = self.narrower.get(x, []) + [c['id']]
-
+                        narrower.setdefault(x, []).append(c['id'])
+        return narrower
 
+    def build_replaces(self):
         # Make a dictionary of 'replaces' (inverse 'replacedBy') for fast lookup
-        self.replaces = {}
-        for c in self.vocabulary.resources:
+        replaces = {}
+        for c in self.vocabulary.base.resources:
             for x in c.get('replacedBy', []):
-                self.replaces[x] = self.replaces.get(x, []) + [c['id']]
+                replaces.setdefault(x, []).append(c['id'])
+        return replaces
+
+    def begin(self, stream=None):
+        """
+        Start a new MARC21 collection. Records are added with `write_resource`,
+        and the collection is closed with `end`. `build_indexes` must be called
+        before the first record is written.
+        """
+        if self.language is None:
+            raise RuntimeError('MARC21 serialization needs language.')
 
-        builder = xmlwitch.Builder(version='1.0', encoding='utf-8')
+        if type(self.language) != iso639.iso639._Language:
+            raise RuntimeError('MARC21 language must be an instance of iso639.iso639._Language.')
 
         self.nmappings = 0
-        with builder.collection(xmlns='info:lc/xmlns/marcxchange-v1'):
-            for resource in self.vocabulary.resources:
-                self.convert_resource(builder, resource, self.vocabulary.resources)
+        self.stream = stream
+        if self.profiler is not None:
+            stream = self.counter = CountingStream(stream or BytesIO())
+        self.builder = xmlwitch.Builder(version='1.0', encoding='utf-8', stream=stream)
+        self.collection = self.builder.collection(xmlns='info:lc/xmlns/marcxchange-v1')
+        self.collection.__enter__()
+
+        if self.manifest is not None:
+            self.previous_hashes = Manifest.load(self.manifest, format='marc21')
+            self.hashes = Manifest(format='marc21')
+            self.n_unchanged = 0
+
+    def write_resource(self, resource, values=None):
+        """
+            - values : the `roald.export.ResourceValues` for the resource, if
+                       shared with other writers
+        """
+        if self.manifest is not None and not self.has_changed(resource):
+            return
+        if self.profiler is None:
+            self.convert_resource(self.builder, resource, self.vocabulary.resources, values)
+            return
+        token = self.profiler.start()
+        n0 = self.counter.bytes_written
+        self.convert_resource(self.builder, resource, self.vocabulary.resources, values)
+        self.profiler.stop(token, resource, self.counter.bytes_written - n0)
+
+    def end(self):
+        if self.manifest is not None:
+            deleted = [x for x in self.previous_hashes if x not in self.hashes]
+            for resource_id in deleted:
+                self.convert_deletion(self.builder, resource_id)
+            logger.info(' - Skipped %d unchanged resources, wrote %d deletion records',
+                        self.n_unchanged, len(deleted))
+
+        self.collection.__exit__(None, None, None)
 
         logger.info(' - Included %d DDC mappings', self.nmappings)
-
-        s = text_type(builder)
-        return s.encode('utf-8')
+        if self.profiler is not None:
+            logger.info('Per-record costs:\n%s', self.profiler.report())
+
+        builder = self.builder
+        self.builder = None
+        self.collection = None
+        if self.stream is not None:
+            return None
+        return text_type(builder).encode('utf-8')
+
+    def commit(self):
+        """
+        Saves the manifest of an incremental export. Call when the output from
+        `end` (or `serialize`) has been written.
+        """
+        if self.manifest is not None and self.hashes is not None:
+            self.hashes.save(self.manifest)
+            self.hashes = None
+
+    def has_changed(self, resource):
+        """
+        Record the content hash of the resource in the new manifest, and
+        return whether it differs from the hash in the previous manifest.
+        """
+        if not self.exported_types(resource):
+            return False
+        value = self.record_hash(resource)
+        self.hashes[resource['id']] = value
+        if self.previous_hashes.get(resource['id']) == value:
+            self.n_unchanged += 1
+            return False
+        return True
+
+    def exported_types(self, resource):
+        """The types of `resource` that get a record, see `convert_resource`."""
+        return [x for x in resource.get('type', [])
+                if x != 'VirtualCompoundHeading' and (x != 'Category' or self.include_memberships)]
+
+    def record_hash(self, resource):
+        """
+        Returns a hash of everything that affects the records for a resource:
+        the resource itself, the types and labels of the resources it refers to
+        (including narrower resources) and the export options.
+        """
+        resources = self.vocabulary.resources
+        related = {}
+        for key in ['component', 'broader', 'memberOf', 'superOrdinate', 'related', 'plusUseTerm']:
+            for value in resource.get(key, []):
+                related[value] = label_data(resources.get(id=value))
+        for value in self.narrower.get(resource['id'], []):
+            related[value] = label_data(resources.get(id=value))
+
+        return content_hash([
+            resource,
+            related,
+            self.vocabulary.uri_format,
+            self.language.alpha2,
+            [self.created_by, self.transcribed_by, self.modified_by, self.vocabulary_code, self.include_d9,
+             self.include_memberships, self.include_narrower, self.include_uris],
+        ])
+
+    def convert_deletion(self, builder, resource_id):
+        """Add a deletion record for a resource that no longer exists."""
+        with builder.record(type='Authority'):
+            builder.leader('00000dz  a2200000n  4500')
+            builder.controlfield(self.global_cn(resource_id, False), tag='001')
+            if self.created_by is not None:
+                builder.controlfield(self.created_by, tag='003')
+            builder.controlfield(datetime.utcnow().strftime('%Y%m%d%H%M%S.0'), tag='005')
 
     def global_cn(self, value, include_prefix=True):
         if value.startswith('http://data.ub.uio.no/entity/'):
@@ -190,18 +374,9 @@ class Marc21(Adapter):
         }
         return '{:d}'.format(base + vals[res_type])
 
-    def convert_resource(self, builder, resource, resources):
-
-        created = None
-        modified = None
-
-        if resource.get('created'):
-            created = isodate.parse_datetime(resource.get('created'))
-
-        if resource.get('deprecated'):
-            modified = isodate.parse_datetime(resource.get('deprecated'))
-        elif resource.get('modified'):
-            modified = isodate.parse_datetime(resource.get('modified'))
+    def convert_resource(self, builder, resource, resources, values=None):
+        values = values or ResourceValues(self.vocabulary, resource)
+        created, modified = values.dates
 
         if created is None and modified is None:
             # Mrtermer har ingen datoer(!)
@@ -214,12 +389,10 @@ class Marc21(Adapter):
         elif modified is None:
             modified = created
 
-        if self.vocabulary.uri_format is not None:
-            uri = self.vocabulary.uri(resource['id'])
-        else:
-            uri = None
-        ddc_matcher = re.compile(r'http://dewey.info/class/(([1-9])--)?([0-9.]+)')
-        vocab_matcher = re.compile(r'http://data.ub.uio.no/([a-z]+)/c([0-9]+)')
+        uri = values.uri
+        profiler = self.profiler
+        ddc_matcher = self.ddc_matcher
+        vocab_matcher = self.vocab_matcher
         mappingRelationsRepr = {
             'exactMatch': '=EQ',
             'closeMatch': '~EQ',
@@ -342,6 +515,8 @@ class Marc21(Adapter):
                 omappings = []
                 umappings = []
                 for mapping_type, target_uris in resource.get('mappings', {}).items():
+                    if profiler is not None:
+                        profiler.count('mapping.' + mapping_type, len(target_uris))
                     for target_uri in target_uris:
                         m = ddc_matcher.match(target_uri)
                         m2 = vocab_matcher.match(target_uri)
@@ -383,11 +558,15 @@ class Marc21(Adapter):
 
                 # 148/150/151/155 Authorized heading
                 if resourceType == 'CompoundHeading':
+                    compound = resources.compound_headings.get(resource['id'])
+                    if profiler is not None:
+                        profiler.count('compound_heading')
+                        profiler.count('compound_heading.components', len(compound.components))
 
-                    # Get first component to get a list of languages
-                    first_component = resources.get(id=resource.get('component')[0])
+                    first_component = compound.components[0]
 
-                    for lang, term in first_component.prefLabel.items():
+                    # Only the languages *all* components have labels in
+                    for lang, subfields in compound.subfields.items():
 
                         # Determine tag number based on the first component:
                         if lang == self.language.alpha2:
@@ -395,32 +574,18 @@ class Marc21(Adapter):
                         else:
                             tag = self.tag_from_type(400, first_component.type[0])
 
-                        # Ignore this language if not *all* components have labels in it
-                        vals = [resources.get(id=value).prefLabel.get(lang) is None for value in resource.get('component')]
-                        if True in vals:
-                            continue
-
-                        sf_a = first_component.prefLabel[lang]
-
                         out_term = [
                             tag,
-                            ['a', sf_a.value],
+                            list(subfields[0]),
                         ]
 
-                        for value in resource.get('component')[1:]:
-                            component = resources.get(id=value)
-
-                            # Determine subfield code from type:
-                            sf = {
-                                'Topic': 'x',
-                                'Temporal': 'y',
-                                'Geographic': 'z',
-                                'GenreForm': 'v',
-                            }[component['type'][0]]
+                        for n, (sf, value) in enumerate(subfields[1:]):
+                            # Subfield code from the component type
+                            if sf is None:
+                                raise KeyError(compound.components[n + 1]['type'][0])
 
                             # OBS! 150 har også $b.. Men når brukes egentlig den??
-                            sf_term = component.prefLabel[lang]
-                            out_term.append([sf, sf_term.value])
+                            out_term.append([sf, value])
 
                             if self.include_d9 == 'complex':
                                 out_term.append(['9', 'rank=preferred'])
@@ -447,6 +612,8 @@ class Marc21(Adapter):
                             out_term.append(['9', 'rank=preferred'])
                             out_term.append(['9', 'language=' + lang])
                         add_term(out_term)
+                        if profiler is not None and (term.hasAcronym or term.acronymFor):
+                            profiler.count('acronym')
 
                         # Atm. acronyms only for primary language
                         # if lang == self.language.alpha2:
@@ -469,6 +636,8 @@ class Marc21(Adapter):
                                 out_term.append(['9', 'rank=alternative'])
                                 out_term.append(['9', 'language=' + lang])
                             add_term(out_term)
+                            if profiler is not None and (term.hasAcronym or term.acronymFor):
+                                profiler.count('acronym')
 
                             # Atm. acronyms only for primary language
                             # if lang == self.language.alpha2:
@@ -569,6 +738,25 @@ class Marc21(Adapter):
             raise Exception('Encountered record with empty/invalid ID in %s' % field)
         return value
 
+    @staticmethod
+    def local_id(value):
+        """The ID in a '(NO-TrBIB)' control number from 035 $a, or None for other control numbers."""
+        value = (value or '').strip()
+        if '(NO-TrBIB)' not in value:
+            return None
+        return value.replace('(NO-TrBIB)', '')
+
+    @staticmethod
+    def fields_from_tag(tag):
+        """The Roald fields a MARC21 authority field can be loaded into."""
+        if tag.startswith('1'):
+            return ['prefLabel']
+        if tag.startswith('4'):
+            return ['prefLabel', 'altLabel']
+        if tag.startswith('5'):
+            return ['broader', 'related']
+        return [{'035': 'id', '260': 'plusUseTerm', '667': 'editorialNote', '677': 'definition'}.get(tag, tag)]
+
     def load_record(self, rec):
         typemap = {
             '148': 'Temporal',
@@ -596,6 +784,7 @@ class Marc21(Adapter):
                 raise Exception('ERR: No 005 field')
             f005 = f005_field[0].text
             modified = datetime.strptime(f005[:14], '%Y%m%d%H%M%S')
+            modified_str = modified.strftime('%Y-%m-%dT%H:%M:%S')
 
             f008_field = rec.xpath('./controlfield[@tag="008"]', namespaces={'marc': 'http://www.loc.gov/MARC21/slim'})
             if len(f008_field) == 0:
@@ -613,12 +802,24 @@ class Marc21(Adapter):
 
             # ---
 
+            selection = self.selection
+            if selection is not None:
+                local_ids = [
+                    self.local_id(x.text)
+                    for x in rec.xpath('./datafield[@tag="035"]/subfield[@code="a"]')
+                    if self.local_id(x.text) is not None
+                ]
+                if not (selection.accepts_types([concept_type])
+                        and selection.accepts_modified(modified_str)
+                        and selection.accepts_id(local_ids[0] if local_ids else None)):
+                    return None, None
+
             if concept_type == 'Collection':
                 obj = Collection()
             else:
                 obj = Concept(concept_type)
             obj.set('created', created.strftime('%Y-%m-%dT%H:%M:%S'))
-            obj.set('modified', modified.strftime('%Y-%m-%dT%H:%M:%S'))
+            obj.set('modified', modified_str)
 
             ldr = rec.find('leader').text.strip()  # {http://www.loc.gov/MARC21/slim}
             if ldr[5] != 'n':
@@ -626,12 +827,14 @@ class Marc21(Adapter):
 
             for field in rec.findall('datafield'):  # {http://www.loc.gov/MARC21/slim}
                 tag = field.get('tag')
+                if selection is not None and not any(selection.wants(x) for x in self.fields_from_tag(tag)):
+                    continue
                 sf = OrderedDict(
                     (subfield.get('code'), subfield.text.strip())
                     for subfield in field.findall('subfield')  # {http://www.loc.gov/MARC21/slim}
                 )
-                if tag == '035' and '(NO-TrBIB)' in sf['a']:
-                    obj.set('id', self.validate_identifier(sf['a'].replace('(NO-TrBIB)', ''), '035$a'))
+                if tag == '035' and self.local_id(sf.get('a')) is not None:
+                    obj.set('id', self.validate_identifier(self.local_id(sf['a']), '035$a'))
                 elif tag.startswith('1'):
                     obj.set('prefLabel.nb', Label(sf['a']))
                 elif tag == '260':
@@ -663,4 +866,6 @@ class Marc21(Adapter):
         # TODO
         # Handle facet memberships, superOrdinate etc.
 
+        if selection is not None:
+            selection.project(obj)
         return obj, None
@@ -1,11 +1,10 @@
 # encoding=utf-8
-import isodate
-import xmlwitch
 import codecs
 import os
 import re
 from lxml import etree
 from ..models.resources import Concept, Collection, Label
+from ..instrumentation import track
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,17 +15,24 @@ class Mesh(object):
     Class for importing legacy data from Mesh
     """
 
+    sets_default_language = True
+
     def __init__(self, vocabulary):
         super(Mesh, self).__init__()
         self.vocabulary = vocabulary
 
     def load(self, filename, topnodes):
+        self.vocabulary.resources.load(self.iter_resources(filename, topnodes))
+
+    def iter_resources(self, filename, topnodes):
+        # Broader relations are derived from the tree numbers of all records,
+        # so the records can't be yielded until the whole file has been read.
         language = self.vocabulary.default_language.alpha2
         resources = []
         ids = {}  # index lookup hash
         parents = {}
         if not os.path.isfile(filename):
-            return {}
+            return
 
         # Topnodes
         for _, record in etree.iterparse(topnodes, tag='DescriptorRecord'):
@@ -36,11 +42,14 @@ class Mesh(object):
             record.clear()
 
         # First pass
-        for _, record in etree.iterparse(filename, tag='DescriptorRecord'):
-            resource = self.process_record(record, language, parents)
-            if resource is not None:
-                resources.append(resource)
-            record.clear()
+        size = float(os.path.getsize(filename)) or 1.
+        with open(filename, 'rb') as stream:
+            records = etree.iterparse(stream, tag='DescriptorRecord')
+            for _, record in track(records, 'mesh', fraction=lambda: stream.tell() / size):
+                resource = self.process_record(record, language, parents)
+                if resource is not None:
+                    resources.append(resource)
+                record.clear()
 
         # Second pass
         for res in resources:
@@ -54,8 +63,8 @@ class Mesh(object):
                 if parent_notation in parents:
                     res.add('broader', parents[parent_notation])
 
-
-        self.vocabulary.resources.load(resources)
+        for res in resources:
+            yield res
 
     def process_record(self, record, language_code, parents):
 
@@ -0,0 +1,140 @@
+# encoding=utf-8
+"""
+Registry of the formats that Roald can read and write.
+
+Adapters are constructed with a Vocabulary object, and implement one or
+both sides of the adapter protocol:
+
+Readers
+
+    - load(source, **kwargs) : load resources from `source` into the vocabulary.
+    - iter_resources(source, **kwargs) : (optional) generator yielding the
+      resources from `source` one by one, as `Resource` objects or as dicts
+      in the Roald3 format, without adding them to the vocabulary.
+
+Writers
+
+    - write_resources(resources, sink, **kwargs) : write an iterable of
+      resources to `sink`, a binary file object. Relations are resolved
+      against the vocabulary, so `resources` can be a subset of it.
+
+Since `Resources.load` accepts any iterable, readers and writers can be
+chained as generator pipelines without intermediate lists:
+
+>>> reader = formats.reader('marc21')(vocabulary)
+>>> vocabulary.resources.load(reader.iter_resources('authorities.xml'))
+
+The built-in formats are imported lazily on first use. Other packages can add
+formats through the `roald.formats` entry point group, for example in setup.py:
+
+    entry_points={
+        'roald.formats': ['myformat = mypackage.adapter:MyFormat'],
+    }
+"""
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = 'roald.formats'
+
+
+class FormatRegistry(object):
+    """
+    Maps format names to adapter classes. Adapters can be registered as classes
+    or as 'module:Class' strings, which are imported the first time they are used.
+    """
+
+    builtin = {
+        'roald3': 'roald.adapters.roald3:Roald3',
+        'roald3-jsonl': 'roald.adapters.roald3:Roald3Jsonl',
+        'roald3-sharded': 'roald.adapters.roald3:Roald3Sharded',
+        'roald2': 'roald.adapters.roald2:Roald2',
+        'bibsys': 'roald.adapters.bibsys:Bibsys',
+        'mesh': 'roald.adapters.mesh:Mesh',
+        'marc21': 'roald.adapters.marc21:Marc21',
+        'skos': 'roald.adapters.skos:Skos',
+        'rdfskos': 'roald.adapters.skos:Skos',
+    }
+
+    def __init__(self, entry_point_group=ENTRY_POINT_GROUP):
+        super(FormatRegistry, self).__init__()
+        self.entry_point_group = entry_point_group
+        self._adapters = dict(self.builtin)
+        self._entry_points_loaded = entry_point_group is None
+
+    def register(self, name, adapter):
+        """
+            - name : format name, example: 'roald3'
+            - adapter : adapter class, or a 'module:Class' string to import lazily
+        """
+        self._adapters[name] = adapter
+
+    def unregister(self, name):
+        """Removes a format added with `register`, if it is registered."""
+        self._adapters.pop(name, None)
+
+    def names(self):
+        self.load_entry_points()
+        return sorted(self._adapters.keys())
+
+    def get(self, name):
+        if name not in self._adapters:
+            self.load_entry_points()
+        if name not in self._adapters:
+            raise ValueError('Unknown format')
+        adapter = self._adapters[name]
+        if not isinstance(adapter, type):
+            adapter = self.import_adapter(adapter)
+            self._adapters[name] = adapter
+        return adapter
+
+    def reader(self, name):
+        adapter = self.get(name)
+        if not hasattr(adapter, 'load'):
+            raise ValueError('The format {} cannot be read'.format(name))
+        return adapter
+
+    def writer(self, name):
+        adapter = self.get(name)
+        if not hasattr(adapter, 'write_resources'):
+            raise ValueError('The format {} cannot be written'.format(name))
+        return adapter
+
+    @staticmethod
+    def import_adapter(spec):
+        module_name, class_name = spec.split(':')
+        return getattr(importlib.import_module(module_name), class_name)
+
+    def load_entry_points(self):
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+        for entry_point in iter_entry_points(self.entry_point_group):
+            if entry_point.name in self._adapters:
+                logger.warning('Format %s from entry point %s is already registered, ignoring it',
+                               entry_point.name, entry_point.value)
+                continue
+            self._adapters[entry_point.name] = entry_point.value
+
+
+def iter_entry_points(group):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python < 3.8
+        import pkg_resources
+        for entry_point in pkg_resources.iter_entry_points(group):
+            entry_point.value = '{}:{}'.format(entry_point.module_name, '.'.join(entry_point.attrs))
+            yield entry_point
+        return
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=group)
+    else:  # Python < 3.10
+        eps = eps.get(group, [])
+    for entry_point in eps:
+        yield entry_point
+
+
+formats = FormatRegistry()
@@ -1,7 +1,5 @@
 # encoding=utf-8
 from __future__ import print_function
-import isodate
-import xmlwitch
 import codecs
 import os
 import re
@@ -17,13 +15,25 @@ class Roald2(object):
     Class for importing legacy data from Roald 2
     """
 
+    sets_default_language = True
+    supports_selection = True
+
     elementSymbols = ['Ag', 'Al', 'Am', 'Ar', 'As', 'At', 'Au', 'B', 'Ba', 'Be', 'Bh', 'Bi', 'Bk', 'Br', 'C', 'Ca', 'Cd', 'Ce', 'Cf', 'Cl', 'Cm', 'Cn', 'Co', 'Cr', 'Cs', 'Cu', 'Db', 'Ds', 'Dy', 'Er', 'Es', 'Eu', 'F', 'Fe', 'Fl', 'Fm', 'Fr', 'Ga', 'Gd', 'Ge', 'H', 'He', 'Hf', 'Hg', 'Ho', 'Hs', 'I', 'In', 'Ir', 'K', 'Kr', 'La', 'Li', 'Lr', 'Lu', 'Lv', 'Md', 'Mg', 'Mn', 'Mo', 'Mt', 'N', 'Na', 'Nb', 'Nd', 'Ne', 'Ni', 'No', 'Np', 'O', 'Os', 'P', 'Pa', 'Pb', 'Pd', 'Pm', 'Po', 'Pr', 'Pt', 'Pu', 'Ra', 'Rb', 'Re', 'Rf', 'Rg', 'Rh', 'Rn', 'Ru', 'S', 'Sb', 'Sc', 'Se', 'Sg', 'Si', 'Sm', 'Sn', 'Sr', 'Ta', 'Tb', 'Tc', 'Te', 'Th', 'Ti', 'Tl', 'Tm', 'U', 'Uuo', 'Uup', 'Uus', 'Uut', 'V', 'W', 'Xe', 'Y', 'Yb', 'Zn', 'Zr']
 
     def __init__(self, vocabulary):
         super(Roald2, self).__init__()
         self.vocabulary = vocabulary
 
-    def load(self, path='./', language_code=None):
+    def load(self, path='./', language_code=None, selection=None):
+        n0 = len(self.vocabulary.resources)
+        self.vocabulary.resources.load(self.iter_resources(path, language_code, selection))
+        logger.info('Loaded %d concepts from %s', len(self.vocabulary.resources) - n0, path)
+
+    def iter_resources(self, path='./', language_code=None, selection=None):
+        """
+            - selection : optional `roald.selection.Selection`. Files holding
+                          only types that are not selected are not read.
+        """
 
         if language_code is None:
             language_code = self.vocabulary.default_language.alpha2
@@ -36,27 +46,33 @@ class Roald2(object):
             'idstrenger.txt': 'CompoundHeading',
         }
 
-        resources = []
+        n_files = 0
+        n_resources = 0
         for f, t in files.items():
-            resources += self.read_file(path + f, t, language_code)
-
-        if len(resources) == 0:
+            # Compound headings may become 'VirtualCompoundHeading' while read
+            file_types = [t, 'VirtualCompoundHeading'] if t == 'CompoundHeading' else [t]
+            if selection is not None and not selection.accepts_types(file_types):
+                continue
+            n_files += 1
+            for concept in self.read_file(path + f, t, language_code):
+                n_resources += 1
+                if selection is None:
+                    yield concept
+                elif selection.accepts(concept):
+                    yield selection.project(concept)
+
+        if n_files != 0 and n_resources == 0:
             raise RuntimeError('Found no resources in {}'.format(path))
 
-        self.vocabulary.resources.load(resources)
-        logger.info('Loaded %d concepts from %s', len(resources), path)
-
     def read_file(self, filename, conceptType, language_code):
         print(filename)
-        concepts = []
         if not os.path.isfile(filename):
-            return []
-        f = codecs.open(filename, 'r', 'utf-8')
-        for concept in self.read_concept(f.read(), conceptType, language_code):
+            return
+        with codecs.open(filename, 'r', 'utf-8') as f:
+            data = f.read()
+        for concept in self.read_concept(data, conceptType, language_code):
             if not concept.blank:
-                concepts.append(concept)
-        f.close()
-        return concepts
+                yield concept
 
 
     def add_acronyms_and_components(self, concept, acronyms, language_code, components):
@@ -1,11 +1,22 @@
+import hashlib
+import io
 import json
+import logging
+import os
 import re
-import codecs
-from iso639 import languages
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from ..instrumentation import phase, track
+from ..models.journal import Journal, file_digest
+
+logger = logging.getLogger(__name__)
 
 
 class Roald3(object):
 
+    format_name = 'roald3'
+    supports_selection = True
+
     def __init__(self, vocabulary):
         super(Roald3, self).__init__()
         self.vocabulary = vocabulary
@@ -14,30 +25,125 @@ class Roald3(object):
         # Normalize to unix line endings
         return txt.replace('\r\n','\n').replace('\r','\n')
 
-    def load(self, filename):
-        data = json.load(codecs.open(filename, 'r', 'utf-8'))
+    def load(self, filename, journal=False, selection=None, **kwargs):
+        """
+        Loads a Roald3 file, and replays the changes from its journal, if any.
+
+            - journal : if True, changes made from now on are recorded in the
+                        journal, and `save` to the same file only appends them
+                        (see `roald.models.journal`)
+            - selection : optional `roald.selection.Selection`. Resources that are
+                          not selected are skipped before Resource objects are made.
+        """
+        if journal and selection is not None:
+            raise ValueError('A journal cannot be kept for a partially loaded vocabulary')
+        resources = self.vocabulary.resources
+        resources.load(self.iter_resources(filename, selection=selection, **kwargs))
+        Journal.replay(filename, self.snapshot_digest, resources, selection)
+        if journal:
+            resources.attach_journal(Journal(filename, self.snapshot_digest, self.format_name))
 
+    def read_header(self, data):
         if 'uri_format' in data:
             self.vocabulary.uri_format = data['uri_format']
 
         if 'default_language' in data:
+            from iso639 import languages
             self.vocabulary.default_language = languages.get(alpha2=data['default_language'])
 
-        if 'resources' in data:
-            self.vocabulary.resources.load(data['resources'])
+    def iter_resources(self, filename, selection=None):
+        """
+        Yields the resources from a Roald3 file as dicts. The vocabulary's
+        `uri_format` and `default_language` are set from the file header.
+        """
+        with open(filename, 'rb') as stream:
+            raw = stream.read()
+        self.snapshot_digest = hashlib.sha1(raw).hexdigest()
+        data = json.loads(raw.decode('utf-8'))
+        del raw
+        self.read_header(data)
+
+        for resource in track(data.get('resources', []), 'roald3'):
+            if selection is None:
+                yield resource
+            elif selection.accepts(resource):
+                yield selection.project(resource)
 
     def save(self, filename):
+        """
+        Saves the vocabulary. If it was loaded from the same file with a journal,
+        only the changes made since the last save are appended to the journal.
+        """
+        journal = self.vocabulary.resources.journal
+        if self.is_journal_for(journal, filename) and journal.format == self.format_name:
+            logger.info('Appended %d changes to %s', journal.flush(), journal.filename)
+            return
+        self.write_snapshot(filename)
+
+    def compact(self):
+        """Folds the journal into a new snapshot, and removes the journal."""
+        journal = self.vocabulary.resources.journal
+        if journal is None:
+            raise RuntimeError('compact: The vocabulary was not loaded with a journal')
+        self.write_snapshot(journal.snapshot)
+
+    def write_snapshot(self, filename):
+        # Write to a temporary file first, so the snapshot and journal are never out of sync
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as stream:
+            self.write_resources(self.vocabulary.resources, stream)
+        os.replace(tmp, filename)
+
+        journal = self.vocabulary.resources.journal
+        if self.is_journal_for(journal, filename):
+            journal.format = self.format_name
+            journal.compacted(file_digest(filename))
+        elif os.path.isfile(filename + '.journal'):
+            # The journal belonged to the snapshot we just replaced
+            os.remove(filename + '.journal')
+
+    @staticmethod
+    def is_journal_for(journal, filename):
+        return journal is not None and journal.snapshot == os.path.abspath(os.path.expanduser(filename))
+
+    def write_resources(self, resources, sink):
+        with phase('write', format=self.format_name) as p:
+            self.begin(sink)
+            for resource in track(resources, self.format_name):
+                self.write_resource(resource)
+            self.end()
+            p.items = self.n_written
 
+    def begin(self, stream):
+        """
+        Start writing a Roald3 document to a binary stream. Resources are added
+        one by one with `write_resource`, and the document is closed with `end`.
+        The output is the same as `json.dumps` of the whole document would give.
+        """
         if self.vocabulary.default_language is None:
             raise RuntimeError('vocabulary.save: No default language code set.')
 
-        data = {
-            'default_language': self.vocabulary.default_language.alpha2,
-            'uri_format': self.vocabulary.uri_format,
-            'resources': self.vocabulary.resources.serialize()
-        }
+        self.stream = stream
+        self.n_written = 0
+        self.write_chunk('{\n  %s: %s,\n  "resources": [' % (
+            json.dumps('default_language'),
+            json.dumps(self.vocabulary.default_language.alpha2, ensure_ascii=False)
+        ))
+
+    def write_resource(self, resource, values=None):
+        jsondump = json.dumps(resource.serialize(), indent=2, sort_keys=True, ensure_ascii=False)
+        jsondump = jsondump.replace('\n', '\n    ')
+        self.write_chunk('%s\n    %s' % (',' if self.n_written else '', jsondump))
+        self.n_written += 1
 
-        jsondump = json.dumps(data, indent=2, sort_keys=True, ensure_ascii=False)
+    def end(self):
+        self.write_chunk('%s],\n  "uri_format": %s\n}' % (
+            '\n  ' if self.n_written else '',
+            json.dumps(self.vocabulary.uri_format, ensure_ascii=False)
+        ))
+        self.stream = None
+
+    def write_chunk(self, jsondump):
 
         # Remove trailling spaces (https://bugs.python.org/issue16333)
         jsondump = re.sub('\s+$', '', jsondump, flags=re.MULTILINE)
@@ -45,5 +151,305 @@ class Roald3(object):
         # Normalize to unix line endings
         jsondump = self.normalize_line_endings(jsondump)
 
-        with open(filename, 'wb') as stream:
-            stream.write(jsondump.encode('utf-8'))
+        self.stream.write(jsondump.encode('utf-8'))
+
+
+def _parse_range(args):
+    filename, start, end, selection = args
+    return list(Roald3Jsonl.iter_range(filename, start, end, selection))
+
+
+class Roald3Jsonl(Roald3):
+    """
+    JSON Lines variant of the Roald3 format ('roald3-jsonl'). The first line
+    is a header with `default_language` and `uri_format`, followed by one
+    resource per line, sorted by ID:
+
+        {"default_language": "nb", "uri_format": "http://data.ub.uio.no/realfagstermer/c{id}"}
+        {"id": "REAL012789", "prefLabel": {"nb": {"value": "Fornybar energi"}}, "type": ["Topic"]}
+        {"id": "REAL013995", "prefLabel": {"nb": {"value": "Livssyklusanalyse"}}, "type": ["Topic"]}
+
+    The file can be read as a stream, or split at line boundaries (`split`)
+    and parsed by several processes.
+    """
+
+    format_name = 'roald3-jsonl'
+
+    def iter_resources(self, filename, jobs=1, selection=None):
+        """
+        Yields the resources from a roald3-jsonl file as dicts.
+
+            - jobs : number of processes to parse the file with
+            - selection : optional `roald.selection.Selection`, applied in
+                          the worker processes when parsing in parallel
+        """
+        size = os.path.getsize(filename)
+        with open(filename, 'rb') as stream:
+            header = stream.readline()
+            self.read_header(json.loads(header.decode('utf-8')))
+            if jobs > 1:
+                self.snapshot_digest = file_digest(filename)
+            else:
+                digest = hashlib.sha1(header)
+                for line in track(stream, self.format_name, fraction=lambda: stream.tell() / size):
+                    digest.update(line)
+                    resource = self.parse_line(line, selection)
+                    if resource is not None:
+                        yield resource
+                self.snapshot_digest = digest.hexdigest()
+                return
+
+        ranges = [(filename, start, end, selection) for start, end in self.split(filename, jobs * 4)]
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for chunk in track(executor.map(_parse_range, ranges), self.format_name, total=len(ranges)):
+                for resource in chunk:
+                    yield resource
+
+    @staticmethod
+    def split(filename, n):
+        """
+        Returns up to `n` (start, end) byte ranges of about the same size,
+        covering the resource lines of a roald3-jsonl file. The ranges start
+        and end at line boundaries.
+        """
+        size = os.path.getsize(filename)
+        with open(filename, 'rb') as stream:
+            stream.readline()
+            first = stream.tell()
+            bounds = [first]
+            for i in range(1, n):
+                pos = first + (size - first) * i // n
+                if pos <= bounds[-1]:
+                    continue
+                stream.seek(pos - 1)
+                stream.readline()  # move to the start of the next line
+                if bounds[-1] < stream.tell() < size:
+                    bounds.append(stream.tell())
+        bounds.append(size)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    @classmethod
+    def iter_range(cls, filename, start, end, selection=None):
+        """Yields the resources from a byte range returned by `split`."""
+        with open(filename, 'rb') as stream:
+            stream.seek(start)
+            for line in stream.read(end - start).splitlines():
+                resource = cls.parse_line(line, selection)
+                if resource is not None:
+                    yield resource
+
+    @staticmethod
+    def parse_line(line, selection=None):
+        if not line.strip():
+            return None
+        resource = json.loads(line.decode('utf-8'))
+        if selection is None:
+            return resource
+        if selection.accepts(resource):
+            return selection.project(resource)
+
+    def write_resources(self, resources, sink):
+        resources = sorted(resources, key=lambda x: x['id'])
+        with phase('write', format=self.format_name) as p:
+            self.begin(sink, [x['id'] for x in resources])
+            for resource in track(resources, self.format_name):
+                self.write_resource(resource)
+            self.end()
+            p.items = self.n_written
+
+    def begin(self, stream, ids=None):
+        """
+        Start writing a roald3-jsonl document to a binary stream. The lines are
+        sorted by ID: a resource passed to `write_resource` is written as soon as
+        those with lower IDs have been, and is held back until then. When the
+        resources come in ID order, as after loading a Roald3 file, nothing is
+        held back; in the worst case, all of them are, until `end`.
+
+            - ids : the IDs of the resources that will be written (default: those
+                    of the vocabulary)
+        """
+        if self.vocabulary.default_language is None:
+            raise RuntimeError('vocabulary.save: No default language code set.')
+
+        self.stream = stream
+        self.n_written = 0
+        self.order = sorted(x['id'] for x in self.vocabulary.resources) if ids is None else sorted(ids)
+        self.position = 0  # in `order`, of the next line to write
+        self.waiting = {}  # ID to line, for resources that came before their turn
+        self.write_line({
+            'default_language': self.vocabulary.default_language.alpha2,
+            'uri_format': self.vocabulary.uri_format,
+        })
+
+    def write_resource(self, resource, values=None):
+        self.waiting[resource['id']] = json.dumps(resource.serialize(), sort_keys=True, ensure_ascii=False)
+        self.n_written += 1
+        order = self.order
+        while self.position < len(order) and order[self.position] in self.waiting:
+            self.stream.write((self.waiting.pop(order[self.position]) + '\n').encode('utf-8'))
+            self.position += 1
+
+    def end(self):
+        # Left if resources expected were not written, or others were
+        for resource_id in sorted(self.waiting):
+            self.stream.write((self.waiting[resource_id] + '\n').encode('utf-8'))
+        self.order = self.waiting = None
+        self.stream = None
+
+    def write_line(self, data):
+        self.stream.write((json.dumps(data, sort_keys=True, ensure_ascii=False) + '\n').encode('utf-8'))
+
+
+class Roald3Sharded(object):
+    """
+    Sharded directory layout ('roald3-sharded'). The resources are split into
+    roald3-jsonl files by ID prefix ('REAL.jsonl', 'HUME.jsonl', ...) or by a
+    hash of the ID ('00.jsonl', '01.jsonl', ...), described by a manifest:
+
+        {
+          "default_language": "nb",
+          "uri_format": "http://data.ub.uio.no/realfagstermer/c{id}",
+          "shard_by": "prefix",
+          "shards": {
+            "REAL": {"filename": "REAL.jsonl", "count": 20020, "sha1": "...", "types": {"Topic": 18000, ...}}
+          }
+        }
+
+    The shards can be loaded in parallel, or only some of them. Each shard is
+    a complete roald3-jsonl file, and can also be read on its own. A partial
+    load must include the shards holding the components of any compound
+    headings loaded, which is the case when sharding by prefix.
+    """
+
+    format_name = 'roald3-sharded'
+    manifest_name = 'manifest.json'
+    supports_selection = True
+
+    def __init__(self, vocabulary):
+        super(Roald3Sharded, self).__init__()
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def read_manifest(cls, dirname):
+        with open(os.path.join(dirname, cls.manifest_name), 'rb') as stream:
+            return json.loads(stream.read().decode('utf-8'))
+
+    def load(self, dirname, shards=None, jobs=1, selection=None):
+        self.vocabulary.resources.load(self.iter_resources(dirname, shards, jobs, selection))
+
+    def iter_resources(self, dirname, shards=None, jobs=1, selection=None):
+        """
+        Yields the resources from a sharded directory as dicts.
+
+            - shards : names of the shards to read (default: all), e.g. ['REAL']
+                       when sharding by prefix
+            - jobs : number of processes to parse the shards with
+            - selection : optional `roald.selection.Selection`. Shards without
+                          any of the selected types or IDs are not read.
+        """
+        manifest = self.read_manifest(dirname)
+        Roald3(self.vocabulary).read_header(manifest)
+        if shards is None:
+            shards = sorted(manifest['shards'].keys())
+        else:
+            unknown = set(shards) - set(manifest['shards'].keys())
+            if unknown:
+                raise ValueError('{}: Unknown shards: {}'.format(dirname, ', '.join(sorted(unknown))))
+        if selection is not None:
+            shards = [name for name in shards if self.may_have(manifest, name, selection)]
+
+        ranges = []
+        for name in shards:
+            filename = os.path.join(dirname, manifest['shards'][name]['filename'])
+            ranges += [(filename, start, end, selection) for start, end in Roald3Jsonl.split(filename, 1)]
+
+        if jobs > 1 and len(ranges) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                chunks = executor.map(_parse_range, ranges)
+                for chunk in track(chunks, self.format_name, total=len(ranges)):
+                    for resource in chunk:
+                        yield resource
+        else:
+            for args in track(ranges, self.format_name):
+                for resource in Roald3Jsonl.iter_range(*args):
+                    yield resource
+
+    def may_have(self, manifest, name, selection):
+        """Whether the shard `name` may hold any selected resources, according to the manifest."""
+        if not selection.accepts_types(manifest['shards'][name]['types'].keys()):
+            return False
+        if selection.ids is not None:
+            return any(self.shard_name(x, manifest['shard_by'], manifest.get('n_shards')) == name
+                       for x in selection.ids)
+        return True
+
+    @staticmethod
+    def shard_name(resource_id, shard_by='prefix', n_shards=16):
+        if shard_by == 'prefix':
+            return re.match('[A-Za-z]*', resource_id).group(0) or '_'
+        if shard_by == 'hash':
+            return '{:02x}'.format(zlib.crc32(resource_id.encode('utf-8')) % n_shards)
+        raise ValueError('shard_by must be "prefix" or "hash"')
+
+    def save(self, dirname, shard_by='prefix', n_shards=16):
+        """
+        Saves the vocabulary as a sharded directory. Shards that have not
+        changed since the last save are left untouched, and shards that are no
+        longer needed are removed.
+
+            - shard_by : 'prefix' (the leading letters of the ID) or 'hash'
+            - n_shards : number of shards when sharding by hash
+        """
+        if self.vocabulary.default_language is None:
+            raise RuntimeError('vocabulary.save: No default language code set.')
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        try:
+            previous = self.read_manifest(dirname)['shards']
+        except (IOError, OSError):
+            previous = {}
+
+        groups = {}
+        for resource in self.vocabulary.resources:
+            groups.setdefault(self.shard_name(resource['id'], shard_by, n_shards), []).append(resource)
+
+        shards = {}
+        with phase('write', format=self.format_name) as p:
+            for name in track(sorted(groups.keys()), self.format_name):
+                writer = Roald3Jsonl(self.vocabulary)
+                buf = io.BytesIO()
+                writer.write_resources(groups[name], buf)
+                data = buf.getvalue()
+                types = {}
+                for resource in groups[name]:
+                    for rtype in resource.get('type', []):
+                        types[rtype] = types.get(rtype, 0) + 1
+                shards[name] = {
+                    'filename': name + '.jsonl',
+                    'count': len(groups[name]),
+                    'sha1': hashlib.sha1(data).hexdigest(),
+                    'types': types,
+                }
+                filename = os.path.join(dirname, shards[name]['filename'])
+                if previous.get(name, {}).get('sha1') == shards[name]['sha1'] and os.path.isfile(filename):
+                    continue
+                with open(filename + '.tmp', 'wb') as stream:
+                    stream.write(data)
+                os.replace(filename + '.tmp', filename)
+            p.items = len(self.vocabulary.resources)
+
+        manifest = {
+            'default_language': self.vocabulary.default_language.alpha2,
+            'uri_format': self.vocabulary.uri_format,
+            'shard_by': shard_by,
+            'n_shards': n_shards if shard_by == 'hash' else None,
+            'shards': shards,
+        }
+        filename = os.path.join(dirname, self.manifest_name)
+        with open(filename + '.tmp', 'wb') as stream:
+            stream.write(json.dumps(manifest, sort_keys=True, indent=2, ensure_ascii=False).encode('utf-8'))
+        os.replace(filename + '.tmp', filename)
+
+        for name, shard in previous.items():
+            if name not in shards and os.path.isfile(os.path.join(dirname, shard['filename'])):
+                os.remove(os.path.join(dirname, shard['filename']))
@@ -1,5 +1,4 @@
 # encoding=utf-8
-import isodate
 
 from rdflib.graph import Graph, Literal
 from rdflib.namespace import Namespace, URIRef, OWL, RDF, DC, DCTERMS, FOAF, XSD, SKOS, RDFS
@@ -8,9 +7,12 @@ from rdflib.plugins.serializers.nt import NTSerializer
 from otsrdflib import OrderedTurtleSerializer
 from six import binary_type
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import logging
 
 from .adapter import Adapter
+from ..instrumentation import phase, track
+from ..profiling import RecordProfiler
 from ..models.resources import Concept
 from ..models.resources import Label
 
@@ -36,6 +38,43 @@ LOCAL = Namespace('http://data.ub.uio.no/onto#')
 UOC = Namespace('http://trans.biblionaut.net/class#')
 
 
+class TripleList(list):
+    """
+    Cheap stand-in for a Graph when we only need to collect the triples
+    added by `Skos.convert_resource`.
+    """
+    add = list.append
+
+
+# The adapter used by the worker processes in parallel mode. It is set once
+# per process by the pool initializer, so the vocabulary is only transferred
+# once per worker rather than once per shard.
+_worker_adapter = None
+
+
+def _init_worker(adapter):
+    global _worker_adapter
+    _worker_adapter = adapter
+
+
+def _convert_shard(shard):
+    ids, scheme_uri, default_language = shard
+    resources = _worker_adapter.vocabulary.resources
+    # Lookups by ID, so a `ResourcesView` isn't filtered again for every shard
+    shard_resources = [resources.get(id=x) for x in ids]
+    triples = TripleList()
+    profiler = _worker_adapter.profiler
+    if profiler is None:
+        for resource in shard_resources:
+            _worker_adapter.convert_resource(triples, resource, resources, scheme_uri, default_language)
+    else:
+        # Fresh profiler per shard, merged into the parent's by `convert_resources`
+        profiler = _worker_adapter.profiler = RecordProfiler(profiler.top, profiler.rank_by)
+        for resource in shard_resources:
+            _worker_adapter.profile_resource(triples, resource, resources, scheme_uri, default_language)
+    return triples, profiler
+
+
 class Skos(Adapter):
     """
     Class for exporting data as SKOS
@@ -59,12 +98,23 @@ class Skos(Adapter):
         'include_narrower': False
     }
 
+    builds_graph = True  # Writes are collected in a graph, see `GraphWriter`
+
+    # Relations that `convert_resource` resolves to URIs
+    relation_keys = ['related', 'plusUseTerm', 'replacedBy', 'member', 'memberOf', 'superOrdinate', 'broader']
+
     def __init__(self, vocabulary, include=None, mappings_from=None, add_same_as=None,
-                 with_ccmapper_candidates=False, infer=False, infer_top_concepts=False):
+                 with_ccmapper_candidates=False, infer=False, infer_top_concepts=False, workers=1,
+                 profiler=None, with_usage=False):
         """
             - vocabulary : Vocabulary object
             - include : List of files to include
             - mappings_from : List of files to only include mapping relations from
+            - with_usage : include the number of bibliographic records using each
+                           resource, see `roald.usage.store_usage`
+            - workers : Number of processes to use for generating triples (1 = serial)
+            - profiler : optional `roald.profiling.RecordProfiler` to measure the
+                         time spent on, and triples generated for, each resource
         """
         super(Skos, self).__init__()
         self.vocabulary = vocabulary
@@ -81,8 +131,18 @@ class Skos(Adapter):
         else:
             self.add_same_as = add_same_as
         self.with_ccmapper_candidates = with_ccmapper_candidates
+        self.with_usage = with_usage
         self.infer = infer
         self.infer_top_concepts = infer_top_concepts
+        self.workers = workers
+        self.profiler = profiler
+        self.graph = None
+
+    def __getstate__(self):
+        # The graph under construction is not needed by the worker processes
+        state = self.__dict__.copy()
+        state['graph'] = None
+        return state
 
     @staticmethod
     def get_label(graph: Graph, predicate, lang):
@@ -101,12 +161,14 @@ class Skos(Adapter):
 
         skosify.infer.skos_symmetric_mappings(graph, related=False)
 
+        id_from_uri = self.vocabulary.uri_codec.id_from_uri
+
         # Load mappings
         n_mappings = 0
         n_memberships = 0
         for tr in graph.triples_choices((None, [SKOS.exactMatch, SKOS.closeMatch, SKOS.broadMatch, SKOS.narrowMatch, SKOS.relatedMatch], None)):
             source_concept = tr[0]
-            res_id = self.vocabulary.id_from_uri(source_concept)
+            res_id = id_from_uri(source_concept)
             if res_id is not None:
                 shortName = str(tr[1]).split('#')[1]
                 try:
@@ -129,7 +191,7 @@ class Skos(Adapter):
 
             for tr2 in graph.triples((tr[0], SKOS.member, None)):
                 uri = str(tr2[2])
-                res_id = self.vocabulary.id_from_uri(uri)
+                res_id = id_from_uri(uri)
                 if res_id is not None:
                     try:
                         self.vocabulary.resources[res_id].add('memberOf', cat_id)
@@ -140,7 +202,7 @@ class Skos(Adapter):
         # Load number of ccmapper mapping candidates
         for tr in graph.triples((None, LOCAL.ccmapperCandidates, None)):
             source_concept = tr[0]
-            res_id = self.vocabulary.id_from_uri(source_concept)
+            res_id = id_from_uri(source_concept)
             if res_id is not None:
                 shortName = str(tr[1]).split('#')[1]
                 try:
@@ -151,7 +213,7 @@ class Skos(Adapter):
         # Load ccmapper mapping state
         for tr in graph.triples((None, LOCAL.ccmapperState, None)):
             source_concept = tr[0]
-            res_id = self.vocabulary.id_from_uri(source_concept)
+            res_id = id_from_uri(source_concept)
             if res_id is not None:
                 shortName = str(tr[1]).split('#')[1]
                 try:
@@ -162,7 +224,26 @@ class Skos(Adapter):
         logger.info('Loaded %d mappings and %d category memberships from %s', n_mappings, n_memberships, filename)
 
     def prepare(self):
+        with phase('graph', format='rdfskos') as p:
+            graph = self.begin()
+            self.convert_resources(graph, self.scheme_uri)
+            p.items = len(graph)
+        return self.end()
+
+    def write_resources(self, resources, sink, format='turtle'):
+        graph = self.begin()
+        for resource in resources:
+            self.write_resource(resource)
+        self.end()
+        sink.write(self.serialize(graph, format=format))
+
+    def begin(self):
+        """
+        Start building a new graph. Resources are added with `write_resource`,
+        and the graph is finalized with `end`.
+        """
         logger.info('Building RDF graph')
+        self.check_references()
 
         graph = Graph()
 
@@ -180,11 +261,43 @@ class Skos(Adapter):
         now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
         graph.set((URIRef(scheme_uri), DCTERMS.modified, Literal(now, datatype=XSD.dateTime)))
 
-        lg0 = len(graph)
-        for resource in self.vocabulary.resources:
-            self.convert_resource(graph, resource, self.vocabulary.resources, scheme_uri,
-                                  self.vocabulary.default_language.alpha2)
-        logger.info(' - Added {} triples'.format(len(graph) - lg0))
+        self.graph = graph
+        self.scheme_uri = scheme_uri
+        self.n_included = len(graph)
+        return graph
+
+    def converter(self):
+        """Returns the function to use for adding the triples for a resource to a graph."""
+        if self.profiler is not None:
+            return self.profile_resource
+        return self.convert_resource
+
+    def write_resource(self, resource, values=None):
+        """
+            - values : the `roald.export.ResourceValues` for the resource, if
+                       shared with other writers
+        """
+        self.converter()(self.graph, resource, self.vocabulary.resources, self.scheme_uri,
+                         self.vocabulary.default_language.alpha2, values)
+
+    def profile_resource(self, graph, resource, resources, scheme_uri, default_language, values=None):
+        """
+        Like `convert_resource`, but records the time spent and the number of
+        triples generated in the profiler.
+        """
+        triples = TripleList()
+        token = self.profiler.start()
+        self.convert_resource(triples, resource, resources, scheme_uri, default_language, values)
+        self.profiler.stop(token, resource, len(triples))
+        for triple in triples:
+            graph.add(triple)
+
+    def end(self):
+        graph = self.graph
+        self.graph = None
+        logger.info(' - Added {} triples'.format(len(graph) - self.n_included))
+        if self.profiler is not None:
+            logger.info('Per-record costs:\n%s', self.profiler.report())
 
         all_concepts = set([tr[0] for tr in graph.triples((None, RDF.type, SKOS.Concept))])
         for inc in self.mappings_from:
@@ -196,9 +309,45 @@ class Skos(Adapter):
             logger.info(' - Added {} mappings from {}'.format(len(graph) - lg0, inc))
 
         logger.info('Skosify...')
-        self.skosify_process(graph)
+        with phase('skosify') as p:
+            self.skosify_process(graph)
+            p.items = len(graph)
         return {'graph': graph}
 
+    def convert_resources(self, graph, scheme_uri):
+        """
+        Add the triples for all resources in the vocabulary to the graph.
+
+        If `workers` > 1, the resources are split into contiguous shards that are
+        converted in a process pool. The shards are merged in order, so the
+        resulting graph is the same as for a serial run.
+        """
+        resources = self.vocabulary.resources
+        default_language = self.vocabulary.default_language.alpha2
+
+        if self.workers is None or self.workers <= 1 or len(resources) < 2:
+            convert = self.converter()
+            for resource in track(resources, 'rdfskos'):
+                convert(graph, resource, resources, scheme_uri, default_language)
+            return
+
+        # The resources are listed once here, and each worker is sent the IDs of its shard
+        ids = [x['id'] for x in resources]
+        n_shards = min(len(ids), self.workers * 4)
+        bounds = [len(ids) * x // n_shards for x in range(n_shards + 1)]
+        shards = [(ids[bounds[x]:bounds[x + 1]], scheme_uri, default_language) for x in range(n_shards)]
+
+        logger.info(' - Converting %d resources in %d shards using %d workers',
+                    len(ids), n_shards, self.workers)
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self,)) as executor:
+            for triples, profiler in track(executor.map(_convert_shard, shards), 'rdfskos', total=n_shards):
+                for triple in triples:
+                    graph.add(triple)
+                if profiler is not None:
+                    self.profiler.merge(profiler)
+
     def serialize(self, graph, format='turtle'):
         logger.info('Serializing RDF graph as %s' % format)
 
@@ -229,8 +378,10 @@ class Skos(Adapter):
         else:
             raise ValueError('Unknown format %s' % format)
 
-        stream = BytesIO()
-        serializer.serialize(stream)
+        with phase('serialize', format=format) as p:
+            stream = BytesIO()
+            serializer.serialize(stream)
+            p.items = len(graph)
         return stream.getvalue()
 
     def convert_types(self, types):
@@ -240,18 +391,34 @@ class Skos(Adapter):
                 out.append(y)
         return out
 
+    def check_references(self):
+        """
+        Raises InvalidDataException listing all references from the exported
+        resources that can't be resolved, before any export work is done.
+        Compound headings without components are exported without them.
+        """
+        resources = self.vocabulary.resources
+        validation = resources.validation or resources.validate()
+        validation.check(self.relation_keys + ['component'], kinds=['unknown-id'])
+
     def try_resolve_relations(self, resources, resource, key):
+        uri = self.vocabulary.uri_codec.uri
+        if resources.validation is not None and resources.validation.ok:
+            # All references are known to resolve
+            return [URIRef(uri(value)) for value in resource.get(key, [])]
         out = []
         for value in resource.get(key, []):
             try:
                 other_resource = resources.get(id=value)
-                out.append(URIRef(self.vocabulary.uri(other_resource.id)))
+                out.append(URIRef(uri(other_resource.id)))
             except KeyError:
                 raise Exception('Posten %s referer til en ugyldig ID: %s' % (resource['id'], value))
         return out
 
-    def convert_resource(self, graph, resource, resources, scheme_uri, default_language):
-        uri = URIRef(self.vocabulary.uri(resource['id']))
+    def convert_resource(self, graph, resource, resources, scheme_uri, default_language, values=None):
+        codec = self.vocabulary.uri_codec
+        profiler = self.profiler
+        uri = URIRef((values is not None and values.uri) or codec.uri(resource['id']))
 
         types = self.convert_types(resource.get('type', []))
         if len(types) == 0:
@@ -269,6 +436,8 @@ class Skos(Adapter):
             graph.add((uri, SKOS.prefLabel, Literal(term.value, lang=lang)))
 
             if term.hasAcronym:
+                if profiler is not None:
+                    profiler.count('acronym')
                 # @TODO Temporary while thinking...
                 # graph.add((uri, LOCAL.acronym, Literal(term['hasAcronym'], lang=lang)))
                 graph.add((uri, SKOS.altLabel, Literal(term.hasAcronym, lang=lang)))
@@ -278,6 +447,8 @@ class Skos(Adapter):
                 graph.add((uri, SKOS.altLabel, Literal(term.value, lang=lang)))
 
                 if term.hasAcronym:
+                    if profiler is not None:
+                        profiler.count('acronym')
                     # @TODO Temporary while thinking...
                     # graph.add((uri, LOCAL.acronym, Literal(term['hasAcronym'], lang=lang)))
                     graph.add((uri, SKOS.altLabel, Literal(term.hasAcronym, lang=lang)))
@@ -324,6 +495,11 @@ class Skos(Adapter):
             if x is not None:
                 graph.add((uri, LOCAL.ccmapperState, Literal(x)))
 
+        if self.with_usage:
+            x = resource.get('usageCount')
+            if x is not None:
+                graph.add((uri, LOCAL.usageCount, Literal(x, datatype=XSD.integer)))
+
         for x in resource.get('libCode', []):
             graph.add((uri, LOCAL.libCode, Literal(x)))
 
@@ -366,23 +542,26 @@ class Skos(Adapter):
                 graph.add((other_uri, SKOS.narrower, uri))
 
         for mapping_type, target_uris in resource.get('mappings', {}).items():
+            if profiler is not None:
+                profiler.count('mapping.' + mapping_type, len(target_uris))
             for target_uri in target_uris:
                 graph.add((uri, SKOS[mapping_type], URIRef(target_uri)))
 
-        components = [resources.get(id=value) for value in resource.get('component', [])]
-        if len(components) != 0:
+        if len(resource.get('component', [])) != 0:
+            compound = resources.compound_headings.get(resource['id'])
+            components = compound.components
+            if profiler is not None:
+                profiler.count('compound_heading')
+                profiler.count('compound_heading.components', len(components))
 
             # @TODO: Generalize
             fallback_lang = 'nb'
             for lang in ['nb', 'nn', 'en']:
-                labels = [component['prefLabel'].get(lang, component['prefLabel'].get(fallback_lang)) for component in components]
-                labels = [component.value for component in labels if component]
-                # labels = [c.prefLabel[lang].value for c in components if c['prefLabel'].get(lang, fallback_lang)]
-                if len(labels) == len(components):
-                    streng = resources.string_separator.join(labels)
+                streng = compound.label(lang, fallback_lang)
+                if streng is not None:
                     graph.add((uri, SKOS.prefLabel, Literal(streng, lang=lang)))
 
-            component_uris = [URIRef(self.vocabulary.uri(c['id'])) for c in components]
+            component_uris = [URIRef(codec.uri(c['id'])) for c in components]
 
             for component_uri in component_uris:
                 graph.add((uri, LOCAL.component, component_uri))
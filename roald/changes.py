@@ -0,0 +1,219 @@
+# encoding=utf-8
+"""
+Changesets between two versions of a vocabulary.
+
+>>> import roald
+>>> changes = roald.diff('realfagstermer-forrige.json', 'realfagstermer.json')
+>>> roald.changes.write_jsonl(changes, 'endringer.jsonl')
+
+Both versions are read as streams of resource dicts sorted by ID and merged,
+so the comparison runs in a single pass. 'roald3-jsonl' files (ending in
+'.jsonl') are written sorted by ID, and are read one line at a time, so only
+the current resource from each side is held in memory. 'roald3' files are
+not streamed: they are read as a whole and sorted, so for large vocabularies
+convert them first (`roald convert realfagstermer.json realfagstermer.jsonl`).
+Each change is a dict:
+
+    {"op": "add", "id": "REAL001", "resource": {...}}
+    {"op": "remove", "id": "REAL002", "resource": {...}}
+    {"op": "change", "id": "REAL003", "changes": [
+        {"field": "prefLabel.nb", "old": {"value": "Røye"}, "new": {"value": "Røyer"}},
+        {"field": "broader", "old": ["REAL004"], "new": ["REAL005"],
+         "added": ["REAL005"], "removed": ["REAL004"]}
+    ]}
+
+Labels, notes and mappings are compared per language or mapping type
+('prefLabel.nb', 'mappings.exactMatch'). A field missing on one side has no
+'old' or 'new' value. The changes can be applied to the old version with `patch`.
+"""
+import codecs
+import io
+import json
+from six import string_types
+
+from .errors import InvalidDataException
+
+# Fields holding a dict of languages or mapping types, compared per key
+NESTED_FIELDS = ['prefLabel', 'altLabel', 'hiddenLabel', 'definition', 'scopeNote', 'mappings']
+
+
+class PatchConflict(InvalidDataException):
+    pass
+
+
+def read_jsonl_resources(filename):
+    """Yields the resources from a roald3-jsonl file, one line at a time."""
+    with io.open(filename, 'rb') as stream:
+        stream.readline()  # header
+        for line in stream:
+            if line.strip():
+                yield json.loads(line.decode('utf-8'))
+
+
+def read_resources(source):
+    """
+    Yields the resources from a roald3-jsonl file (streamed), a Roald3 file
+    (read as a whole and sorted), or an iterable of dicts or Resource objects
+    sorted by ID, as dicts.
+    """
+    if isinstance(source, string_types):
+        if source.endswith('.jsonl'):
+            return read_jsonl_resources(source)
+        with codecs.open(source, 'r', 'utf-8') as stream:
+            resources = json.load(stream).get('resources', [])
+        resources.sort(key=lambda x: x['id'])
+        return iter(resources)
+    return (x.serialize() if hasattr(x, 'serialize') else x for x in source)
+
+
+def _sorted(resources, name):
+    last = None
+    for resource in resources:
+        if last is not None and resource['id'] <= last:
+            raise InvalidDataException('The {} resources are not sorted by ID: {} after {}'.format(
+                name, resource['id'], last))
+        last = resource['id']
+        yield resource
+
+
+def _flatten(resource):
+    out = {}
+    for key, value in resource.items():
+        if key in NESTED_FIELDS and isinstance(value, dict):
+            for subkey, subvalue in value.items():
+                out['{}.{}'.format(key, subkey)] = subvalue
+        else:
+            out[key] = value
+    return out
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+
+def field_changes(old, new):
+    """Returns the per-field differences between two resource dicts."""
+    old = _flatten(old)
+    new = _flatten(new)
+    changes = []
+    for field in sorted(set(old.keys()) | set(new.keys())):
+        if old.get(field) == new.get(field):
+            continue
+        change = {'field': field}
+        if field in old:
+            change['old'] = old[field]
+        if field in new:
+            change['new'] = new[field]
+        if isinstance(old.get(field), list) and isinstance(new.get(field), list):
+            old_keys = set(_canonical(x) for x in old[field])
+            new_keys = set(_canonical(x) for x in new[field])
+            change['added'] = [x for x in new[field] if _canonical(x) not in old_keys]
+            change['removed'] = [x for x in old[field] if _canonical(x) not in new_keys]
+        changes.append(change)
+    return changes
+
+
+def diff(old, new):
+    """
+    Yields the changes from `old` to `new`, in ID order.
+
+        - old, new : roald3-jsonl or Roald3 filenames, or iterables of resource
+                     dicts (or Resource objects) sorted by ID
+    """
+    old = _sorted(read_resources(old), 'old')
+    new = _sorted(read_resources(new), 'new')
+    a = next(old, None)
+    b = next(new, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a['id'] < b['id']):
+            yield {'op': 'remove', 'id': a['id'], 'resource': a}
+            a = next(old, None)
+        elif a is None or b['id'] < a['id']:
+            yield {'op': 'add', 'id': b['id'], 'resource': b}
+            b = next(new, None)
+        else:
+            if a != b:
+                yield {'op': 'change', 'id': a['id'], 'changes': field_changes(a, b)}
+            a = next(old, None)
+            b = next(new, None)
+
+
+def apply_changes(resource, changes):
+    """
+    Returns a copy of a resource dict with the field changes applied. Raises
+    PatchConflict if a field doesn't have the expected old value.
+    """
+    flat = _flatten(resource)
+    for change in changes:
+        field = change['field']
+        if flat.get(field) != change.get('old'):
+            raise PatchConflict('{}: Expected {} to be {}, found {}'.format(
+                resource['id'], field, _canonical(change.get('old')), _canonical(flat.get(field))))
+        if 'new' in change:
+            flat[field] = change['new']
+        else:
+            del flat[field]
+
+    out = {}
+    for key, value in flat.items():
+        parts = key.split('.', 1)
+        if len(parts) == 2 and parts[0] in NESTED_FIELDS:
+            out.setdefault(parts[0], {})[parts[1]] = value
+        else:
+            out[key] = value
+    for field in NESTED_FIELDS:
+        if field in resource and field not in out:
+            out[field] = {}  # keep empty label dicts
+    return out
+
+
+def patch(resources, changes):
+    """
+    Applies changes from `diff` to the old version, yielding the resources of
+    the new version in ID order.
+
+        - resources : roald3-jsonl or Roald3 filename, or iterable of resource
+                      dicts sorted by ID
+        - changes : iterable of changes sorted by ID, e.g. from `read_jsonl`
+    """
+    resources = _sorted(read_resources(resources), 'old')
+    changes = iter(changes)
+    resource = next(resources, None)
+    change = next(changes, None)
+    while resource is not None or change is not None:
+        if change is None or (resource is not None and resource['id'] < change['id']):
+            yield resource
+            resource = next(resources, None)
+            continue
+
+        if change['op'] == 'add':
+            if resource is not None and resource['id'] == change['id']:
+                raise PatchConflict('{}: Cannot add, the resource already exists'.format(change['id']))
+            yield change['resource']
+        elif resource is None or resource['id'] != change['id']:
+            raise PatchConflict('{}: Cannot {}, the resource does not exist'.format(change['id'], change['op']))
+        else:
+            if change['op'] == 'change':
+                yield apply_changes(resource, change['changes'])
+            elif change['op'] != 'remove':
+                raise InvalidDataException('Unknown operation: {}'.format(change['op']))
+            resource = next(resources, None)
+        change = next(changes, None)
+
+
+def write_jsonl(changes, filename):
+    """Writes changes as JSON lines. Returns the number of changes per operation."""
+    counts = {'add': 0, 'remove': 0, 'change': 0}
+    with codecs.open(filename, 'w', 'utf-8') as stream:
+        for change in changes:
+            stream.write(json.dumps(change, sort_keys=True, ensure_ascii=False) + '\n')
+            counts[change['op']] += 1
+    return counts
+
+
+def read_jsonl(filename):
+    """Yields the changes from a JSON lines file written by `write_jsonl`."""
+    with codecs.open(filename, 'r', 'utf-8') as stream:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,387 @@
+# encoding=utf-8
+"""
+Command line interface.
+
+    roald run pipeline.json [--jobs N] [--no-progress] [--phases phases.jsonl]
+
+runs a pipeline described by a JSON file:
+
+    {
+      "uri_format": "http://data.ub.uio.no/realfagstermer/c{id}",
+      "sources": [
+        {"filename": "~/riidata/ureal/rii/", "format": "roald2", "language": "nb"},
+        {"filename": "mumapper.rdf", "format": "skos"}
+      ],
+      "targets": [
+        {"filename": "realfagstermer.json", "format": "roald3"},
+        {"filename": "realfagstermer.marc21.xml", "format": "marc21",
+         "vocabulary_code": "noubomn", "created_by": "NoOU"},
+        {"filename": "realfagstermer.ttl", "format": "rdfskos", "include": ["scheme.ttl"]}
+      ],
+      "jobs": 1
+    }
+
+Sources are loaded in order with `Roald.load`; any keys other than 'filename',
+'format' and 'language' are passed on to the adapter. The targets are given
+as for `Roald.export_many`. With "jobs": 1 (default), all targets are written
+in a single traversal of the vocabulary. With more jobs, independent targets
+are written concurrently in separate processes ('rdfskos' targets with the
+same options still share a graph).
+
+    roald convert realfagstermer.json realfagstermer.jsonl
+
+converts between the 'roald3' and 'roald3-jsonl' formats (or, with --from
+and --to, between any formats that can be read and written).
+
+    roald closure realfagstermer.json hierarki.csv
+
+writes the transitive closure of the hierarchy (see `roald.models.hierarchy`).
+
+    roald enrich realfagstermer.json bib.xml bib.linked.xml --code noubomn --jobs 4
+
+adds $0 links to the subject fields of bibliographic records (MARCXML or ISO
+2709), see `roald.enrichment`.
+
+    roald usage realfagstermer.json bib1.xml bib2.mrc --code noubomn --csv bruk.csv --output realfagstermer.json
+
+counts the records using each resource as a subject, stores the counts as
+'usageCount' on the resources and writes them as CSV, see `roald.usage`.
+
+    roald serve realfagstermer.json --port 8080
+
+answers lookups by ID, label, label prefix and heading over HTTP, reloading
+the file when it changes, see `roald.server`.
+"""
+from __future__ import print_function
+import argparse
+import json
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .roald import Roald
+from .adapters.registry import formats
+from .instrumentation import track
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressPrinter(object):
+    """
+    Progress function for `Instrumentation` printing a single, updating status line.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.width = 0
+
+    @staticmethod
+    def format_seconds(seconds):
+        seconds = int(round(seconds))
+        if seconds >= 3600:
+            return '{:d}:{:02d}:{:02d}'.format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+        return '{:d}:{:02d}'.format(seconds // 60, seconds % 60)
+
+    def __call__(self, state):
+        line = '{}: {:d}'.format(state['name'], state['items'])
+        if state['total']:
+            line += '/{:d}'.format(state['total'])
+        if state['fraction'] is not None and not state['finished']:
+            line += ' ({:.0%})'.format(state['fraction'])
+        if state['rate'] is not None:
+            line += (', {:.0f}/s' if state['rate'] >= 10 else ', {:.2g}/s').format(state['rate'])
+        if state['finished']:
+            line += ', {}'.format(self.format_seconds(state['elapsed']))
+        elif state['eta'] is not None:
+            line += ', ETA {}'.format(self.format_seconds(state['eta']))
+        self.stream.write('\r' + line.ljust(self.width))
+        self.width = len(line)
+        if state['finished']:
+            self.stream.write('\n')
+            self.width = 0
+        self.stream.flush()
+
+
+def read_config(filename):
+    with open(filename) as stream:
+        config = json.load(stream)
+    for key in ['sources', 'targets']:
+        if not isinstance(config.get(key), list):
+            raise ValueError('{}: "{}" must be a list'.format(filename, key))
+    for item in config['sources'] + config['targets']:
+        if 'filename' not in item or 'format' not in item:
+            raise ValueError('{}: Sources and targets must have a "filename" and a "format"'.format(filename))
+    return config
+
+
+def group_targets(targets):
+    """
+    Split the targets into groups that can be written independently. Graph
+    based targets with the same format and options are kept together, so
+    they can share a graph.
+    """
+    groups = []
+    graph_groups = {}
+    for target in targets:
+        if getattr(formats.writer(target['format']), 'builds_graph', False):
+            options = {k: v for k, v in target.items() if k not in ['filename', 'serialization']}
+            key = json.dumps(options, sort_keys=True, default=str)
+            if key not in graph_groups:
+                graph_groups[key] = []
+                groups.append(graph_groups[key])
+            graph_groups[key].append(target)
+        else:
+            groups.append([target])
+    return groups
+
+
+# The Roald instance used by the worker processes, see `_init_worker`
+_worker_roald = None
+
+
+def _init_worker(vocabulary):
+    global _worker_roald
+    _worker_roald = Roald()
+    _worker_roald.vocabulary = vocabulary
+
+
+def _export_group(targets):
+    _worker_roald.instrumentation.reset()
+    _worker_roald.export_many(targets)
+    return _worker_roald.instrumentation.records
+
+
+def run(config, jobs=None, progress=True):
+    """
+    Run a pipeline. Returns the Roald instance, where the phases recorded
+    are available from `roald.instrumentation`.
+
+        - config : the pipeline, as a dict (see module docstring)
+        - jobs : number of processes to use for the export (default: from the config, or 1)
+        - progress : whether to print progress to stderr
+    """
+    roald = Roald(mail_config=config.get('mail_config'))
+    if progress:
+        roald.instrumentation.progress = ProgressPrinter()
+
+    for source in config['sources']:
+        options = dict(source)
+        filename = options.pop('filename')
+        logger.info('Loading %s', filename)
+        roald.load(filename, **options)
+
+    if config.get('uri_format') is not None:
+        roald.set_uri_format(config['uri_format'], config.get('id_prefix', ''))
+
+    if jobs is None:
+        jobs = config.get('jobs', 1)
+    groups = group_targets(config['targets'])
+
+    if jobs <= 1 or len(groups) < 2:
+        roald.export_many(config['targets'])
+        return roald
+
+    logger.info('Exporting %d groups of targets using %d processes', len(groups), jobs)
+    with roald.instrumentation.activate():
+        with ProcessPoolExecutor(max_workers=min(jobs, len(groups)), initializer=_init_worker,
+                                 initargs=(roald.vocabulary,)) as executor:
+            futures = {executor.submit(_export_group, group): group for group in groups}
+            for future in track(as_completed(futures), 'targets', total=len(futures)):
+                try:
+                    records = future.result()
+                except Exception as error:
+                    filenames = ', '.join([target['filename'] for target in futures[future]])
+                    roald.notify_failure(filenames, error)
+                    raise
+                for record in records:
+                    roald.instrumentation.add_record(record)
+    return roald
+
+
+def guess_format(filename):
+    return 'roald3-jsonl' if filename.endswith('.jsonl') else 'roald3'
+
+
+def convert(source, target, source_format=None, target_format=None, jobs=1):
+    """
+    Converts a vocabulary file to another format. The formats are guessed
+    from the file extensions if not given ('.jsonl': 'roald3-jsonl',
+    otherwise 'roald3').
+    """
+    source_format = source_format or guess_format(source)
+    target_format = target_format or guess_format(target)
+    roald = Roald()
+    options = {'jobs': jobs} if jobs > 1 else {}
+    roald.load(source, format=source_format, **options)
+    roald.export(target, format=target_format)
+    return roald
+
+
+def closure(source, target, source_format=None, target_format=None, keys=None):
+    """
+    Writes the transitive closure of the hierarchy in a vocabulary file as
+    CSV or JSON, see `roald.models.hierarchy.Hierarchy.write_closure`.
+    """
+    roald = Roald()
+    roald.load(source, format=source_format or guess_format(source))
+    roald.vocabulary.resources.hierarchy(keys).write_closure(target, target_format)
+    return roald
+
+
+def enrich_records(vocabulary, source, target, vocabulary_code, vocabulary_format=None, marc_format=None,
+                   jobs=1, overwrite=False, batch_size=500, report=None):
+    """
+    Adds $0 links to bibliographic records using a vocabulary file, and prints
+    a summary. Returns the `roald.enrichment.EnrichmentReport`.
+
+        - report : also write the counts and all unmatched headings to this JSON file
+    """
+    from .enrichment import enrich, write_report
+
+    roald = Roald()
+    roald.load(vocabulary, format=vocabulary_format or guess_format(vocabulary))
+    result = enrich(roald.vocabulary, source, target, vocabulary_code, marc_format, jobs, overwrite, batch_size)
+    print(result.summary(), file=sys.stderr)
+    if report is not None:
+        write_report(result, report)
+    return result
+
+
+def usage(vocabulary, sources, vocabulary_code, vocabulary_format=None, marc_format=None, jobs=1,
+          batch_size=500, csv_filename=None, output=None):
+    """
+    Counts the bibliographic records using each resource in a vocabulary file,
+    and prints a summary. Returns the `roald.usage.UsageReport`.
+
+        - csv_filename : write the counts to this CSV file
+        - output : save the vocabulary, with the counts, to this file
+    """
+    from .usage import count_usage, store_usage, write_usage
+
+    roald = Roald()
+    roald.load(vocabulary, format=vocabulary_format or guess_format(vocabulary))
+    result = count_usage(roald.vocabulary, sources, vocabulary_code, marc_format, jobs, batch_size)
+    print(result.summary(), file=sys.stderr)
+    resources = roald.vocabulary.resources
+    store_usage(resources, result.counts)
+    if csv_filename is not None:
+        write_usage(resources, csv_filename)
+    if output is not None:
+        roald.save(output, format=guess_format(output))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='roald', description='Roald III indexing tool')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run', help='Run a load/export pipeline described by a JSON file')
+    run_parser.add_argument('config', help='Pipeline configuration (JSON)')
+    run_parser.add_argument('-j', '--jobs', type=int, default=None,
+                            help='Number of export targets to write concurrently')
+    run_parser.add_argument('--no-progress', dest='progress', action='store_false',
+                            help='Do not show progress')
+    run_parser.add_argument('--phases', metavar='FILENAME',
+                            help='Append timing and memory use for each phase to this JSONL file')
+    run_parser.add_argument('-v', '--verbose', action='store_true', help='Log more')
+
+    convert_parser = subparsers.add_parser('convert', help='Convert between roald3 and roald3-jsonl')
+    convert_parser.add_argument('source', help='Input file')
+    convert_parser.add_argument('target', help='Output file')
+    convert_parser.add_argument('--from', dest='source_format', metavar='FORMAT',
+                                help='Input format (default: from the file extension)')
+    convert_parser.add_argument('--to', dest='target_format', metavar='FORMAT',
+                                help='Output format (default: from the file extension)')
+    convert_parser.add_argument('-j', '--jobs', type=int, default=1,
+                                help='Number of processes to parse roald3-jsonl input with')
+    convert_parser.add_argument('-v', '--verbose', action='store_true', help='Log more')
+
+    closure_parser = subparsers.add_parser('closure', help='Write the hierarchy closure table as CSV or JSON')
+    closure_parser.add_argument('source', help='Input file')
+    closure_parser.add_argument('target', help='Output file (.csv or .json)')
+    closure_parser.add_argument('--from', dest='source_format', metavar='FORMAT',
+                                help='Input format (default: from the file extension)')
+    closure_parser.add_argument('--to', dest='target_format', choices=['csv', 'json'],
+                                help='Output format (default: from the file extension)')
+    closure_parser.add_argument('--relations', metavar='KEYS', type=lambda x: x.split(','),
+                                help='Comma-separated relations to follow (default: broader,memberOf,superOrdinate)')
+    closure_parser.add_argument('-v', '--verbose', action='store_true', help='Log more')
+
+    enrich_parser = subparsers.add_parser('enrich', help='Add $0 links to the subject fields of bibliographic records')
+    enrich_parser.add_argument('vocabulary', help='Vocabulary file')
+    enrich_parser.add_argument('source', help='Bibliographic records (MARCXML or ISO 2709)')
+    enrich_parser.add_argument('target', help='Output file, in the same format')
+    enrich_parser.add_argument('--code', dest='vocabulary_code', required=True,
+                               help='Link fields with this $2 vocabulary code, e.g. noubomn')
+    enrich_parser.add_argument('--from', dest='vocabulary_format', metavar='FORMAT',
+                               help='Vocabulary format (default: from the file extension)')
+    enrich_parser.add_argument('--marc-format', choices=['marcxml', 'iso2709'],
+                               help='Format of the records (default: from the content)')
+    enrich_parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes')
+    enrich_parser.add_argument('--batch-size', type=int, default=500, help='Records per chunk sent to a worker')
+    enrich_parser.add_argument('--overwrite', action='store_true', help='Replace existing $0 values')
+    enrich_parser.add_argument('--report', metavar='FILENAME', help='Write counts and unmatched headings as JSON')
+    enrich_parser.add_argument('-v', '--verbose', action='store_true', help='Log more')
+
+    usage_parser = subparsers.add_parser('usage', help='Count the bibliographic records using each resource')
+    usage_parser.add_argument('vocabulary', help='Vocabulary file')
+    usage_parser.add_argument('sources', nargs='+', help='Bibliographic records (MARCXML or ISO 2709)')
+    usage_parser.add_argument('--code', dest='vocabulary_code', required=True,
+                              help='Count fields with this $2 vocabulary code, e.g. noubomn')
+    usage_parser.add_argument('--from', dest='vocabulary_format', metavar='FORMAT',
+                              help='Vocabulary format (default: from the file extension)')
+    usage_parser.add_argument('--marc-format', choices=['marcxml', 'iso2709'],
+                              help='Format of the records (default: from the content of each file)')
+    usage_parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes')
+    usage_parser.add_argument('--batch-size', type=int, default=500, help='Records per chunk sent to a worker')
+    usage_parser.add_argument('--csv', dest='csv_filename', metavar='FILENAME',
+                              help='Write the counts as CSV (id, label, count)')
+    usage_parser.add_argument('--output', metavar='FILENAME', help='Save the vocabulary with the counts')
+    usage_parser.add_argument('-v', '--verbose', action='store_true', help='Log more')
+
+    serve_parser = subparsers.add_parser('serve', help='Answer lookups in a vocabulary file over HTTP')
+    serve_parser.add_argument('vocabulary', help='Vocabulary file (roald3 or roald3-jsonl)')
+    serve_parser.add_argument('--from', dest='vocabulary_format', metavar='FORMAT',
+                              help='Vocabulary format (default: from the file extension)')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    serve_parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    serve_parser.add_argument('--threads', type=int, default=8, help='Number of requests handled at the same time')
+    serve_parser.add_argument('--interval', type=float, default=2.0,
+                              help='Seconds between checks for changes to the file (0: never reload)')
+    serve_parser.add_argument('-v', '--verbose', action='store_true', help='Log more')
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(message)s')
+
+    if args.command == 'convert':
+        convert(args.source, args.target, args.source_format, args.target_format, args.jobs)
+        return 0
+
+    if args.command == 'enrich':
+        enrich_records(args.vocabulary, args.source, args.target, args.vocabulary_code, args.vocabulary_format,
+                       args.marc_format, args.jobs, args.overwrite, args.batch_size, args.report)
+        return 0
+
+    if args.command == 'usage':
+        usage(args.vocabulary, args.sources, args.vocabulary_code, args.vocabulary_format, args.marc_format,
+              args.jobs, args.batch_size, args.csv_filename, args.output)
+        return 0
+
+    if args.command == 'serve':
+        from .server import serve
+        serve(args.vocabulary, args.host, args.port, args.vocabulary_format or guess_format(args.vocabulary),
+              args.threads, args.interval)
+        return 0
+
+    if args.command == 'closure':
+        closure(args.source, args.target, args.source_format, args.target_format, args.relations)
+        return 0
+
+    config = read_config(args.config)
+    roald = run(config, jobs=args.jobs, progress=args.progress and sys.stderr.isatty())
+    if args.phases:
+        roald.instrumentation.write_jsonl(args.phases)
+    return 0
@@ -0,0 +1,421 @@
+# encoding=utf-8
+"""
+Adds $0 authority links to the subject fields (648/650/651/655) of
+bibliographic MARC records, for the fields having $2 set to the vocabulary
+code.
+
+>>> report = enrich(roald.vocabulary, 'bib.xml', 'bib.linked.xml', vocabulary_code='noubomn', jobs=4)
+>>> report.counts
+{'records': 1000, 'fields': 1520, 'linked': 1480, 'unmatched': 30, 'ambiguous': 2, 'already_linked': 8}
+>>> report.unmatched.most_common(1)
+[('650 $a Fornybar energi $z Noreg', 12)]
+
+The headings are resolved with `Resources.heading_index`. The $0 value is the
+URI of the resource if the vocabulary has a URI format, otherwise its ID.
+
+Both MARCXML (a collection of records) and ISO 2709 are read and written. The
+input is split into chunks of records that are parsed, linked and serialized
+in worker processes, and written in the original order. ISO 2709 records are
+patched in place, so fields that are not changed are kept byte for byte.
+MARCXML records are serialized with lxml, and may get namespace declarations
+of their own.
+"""
+from __future__ import division
+import json
+import logging
+import os
+import re
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .instrumentation import phase, track
+from .models.headings import subject_tags
+
+logger = logging.getLogger(__name__)
+
+SUBJECT_TAGS = set(subject_tags.values())
+
+FIELD_TERMINATOR = b'\x1e'
+RECORD_TERMINATOR = b'\x1d'
+SUBFIELD_DELIMITER = b'\x1f'
+
+RECORD_START = re.compile(br'<(?:[\w.-]+:)?record[\s>/]')
+RECORD_END = re.compile(br'</(?:[\w.-]+:)?record\s*>')
+TAG = re.compile(br'<(/?)([\w.:-]+)[^>]*?(/?)>')
+
+BLOCK_SIZE = 1 << 20
+
+
+class EnrichmentReport(object):
+    """Counts of the records and fields processed, and of the headings that were not found."""
+
+    keys = ['records', 'fields', 'linked', 'unmatched', 'ambiguous', 'already_linked']
+
+    def __init__(self):
+        self.counts = dict([(key, 0) for key in self.keys])
+        self.unmatched = Counter()  # 'tag $a ... $x ...': number of fields
+
+    def merge(self, other):
+        for key in self.keys:
+            self.counts[key] += other.counts[key]
+        self.unmatched.update(other.unmatched)
+
+    def serialize(self, limit=None):
+        """
+            - limit : include only the `limit` most common unmatched headings
+        """
+        return {
+            'counts': self.counts,
+            'unmatched': [{'heading': x, 'count': n} for x, n in self.unmatched.most_common(limit)],
+        }
+
+    def summary(self, limit=10):
+        lines = ['{records} records, {fields} subject fields: {linked} linked, {unmatched} unmatched, '
+                 '{ambiguous} ambiguous, {already_linked} already linked'.format(**self.counts)]
+        for heading, n in self.unmatched.most_common(limit):
+            lines.append(' - {} ({})'.format(heading, n))
+        return '\n'.join(lines)
+
+
+class Enricher(object):
+    """
+    Links the subject fields of single records or chunks of records. Picklable,
+    so it can be sent to worker processes.
+    """
+
+    def __init__(self, index, uri_codec, vocabulary_code, overwrite=False):
+        """
+            - index : `roald.models.headings.HeadingIndex`
+            - uri_codec : `roald.models.UriCodec`, or None to link to IDs
+            - vocabulary_code : only fields with this $2 are linked, e.g. 'noubomn'
+            - overwrite : replace existing $0 values (default: leave the fields alone)
+        """
+        self.index = index
+        self.uri_codec = uri_codec
+        self.vocabulary_code = vocabulary_code
+        self.overwrite = overwrite
+
+    def link(self, tag, subfields, report):
+        """
+        Returns the $0 value for a field given as a tag and a list of (code, value)
+        subfields, or None if the field should not be changed.
+        """
+        if tag not in SUBJECT_TAGS:
+            return None
+        codes = [x[0] for x in subfields]
+        if (u'2', self.vocabulary_code) not in subfields:
+            return None
+        report.counts['fields'] += 1
+        if u'0' in codes and not self.overwrite:
+            report.counts['already_linked'] += 1
+            return None
+        resource_id = self.index.lookup(tag, subfields)
+        if resource_id is None:
+            if self.index.is_ambiguous(tag, subfields):
+                report.counts['ambiguous'] += 1
+            else:
+                report.counts['unmatched'] += 1
+                report.unmatched[tag + u''.join([u' ${} {}'.format(code, value) for code, value in subfields
+                                                 if code not in (u'0', u'2', u'9')])] += 1
+            return None
+        report.counts['linked'] += 1
+        if self.uri_codec is None or self.uri_codec.uri_format is None:
+            return resource_id
+        return self.uri_codec.uri(resource_id)
+
+    def enrich_iso2709(self, records):
+        """
+            - records : list of ISO 2709 records, without the record terminator
+        Returns (bytes, EnrichmentReport), with the records terminated.
+        """
+        report = EnrichmentReport()
+        out = []
+        for record in records:
+            report.counts['records'] += 1
+            out.append(self.enrich_iso2709_record(record, report))
+            out.append(RECORD_TERMINATOR)
+        return b''.join(out), report
+
+    def enrich_iso2709_record(self, record, report):
+        fields = []
+        changed = False
+        for tag, data in iso2709_fields(record):
+            if tag[:1] == b'6' and tag.decode('ascii') in SUBJECT_TAGS:
+                indicators, raw = iso2709_subfields(data)
+                value = self.link(tag.decode('ascii'), decode_subfields(raw), report)
+                if value is not None:
+                    raw = [x for x in raw if x[0] != b'0'] + [(b'0', value.encode('utf-8'))]
+                    data = indicators + b''.join([SUBFIELD_DELIMITER + code + value for code, value in raw]) \
+                        + FIELD_TERMINATOR
+                    changed = True
+            fields.append((tag, data))
+        if not changed:
+            return record
+
+        directory = []
+        offset = 0
+        for tag, data in fields:
+            directory.append(tag + b'%04d%05d' % (len(data), offset))
+            offset += len(data)
+        base = 24 + 12 * len(fields) + 1
+        leader = b'%05d' % (base + offset + 1) + record[5:12] + b'%05d' % base + record[17:24]
+        return leader + b''.join(directory) + FIELD_TERMINATOR + b''.join([x[1] for x in fields])
+
+    def enrich_marcxml(self, header, chunk):
+        """
+            - header : the start of the document, up to the first record
+            - chunk : one or more complete records
+        Returns (bytes, EnrichmentReport).
+        """
+        from lxml import etree
+
+        report = EnrichmentReport()
+        out = [chunk[:len(chunk) - len(chunk.lstrip())]]  # whitespace before the first record
+        for record in marcxml_records(header, chunk):
+            report.counts['records'] += 1
+            for field, tag, subfields in marcxml_subject_fields(record):
+                value = self.link(tag, subfields, report)
+                if value is not None:
+                    for x in list(field):
+                        if isinstance(x.tag, str) and x.get('code') == '0':
+                            field.remove(x)
+                    namespace = etree.QName(field).namespace
+                    subfield = etree.SubElement(field, '{%s}subfield' % namespace if namespace else 'subfield')
+                    subfield.set('code', '0')
+                    subfield.text = value
+            out.append(etree.tostring(record, encoding='utf-8'))
+        return b''.join(out), report
+
+
+def iso2709_fields(record):
+    """Yields (tag, data) for each field of an ISO 2709 record, data ending with the field terminator."""
+    base = int(record[12:17])
+    directory = record[24:base - 1]
+    for n in range(0, len(directory) - 11, 12):
+        start = base + int(directory[n + 7:n + 12])
+        yield directory[n:n + 3], record[start:start + int(directory[n + 3:n + 7])]
+
+
+def iso2709_subfields(data):
+    """Splits the data of an ISO 2709 data field into the indicators and a list of (code, value), as bytes."""
+    parts = data.rstrip(FIELD_TERMINATOR).split(SUBFIELD_DELIMITER)
+    return parts[0], [(x[:1], x[1:]) for x in parts[1:]]
+
+
+def decode_subfields(raw):
+    return [(code.decode('ascii', 'replace'), value.decode('utf-8', 'replace')) for code, value in raw]
+
+
+def iso2709_subject_fields(record):
+    """Yields (tag, subfields) for the subject fields of an ISO 2709 record."""
+    for tag, data in iso2709_fields(record):
+        if tag[:1] == b'6' and tag.decode('ascii') in SUBJECT_TAGS:
+            yield tag.decode('ascii'), decode_subfields(iso2709_subfields(data)[1])
+
+
+def marcxml_records(header, chunk):
+    """Parses a chunk of MARCXML records, see `MarcXmlSplitter`, and returns the record elements."""
+    from lxml import etree
+
+    closing = closing_tags(header)
+    if closing:
+        root = etree.fromstring(header + chunk + closing)
+    else:
+        root = etree.fromstring(header + b'<collection>' + chunk + b'</collection>')
+    return [x for x in root.iter() if isinstance(x.tag, str) and etree.QName(x).localname == 'record']
+
+
+def marcxml_subject_fields(record):
+    """Yields (element, tag, subfields) for the subject fields of a MARCXML record element."""
+    from lxml import etree
+
+    for field in record:
+        if not isinstance(field.tag, str) or etree.QName(field).localname != 'datafield':
+            continue
+        tag = field.get('tag')
+        if tag in SUBJECT_TAGS:
+            yield field, tag, [(x.get('code'), x.text or u'') for x in field if isinstance(x.tag, str)]
+
+
+def closing_tags(header):
+    """The end tags for the elements left open in `header`."""
+    stack = []
+    for m in TAG.finditer(header):
+        closing, name, empty = m.groups()
+        if closing:
+            if stack and stack[-1] == name:
+                stack.pop()
+        elif not empty:
+            stack.append(name)
+    return b''.join([b'</' + name + b'>' for name in reversed(stack)])
+
+
+def iso2709_chunks(stream, batch_size):
+    """Yields lists of up to `batch_size` records, without the record terminators."""
+    buffer = b''
+    records = []
+    while True:
+        block = stream.read(BLOCK_SIZE)
+        if not block:
+            break
+        parts = (buffer + block).split(RECORD_TERMINATOR)
+        buffer = parts.pop()
+        for part in parts:
+            record = part.lstrip(b'\r\n')  # line breaks between records
+            if record:
+                records.append(record)
+            if len(records) == batch_size:
+                yield records
+                records = []
+    if buffer.strip():
+        records.append(buffer.strip())
+    if records:
+        yield records
+
+
+class MarcXmlSplitter(object):
+    """Splits a MARCXML document into a header, chunks of complete records and a footer."""
+
+    def __init__(self, stream, batch_size):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.header = None
+        self.footer = b''
+
+    def chunks(self):
+        buffer = b''
+        while self.header is None:
+            block = self.stream.read(BLOCK_SIZE)
+            if not block:
+                self.header = buffer  # no records
+                return
+            buffer += block
+            m = RECORD_START.search(buffer)
+            if m is not None:
+                self.header = buffer[:m.start()]
+                buffer = buffer[m.start():]
+
+        while True:
+            ends = [x.end() for x in RECORD_END.finditer(buffer)]
+            while len(ends) >= self.batch_size:
+                cut = ends[self.batch_size - 1]
+                yield buffer[:cut]
+                buffer = buffer[cut:]
+                ends = [x - cut for x in ends[self.batch_size:]]
+            block = self.stream.read(BLOCK_SIZE)
+            if not block:
+                break
+            buffer += block
+        if ends:
+            yield buffer[:ends[-1]]
+            buffer = buffer[ends[-1]:]
+        self.footer = buffer
+
+
+def guess_marc_format(filename):
+    """'marcxml' if the file starts with '<' (after any whitespace), otherwise 'iso2709'."""
+    with open(filename, 'rb') as stream:
+        return 'marcxml' if stream.read(1024).lstrip().startswith(b'<') else 'iso2709'
+
+
+# The Enricher used by the worker processes, see `_init_worker`
+_worker_enricher = None
+
+
+def _init_worker(enricher):
+    global _worker_enricher
+    _worker_enricher = enricher
+
+
+def _enrich_iso2709(records):
+    return _worker_enricher.enrich_iso2709(records)
+
+
+def _enrich_marcxml(args):
+    return _worker_enricher.enrich_marcxml(*args)
+
+
+def ordered_map(executor, fn, iterable, window):
+    """
+    Like `executor.map`, but with at most `window` tasks submitted at a time,
+    so that a large input is not read into memory all at once.
+    """
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def enrich(vocabulary, source, target, vocabulary_code, format=None, jobs=1, overwrite=False, batch_size=500):
+    """
+    Reads bibliographic records from `source`, adds $0 to the subject fields
+    that can be resolved in `vocabulary`, and writes the records to `target`.
+    Returns an `EnrichmentReport`.
+
+        - vocabulary : `Vocabulary`
+        - vocabulary_code : the $2 value of the fields to link, e.g. 'noubomn'
+        - format : 'marcxml' or 'iso2709' (default: guessed from the content)
+        - jobs : number of worker processes (1: no workers)
+        - overwrite : replace existing $0 values
+        - batch_size : number of records per chunk sent to a worker
+    """
+    source = os.path.expanduser(source)
+    target = os.path.expanduser(target)
+    format = format or guess_marc_format(source)
+    if format not in ['marcxml', 'iso2709']:
+        raise ValueError('Unknown MARC format: {}'.format(format))
+
+    index = vocabulary.resources.heading_index()
+    enricher = Enricher(index, vocabulary.uri_codec, vocabulary_code, overwrite)
+    report = EnrichmentReport()
+    size = float(os.path.getsize(source)) or 1.
+    tmp = target + '.tmp'
+
+    with phase('enrich', format=format) as p, open(source, 'rb') as stream, open(tmp, 'wb') as out:
+        if format == 'iso2709':
+            splitter = None
+            chunks = iso2709_chunks(stream, batch_size)
+            fn = _enrich_iso2709
+        else:
+            splitter = MarcXmlSplitter(stream, batch_size)
+            chunks = ((splitter.header, chunk) for chunk in splitter.chunks())
+            fn = _enrich_marcxml
+
+        if jobs > 1:
+            executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(enricher,))
+            results = ordered_map(executor, fn, chunks, jobs * 2)
+        else:
+            executor = None
+            _init_worker(enricher)
+            results = (fn(chunk) for chunk in chunks)
+
+        try:
+            header_written = False
+            for data, chunk_report in track(results, 'enrich', fraction=lambda: stream.tell() / size):
+                if splitter is not None and not header_written:
+                    out.write(splitter.header)
+                    header_written = True
+                out.write(data)
+                report.merge(chunk_report)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if splitter is not None:
+            if not header_written:
+                out.write(splitter.header)
+            out.write(splitter.footer)
+        p.items = report.counts['records']
+
+    os.replace(tmp, target)
+    logger.info('Enriched %s: %s', source, report.summary(0))
+    return report
+
+
+def write_report(report, filename, limit=None):
+    """Writes an `EnrichmentReport` as JSON."""
+    with open(filename, 'wb') as stream:
+        stream.write(json.dumps(report.serialize(limit), indent=2, ensure_ascii=False).encode('utf-8'))
@@ -1,19 +1,249 @@
 import os.path
 import logging
 
+from .instrumentation import Instrumentation, phase, track
+
 logger = logging.getLogger(__name__)
 
 
+def commit(model):
+    """
+    Tells the model that its output is in place, for models keeping state about
+    what has been exported, like the manifest of an incremental `Marc21` export.
+    """
+    if hasattr(model, 'commit'):
+        model.commit()
+
+
+def remove_tmp(filename):
+    if os.path.isfile(filename + '.tmp'):
+        os.remove(filename + '.tmp')
+
+
 class PreparedExport(object):
 
-    def __init__(self, model):
+    def __init__(self, model, instrumentation=None):
         self.model = model
-        self.prepared_data = self.model.prepare()
+        self.instrumentation = instrumentation or Instrumentation()
+        with self.instrumentation.activate():
+            if hasattr(self.model, 'prepare'):
+                self.prepared_data = self.model.prepare()
+            else:
+                self.prepared_data = None
 
     def write(self, filename, **kwargs):
-        for k, v in self.prepared_data.items():
-            kwargs[k] = v
+        """
+        Writes to a temporary file that replaces `filename` when complete, and
+        then commits the export (see `commit`).
+        """
         filename = os.path.expanduser(filename)
-        with open(filename, 'wb') as f:
-            f.write(self.model.serialize(**kwargs))
+        tmp = filename + '.tmp'
+        with self.instrumentation.activate():
+            try:
+                if self.prepared_data is None:
+                    # Writer without a separate prepare step, stream directly to the file
+                    with open(tmp, 'wb') as f:
+                        self.model.write_resources(self.model.vocabulary.resources, f, **kwargs)
+                else:
+                    for k, v in self.prepared_data.items():
+                        kwargs[k] = v
+                    data = self.model.serialize(**kwargs)
+                    with phase('write', filename=filename) as p:
+                        with open(tmp, 'wb') as f:
+                            f.write(data)
+                        p.items = len(data)
+                os.replace(tmp, filename)
+            except Exception:
+                remove_tmp(filename)
+                raise
+            commit(self.model)
         logger.info('Export to {} complete'.format(filename))
+
+
+class ResourceValues(object):
+    """
+    Values derived from a resource that more than one writer needs. They are
+    computed on first use, so at most once per resource however many writers
+    `FanOutExport` passes the resource to.
+    """
+
+    def __init__(self, vocabulary, resource):
+        self.vocabulary = vocabulary
+        self.resource = resource
+        self._uri = self._dates = None
+
+    @property
+    def uri(self):
+        """The URI of the resource, or None if the vocabulary has no URI format."""
+        if self._uri is None and self.vocabulary.uri_format is not None:
+            self._uri = self.vocabulary.uri_codec.uri(self.resource['id'])
+        return self._uri
+
+    @property
+    def dates(self):
+        """(created, modified) as datetimes, modified being the deprecation date if any. Either may be None."""
+        if self._dates is None:
+            import isodate
+            resource = self.resource
+            created = modified = None
+            if resource.get('created'):
+                created = isodate.parse_datetime(resource.get('created'))
+            if resource.get('deprecated'):
+                modified = isodate.parse_datetime(resource.get('deprecated'))
+            elif resource.get('modified'):
+                modified = isodate.parse_datetime(resource.get('modified'))
+            self._dates = (created, modified)
+        return self._dates
+
+
+class StreamWriter(object):
+    """
+    Writes the output of a streaming model (Marc21, Roald3) to a file as the
+    resources are passed to it.
+    """
+
+    def __init__(self, model, filename):
+        self.model = model
+        self.filename = os.path.expanduser(filename)
+        self.stream = None
+
+    def begin(self, shared):
+        if hasattr(self.model, 'build_indexes'):
+            self.model.build_indexes(shared)
+        self.stream = open(self.filename + '.tmp', 'wb')
+        self.model.begin(self.stream)
+
+    def write_resource(self, resource, values=None):
+        self.model.write_resource(resource, values)
+
+    def end(self):
+        self.model.end()
+        self.stream.close()
+        os.replace(self.filename + '.tmp', self.filename)
+        logger.info('Export to {} complete'.format(self.filename))
+
+    def commit(self):
+        commit(self.model)
+
+    def abort(self):
+        if self.stream is not None:
+            self.stream.close()
+        remove_tmp(self.filename)
+
+
+class GraphWriter(object):
+    """
+    Builds a single graph from the resources passed to it, and serializes it
+    to one or more files, e.g. both Turtle and N-Triples.
+    """
+
+    def __init__(self, model, outputs):
+        """
+            - model : Skos object
+            - outputs : list of (filename, serialization format) tuples
+        """
+        self.model = model
+        self.outputs = [(os.path.expanduser(filename), fmt) for filename, fmt in outputs]
+        self.converted = False
+
+    def begin(self, shared):
+        graph = self.model.begin()
+        if self.model.workers is not None and self.model.workers > 1:
+            # Let the process pool do the conversion instead of the shared traversal
+            self.model.convert_resources(graph, self.model.scheme_uri)
+            self.converted = True
+
+    def write_resource(self, resource, values=None):
+        if not self.converted:
+            self.model.write_resource(resource, values)
+
+    def end(self):
+        graph = self.model.end()['graph']
+        for filename, fmt in self.outputs:
+            data = self.model.serialize(graph, format=fmt)
+            with phase('write', filename=filename) as p:
+                with open(filename + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(filename + '.tmp', filename)
+                p.items = len(data)
+            logger.info('Export to {} complete'.format(filename))
+
+    def commit(self):
+        commit(self.model)
+
+    def abort(self):
+        for filename, _ in self.outputs:
+            remove_tmp(filename)
+
+
+class BatchWriter(object):
+    """
+    Fallback for writers that only implement `write_resources`. These can't take
+    part in the shared traversal, so they get all the resources in a pass of
+    their own at the end.
+    """
+
+    def __init__(self, model, filename):
+        self.model = model
+        self.filename = os.path.expanduser(filename)
+
+    def begin(self, shared):
+        pass
+
+    def write_resource(self, resource, values=None):
+        pass
+
+    def end(self):
+        with open(self.filename + '.tmp', 'wb') as f:
+            self.model.write_resources(self.model.vocabulary.resources, f)
+        os.replace(self.filename + '.tmp', self.filename)
+        logger.info('Export to {} complete'.format(self.filename))
+
+    def commit(self):
+        commit(self.model)
+
+    def abort(self):
+        remove_tmp(self.filename)
+
+
+class FanOutExport(object):
+    """
+    Exports a vocabulary to several targets in a single traversal of its resources.
+    Each file is written to a temporary file that replaces it when complete.
+
+    Each resource is passed to all the writers in turn, so the vocabulary is
+    only walked once, and lookup tables that several writers need (like the
+    MARC21 'narrower' and 'replaces' tables) are only built once. Along with
+    each resource, the writers get a `ResourceValues` holding its URI and
+    parsed dates, computed once for all the writers.
+    """
+
+    def __init__(self, vocabulary, writers):
+        self.vocabulary = vocabulary
+        self.writers = writers
+
+    def write(self):
+        shared = {}
+        # Writers exporting a `VocabularyView` only get the resources in the view
+        includes = [getattr(writer.model.vocabulary, 'includes', None) for writer in self.writers]
+        try:
+            for writer in self.writers:
+                writer.begin(shared)
+
+            with phase('traverse', targets=len(self.writers)) as p:
+                for resource in track(self.vocabulary.resources, 'export'):
+                    values = ResourceValues(self.vocabulary, resource)
+                    for writer, include in zip(self.writers, includes):
+                        if include is None or include(resource):
+                            writer.write_resource(resource, values)
+                p.items = len(self.vocabulary.resources)
+
+            for writer in self.writers:
+                writer.end()
+        except Exception:
+            for writer in self.writers:
+                writer.abort()
+            raise
+        # Only when all the files are in place
+        for writer in self.writers:
+            writer.commit()
@@ -0,0 +1,277 @@
+# encoding=utf-8
+"""
+Per-phase timing and memory instrumentation of the load and export pipelines.
+
+Code that does a distinct step of the work wraps it in a phase:
+
+>>> with phase('skosify') as p:
+...     skosify_process(graph)
+...     p.items = len(graph)
+
+Phases are only recorded while an `Instrumentation` object is active (`Roald`
+activates its own during load, save and export); otherwise `phase` does nothing.
+
+Phase names used by Roald: 'parse', 'index', 'graph', 'skosify', 'serialize',
+'write' and 'traverse' (the shared pass of `Roald.export_many`). Phases can be
+nested, and each record names its parent phase.
+
+Each phase records `process_peak_rss_mb`, the peak memory use of the process
+so far (which later phases report too), and `peak_rss_increase_mb`, how much
+the phase raised that peak. The latter is 0 for phases that stayed below the
+peak of an earlier phase, and only then tells how much memory the phase needed.
+
+Long-running loops report their progress by iterating through `track`, which
+calls the `progress` function of the active Instrumentation, if any:
+
+>>> for record in track(records, 'marc21'):
+...     convert(record)
+"""
+import json
+import logging
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # Python < 3.7
+    class ContextVar(object):
+        """Minimal thread-local stand-in for contextvars.ContextVar."""
+
+        def __init__(self, name, default=None):
+            self.name = name
+            self.default = default
+            self.local = threading.local()
+
+        def get(self):
+            return getattr(self.local, 'value', self.default)
+
+        def set(self, value):
+            token = self.get()
+            self.local.value = value
+            return token
+
+        def reset(self, token):
+            self.local.value = token
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_active = ContextVar('roald_instrumentation', default=None)
+_stack = ContextVar('roald_instrumentation_stack', default=())
+
+
+def peak_rss_mb():
+    """The peak memory use of the process since it started, in MB, or None if unknown."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / 1024. / 1024.  # bytes
+    return rss / 1024.  # kilobytes
+
+
+class Phase(object):
+    """
+    A phase being measured. Set `items` to the number of items processed.
+    """
+
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.items = None
+
+
+class NullPhase(Phase):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+def phase(name, **tags):
+    """
+    Returns a context manager measuring the phase `name` in the active
+    Instrumentation, or doing nothing if none is active.
+
+        - tags : extra values to include in the record, like format='marc21'
+    """
+    instrumentation = _active.get()
+    if instrumentation is None:
+        return NullPhase(name, tags)
+    return instrumentation.phase(name, **tags)
+
+
+def track(iterable, name, total=None, fraction=None):
+    """
+    Returns `iterable`, wrapped so that progress is reported to the active
+    Instrumentation if it has a `progress` function.
+
+        - total : number of items (default: len(iterable), if it has a length)
+        - fraction : function returning the fraction of the work done (0-1),
+                     for when the number of items isn't known in advance,
+                     e.g. the position in a file being parsed
+    """
+    instrumentation = _active.get()
+    if instrumentation is None or instrumentation.progress is None:
+        return iterable
+    if total is None and fraction is None and hasattr(iterable, '__len__'):
+        total = len(iterable)
+    return instrumentation.track(iterable, name, total, fraction)
+
+
+class Instrumentation(object):
+    """
+    Records wall time, CPU time, peak RSS and item counts for each phase.
+
+    Example:
+
+    >>> roald = Roald()
+    >>> roald.instrumentation.add_callback(lambda record: statsd.send(record))
+    >>> roald.load('realfagstermer.json')
+    >>> roald.instrumentation.as_dict()
+    >>> roald.instrumentation.write_jsonl('phases.jsonl')
+    """
+
+    progress_interval = 0.5  # Minimum number of seconds between progress reports
+
+    def __init__(self, callbacks=None, progress=None):
+        """
+            - callbacks : list of functions to call with each phase record (a dict)
+            - progress : function to call with the progress of long-running loops
+                         (a dict with 'name', 'items', 'total', 'fraction', 'elapsed',
+                         'rate' (items/s), 'eta' (seconds) and 'finished')
+        """
+        super(Instrumentation, self).__init__()
+        self.records = []
+        self.callbacks = list(callbacks or [])
+        self.progress = progress
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def reset(self):
+        self.records = []
+
+    @contextmanager
+    def activate(self):
+        """Make this the instrumentation recording phases in the current context."""
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    @contextmanager
+    def phase(self, name, **tags):
+        stack = _stack.get()
+        record = Phase(name, tags)
+        token = _stack.set(stack + (name,))
+        error = None
+        t0 = time.perf_counter()
+        c0 = time.process_time()
+        rss0 = peak_rss_mb()
+        try:
+            yield record
+        except BaseException as err:
+            error = type(err).__name__
+            raise
+        finally:
+            wall = time.perf_counter() - t0
+            cpu = time.process_time() - c0
+            _stack.reset(token)
+            rss = peak_rss_mb()
+            data = {
+                'phase': name,
+                'parent': stack[-1] if stack else None,
+                'wall_seconds': round(wall, 6),
+                'cpu_seconds': round(cpu, 6),
+                'process_peak_rss_mb': rss,
+                'peak_rss_increase_mb': round(rss - rss0, 3) if rss is not None else None,
+                'items': record.items,
+            }
+            if error is not None:
+                data['error'] = error
+            data.update(record.tags)
+            self.add_record(data)
+
+    def track(self, iterable, name, total=None, fraction=None):
+        t0 = time.perf_counter()
+        last = t0
+        items = 0
+        for item in iterable:
+            yield item
+            items += 1
+            if items % 64 == 0:
+                now = time.perf_counter()
+                if now - last >= self.progress_interval:
+                    last = now
+                    self.report_progress(name, items, total, fraction, now - t0, False)
+        self.report_progress(name, items, total, fraction, time.perf_counter() - t0, True)
+
+    def report_progress(self, name, items, total, fraction, elapsed, finished):
+        if finished:
+            done = 1.
+        elif total:
+            done = float(items) / total
+        elif fraction is not None:
+            done = fraction()
+        else:
+            done = None
+        eta = None
+        if done:
+            eta = elapsed * (1. - done) / done
+        try:
+            self.progress({
+                'name': name,
+                'items': items,
+                'total': total,
+                'fraction': done,
+                'elapsed': elapsed,
+                'rate': items / elapsed if elapsed > 0 else None,
+                'eta': eta,
+                'finished': finished,
+            })
+        except Exception:
+            logger.exception('Progress callback failed')
+
+    def add_record(self, data):
+        self.records.append(data)
+        for callback in self.callbacks:
+            try:
+                callback(data)
+            except Exception:
+                logger.exception('Instrumentation callback failed')
+
+    def as_dict(self):
+        """
+        Returns the recorded phases, plus totals per phase name.
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['phase'], {'count': 0, 'wall_seconds': 0., 'cpu_seconds': 0., 'items': 0})
+            total['count'] += 1
+            total['wall_seconds'] += record['wall_seconds']
+            total['cpu_seconds'] += record['cpu_seconds']
+            total['items'] += record['items'] or 0
+        return {
+            'phases': list(self.records),
+            'totals': totals,
+            'process_peak_rss_mb': max([x['process_peak_rss_mb'] for x in self.records
+                                        if x['process_peak_rss_mb'] is not None] or [None]),
+        }
+
+    def to_jsonl(self):
+        """Returns the recorded phases as JSON lines, one record per line."""
+        return ''.join(json.dumps(record, sort_keys=True, default=str) + '\n' for record in self.records)
+
+    def write_jsonl(self, filename):
+        with open(filename, 'a') as stream:
+            stream.write(self.to_jsonl())
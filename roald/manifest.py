@@ -0,0 +1,87 @@
+# encoding=utf-8
+"""
+Content hashes of exported resources, used for incremental exports.
+
+A manifest maps resource IDs to a hash of everything that went into the
+exported output for the resource. Comparing the hashes from the previous run
+with the current ones tells which resources are new, changed or deleted.
+"""
+import hashlib
+import json
+import logging
+import os
+from six import text_type
+
+from .models.resources import Resource, Label
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    # Resources are hashed without the deep copy `Resource.serialize` makes
+    if isinstance(value, Resource):
+        return value._data
+    if isinstance(value, Label):
+        return value.serialize()
+    return text_type(value)
+
+
+def content_hash(data):
+    """Returns a hex digest of a JSON-serializable value, which may contain Resources and Labels."""
+    data = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def label_data(resource):
+    """The parts of a resource other resources use when referring to it: the types and labels."""
+    return {
+        'type': resource.get('type', []),
+        'prefLabel': resource.prefLabel,
+    }
+
+
+class Manifest(object):
+    """
+    Resource ID to content hash mapping, stored as JSON.
+    """
+
+    def __init__(self, hashes=None, format=None):
+        self.format = format
+        self.hashes = hashes or {}
+
+    @classmethod
+    def load(cls, filename, format=None):
+        """Loads a manifest, or returns an empty one if the file doesn't exist."""
+        filename = os.path.expanduser(filename)
+        if not os.path.isfile(filename):
+            logger.info('No manifest found at %s, exporting all resources', filename)
+            return cls(format=format)
+        with open(filename, 'rb') as stream:
+            data = json.loads(stream.read().decode('utf-8'))
+        if format is not None and data.get('format') != format:
+            raise ValueError('{} is a manifest for {}, not {}'.format(filename, data.get('format'), format))
+        return cls(data['hashes'], data.get('format'))
+
+    def save(self, filename):
+        """Saves the manifest. The file is replaced atomically."""
+        filename = os.path.expanduser(filename)
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as stream:
+            stream.write(json.dumps({'format': self.format, 'hashes': self.hashes},
+                                    sort_keys=True, indent=0).encode('utf-8'))
+        os.replace(tmp, filename)
+
+    def get(self, resource_id):
+        return self.hashes.get(resource_id)
+
+    def __setitem__(self, resource_id, value):
+        self.hashes[resource_id] = value
+
+    def __contains__(self, resource_id):
+        return resource_id in self.hashes
+
+    def __iter__(self):
+        return iter(sorted(self.hashes))
+
+    def __len__(self):
+        return len(self.hashes)
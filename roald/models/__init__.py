@@ -1,2 +1,4 @@
 from .resources import Resources, Concepts, Concept, Collection
 from .vocabulary import Vocabulary
+from .uri import UriCodec
+from .view import VocabularyView
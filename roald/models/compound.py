@@ -0,0 +1,99 @@
+# encoding=utf-8
+"""
+Labels of compound headings, made from the labels of their components once
+and shared by the term index in `Resources` and the exporters.
+
+>>> labels = resources.compound_headings.get('REAL022146')
+>>> labels.labels
+{'nb': 'Fornybar energi : Livssyklusanalyse'}
+>>> labels.subfields['nb']
+[('a', 'Fornybar energi'), ('x', 'Livssyklusanalyse')]
+"""
+
+
+class CompoundLabels(object):
+    """
+    The components of a compound heading and the labels made from them, in
+    each language all the components have a label in.
+    """
+
+    # MARC subfield codes for the components after the first one, by type
+    subfield_codes = {
+        'Topic': 'x',
+        'Temporal': 'y',
+        'Geographic': 'z',
+        'GenreForm': 'v',
+    }
+
+    def __init__(self, components, separator):
+        """
+            - components : the component resources, in order
+            - separator : the string the component labels are joined with
+        """
+        self.components = components
+        self.separator = separator
+        self.codes = ['a'] + [self.subfield_codes.get((x.get('type') or [None])[0]) for x in components[1:]]
+        self.labels = {}  # language: label
+        self.subfields = {}  # language: [(code, label), ...] (code is None for components of unknown type)
+        # In the order of the labels of the first component
+        for lang in components[0].prefLabel.keys():
+            values = [x.prefLabel.get(lang) for x in components]
+            if None in values:
+                continue
+            values = [x.value for x in values]
+            self.labels[lang] = separator.join(values)
+            self.subfields[lang] = list(zip(self.codes, values))
+        self._with_fallback = {}
+
+    def label(self, lang, fallback=None):
+        """
+        The label in `lang`, using the label in `fallback` for components that
+        don't have one in `lang`. None if a component has neither.
+        """
+        if lang in self.labels:
+            return self.labels[lang]
+        if (lang, fallback) not in self._with_fallback:
+            values = [x.prefLabel.get(lang, x.prefLabel.get(fallback)) for x in self.components]
+            label = None
+            if None not in values:
+                label = self.separator.join([x.value for x in values])
+            self._with_fallback[(lang, fallback)] = label
+        return self._with_fallback[(lang, fallback)]
+
+
+class CompoundHeadings(object):
+    """
+    `CompoundLabels` for the compound headings of a `Resources` object, made
+    on first use. Changes to the labels, types or components of a resource
+    (through `Resource.set`, `Resource.add` or `Concept.set_type`) drop the
+    labels of the compound headings it is part of.
+    """
+
+    def __init__(self, resources):
+        self.resources = resources
+        self._labels = {}  # compound heading ID: CompoundLabels
+        self._headings = {}  # component ID: IDs of the compound headings it is part of
+
+    def get(self, heading_id):
+        """
+        Returns the `CompoundLabels` for a compound heading. Raises KeyError if
+        the heading or one of its components is not found.
+        """
+        labels = self._labels.get(heading_id)
+        if labels is None:
+            component_ids = self.resources[heading_id]['component']
+            components = [self.resources[x] for x in component_ids]
+            labels = CompoundLabels(components, self.resources.string_separator)
+            self._labels[heading_id] = labels
+            for x in component_ids:
+                self._headings.setdefault(x, set()).add(heading_id)
+        return labels
+
+    def invalidate(self, resource_id):
+        """Drops the labels for `resource_id` and any compound heading it is a component of."""
+        self._labels.pop(resource_id, None)
+        for heading_id in self._headings.get(resource_id, ()):
+            self._labels.pop(heading_id, None)
+
+    def __len__(self):
+        return len(self._labels)
@@ -0,0 +1,130 @@
+# encoding=utf-8
+"""
+Lookup of subject headings, as found in bibliographic records, to resource IDs.
+
+>>> index = resources.heading_index()
+>>> index.lookup('650', [('a', 'Fornybar energi'), ('z', 'Norge')])
+'REAL022146'
+>>> index.authorize('$a Fornybar energi $z Norge')
+'REAL022146'
+>>> index.authorize('Fornybar energi : Norge')
+'REAL022146'
+"""
+import re
+import unicodedata
+from six import text_type
+
+from .compound import CompoundLabels
+
+# Bibliographic subject tags by type of the (first component of the) heading
+subject_tags = {
+    'Temporal': '648',
+    'Topic': '650',
+    'Geographic': '651',
+    'GenreForm': '655',
+}
+
+# The subfields holding parts of a heading
+heading_codes = ['a'] + sorted(set(CompoundLabels.subfield_codes.values()))
+
+# In place of the ID for headings shared by more than one resource. Compared by
+# value rather than identity, since the index is pickled for worker processes.
+AMBIGUOUS = ''
+
+
+def normalize(value):
+    """Case, Unicode normalization form and whitespace differences are ignored when comparing headings."""
+    return ' '.join(unicodedata.normalize('NFC', text_type(value)).lower().split())
+
+
+def parse_subfields(value):
+    """Splits '$a Fornybar energi $z Norge' into [('a', 'Fornybar energi'), ('z', 'Norge')]."""
+    return [(code, part.strip()) for code, part in re.findall(r'\$(\w)([^$]*)', value)]
+
+
+class HeadingIndex(object):
+    """
+    Maps the preferred labels of resources in all languages, and for compound
+    headings the subfields made from the labels of their components, to IDs.
+    Deprecated resources, and resources of other types than those having a
+    bibliographic subject tag, are left out. Headings shared by more than one
+    resource are not resolved.
+    """
+
+    def __init__(self):
+        self.by_subfields = {}  # (tag, ((code, normalized value), ...)): ID
+        self.by_label = {}  # normalized label: ID
+
+    @classmethod
+    def build(cls, resources):
+        """
+            - resources : `Resources`
+        """
+        index = cls()
+        for resource in resources:
+            if resource.get('deprecated'):
+                continue
+            rid = resource['id']
+            if 'component' in resource:
+                try:
+                    compound = resources.compound_headings.get(rid)
+                except KeyError:
+                    continue
+                tag = subject_tags.get((compound.components[0].get('type') or [None])[0])
+                if tag is None:
+                    continue
+                for lang, subfields in compound.subfields.items():
+                    index.add(rid, tag, subfields, compound.labels[lang])
+            else:
+                tag = subject_tags.get((resource.get('type') or [None])[0])
+                if tag is None:
+                    continue
+                for lang, label in resource.prefLabel.items():
+                    index.add(rid, tag, [('a', label.value)], label.value)
+        return index
+
+    @staticmethod
+    def key(tag, subfields):
+        return (tag, tuple((code, normalize(value)) for code, value in subfields if code in heading_codes))
+
+    def add(self, resource_id, tag, subfields, label):
+        for table, key in [(self.by_subfields, self.key(tag, subfields)), (self.by_label, normalize(label))]:
+            if table.get(key, resource_id) != resource_id:
+                table[key] = AMBIGUOUS
+            else:
+                table[key] = resource_id
+
+    @staticmethod
+    def _found(resource_id):
+        return None if resource_id == AMBIGUOUS else resource_id
+
+    def lookup(self, tag, subfields):
+        """
+        Returns the ID for a heading given as a subject tag ('650') and a list of
+        (code, value) subfields, or None. Subfields other than $a, $v, $x, $y and $z
+        are ignored.
+        """
+        return self._found(self.by_subfields.get(self.key(tag, subfields)))
+
+    def is_ambiguous(self, tag, subfields):
+        return self.by_subfields.get(self.key(tag, subfields)) == AMBIGUOUS
+
+    def lookup_label(self, label):
+        """Returns the ID for a label, like 'Fornybar energi : Norge', or None."""
+        return self._found(self.by_label.get(normalize(label)))
+
+    def authorize(self, value, tag=None, separator=' : '):
+        """
+        Returns the ID for a heading given as a label ('Fornybar energi : Norge')
+        or as subfields ('$a Fornybar energi $z Norge'), or None. Without `tag`,
+        subfields are matched by their values only.
+        """
+        if '$' not in value:
+            return self.lookup_label(value)
+        subfields = parse_subfields(value)
+        if tag is not None:
+            return self.lookup(tag, subfields)
+        return self.lookup_label(separator.join([x[1] for x in subfields if x[0] in heading_codes]))
+
+    def __len__(self):
+        return len(self.by_subfields)
@@ -0,0 +1,225 @@
+# encoding=utf-8
+"""
+Transitive hierarchy queries over broader-like relations.
+
+>>> hierarchy = resources.hierarchy()
+>>> hierarchy.ancestors('REAL013995')
+['REAL012789', 'REAL000001']
+>>> hierarchy.is_ancestor('REAL000001', 'REAL013995')
+True
+>>> hierarchy.write_closure('closure.csv')
+"""
+import csv
+import io
+import json
+import logging
+import os
+from six import PY2
+
+logger = logging.getLogger(__name__)
+
+
+class Hierarchy(object):
+    """
+    The transitive closure of one or more relations pointing upwards in the
+    hierarchy, such as 'broader', 'memberOf' and 'superOrdinate'.
+
+    Since a concept can have several broader concepts, the hierarchy is not a
+    tree, and interval labels can't describe it exactly. Instead, the ancestors
+    of each resource are materialized once, with the length of the shortest
+    path to each of them, which makes `is_ancestor` and `ancestors` dict
+    lookups. Descendants are made from the same table on first use. Relations
+    forming a cycle are ignored where the cycle is found, with a warning.
+
+    Made by `Resources.hierarchy`. When the relations of a resource change,
+    `update` recomputes the resource and its descendants only; a new one is
+    made when more resources are loaded, or when there are cycles.
+    """
+
+    default_keys = ['broader', 'memberOf', 'superOrdinate']
+
+    def __init__(self, resources, keys=None):
+        """
+            - resources : `Resources`
+            - keys : the relations to follow (default: `default_keys`)
+        """
+        self.resources = resources
+        self.keys = list(keys or self.default_keys)
+        self.id_table = resources.id_table
+        self._tables = [resources.relations(key) for key in self.keys]
+        self._changed = {}  # parent numbers of resources changed since the tables were made
+        self.cycles = 0  # the number of relations ignored since they form cycles
+        self._ancestors = self._closure()
+        self._descendants = None
+
+    def _parents(self, n):
+        if n in self._changed:
+            return self._changed[n]
+        parents = []
+        for table in self._tables:
+            parents.extend(table.get(n))
+        return parents
+
+    def _closure(self):
+        """Returns a list giving, for each ID number, a dict of ancestor numbers to distances."""
+        size = len(self.id_table)
+        ancestors = [None] * size
+        visiting = set()
+        ignored = 0
+        for start in range(size):
+            if ancestors[start] is not None:
+                continue
+            # Depth-first, so the parents of a resource are done before the resource
+            visiting.add(start)
+            stack = [(start, iter(self._parents(start)))]
+            while stack:
+                node, parents = stack[-1]
+                for parent in parents:
+                    if ancestors[parent] is not None:
+                        continue
+                    if parent in visiting:
+                        ignored += 1
+                        continue
+                    visiting.add(parent)
+                    stack.append((parent, iter(self._parents(parent))))
+                    break
+                else:
+                    stack.pop()
+                    visiting.discard(node)
+                    ancestors[node] = self._merge_parents(node, ancestors)
+        if ignored:
+            logger.warning('Ignored %d relations forming cycles in the hierarchy (%s)',
+                           ignored, ', '.join(self.keys))
+        self.cycles = ignored
+        return ancestors
+
+    def _merge_parents(self, node, ancestors):
+        """Returns the ancestors of `node` with distances, from those of its parents."""
+        result = {}
+        for parent in self._parents(node):
+            if ancestors[parent] is None:
+                continue  # part of a cycle
+            result[parent] = 1
+            for ancestor, distance in ancestors[parent].items():
+                if distance + 1 < result.get(ancestor, distance + 2):
+                    result[ancestor] = distance + 1
+        return result
+
+    def _descendant_table(self):
+        if self._descendants is None:
+            self._descendants = [{} for _ in self._ancestors]
+            for n, ancestors in enumerate(self._ancestors):
+                for ancestor, distance in ancestors.items():
+                    self._descendants[ancestor][n] = distance
+        return self._descendants
+
+    def update(self, resource):
+        """
+        Updates the closure after the relations of `resource` have changed, by
+        recomputing the ancestors of the resource and its descendants, parents
+        before children. Returns False, leaving the hierarchy as it was, if the
+        hierarchy has or would get a cycle, in which case a new one must be made.
+        """
+        if self.cycles:
+            return False
+        n = self._number(resource['id'])
+        parents = []
+        for key in self.keys:
+            parents.extend([self.id_table.intern(x) for x in resource.get(key, [])])
+
+        descendants = self._descendant_table()
+        affected = set(descendants[n])
+        affected.add(n)
+        if any(parent in affected for parent in parents):
+            return False
+        while len(self._ancestors) < len(self.id_table):
+            # IDs not seen before, like when the tables are made
+            self._ancestors.append({})
+            descendants.append({})
+        self._changed[n] = parents
+
+        children = {x: [] for x in affected}
+        waiting = {x: 0 for x in affected}
+        for node in affected:
+            for parent in self._parents(node):
+                if parent in affected:
+                    children[parent].append(node)
+                    waiting[node] += 1
+        ready = [n]
+        while ready:
+            node = ready.pop()
+            for ancestor in self._ancestors[node]:
+                del descendants[ancestor][node]
+            self._ancestors[node] = self._merge_parents(node, self._ancestors)
+            for ancestor, distance in self._ancestors[node].items():
+                descendants[ancestor][node] = distance
+            for child in children[node]:
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    ready.append(child)
+        return True
+
+    def _number(self, resource_id):
+        n = self.id_table.number(resource_id)  # KeyError for unknown IDs
+        if n >= len(self._ancestors):
+            raise KeyError(resource_id)
+        return n
+
+    def _sorted(self, numbers):
+        return [self.id_table[n] for n, _ in sorted(numbers.items(), key=lambda x: (x[1], self.id_table[x[0]]))]
+
+    def ancestors(self, resource_id):
+        """The IDs of all ancestors of `resource_id`, nearest first."""
+        return self._sorted(self._ancestors[self._number(resource_id)])
+
+    def descendants(self, resource_id):
+        """The IDs of all descendants of `resource_id`, nearest first."""
+        return self._sorted(self._descendant_table()[self._number(resource_id)])
+
+    def is_ancestor(self, ancestor, resource_id):
+        """Whether `ancestor` is above `resource_id` in the hierarchy."""
+        return self.id_table.number(ancestor) in self._ancestors[self._number(resource_id)]
+
+    def depth(self, resource_id):
+        """The length of the shortest path from `resource_id` up to a top resource (0 for top resources)."""
+        ancestors = self._ancestors[self._number(resource_id)]
+        return min([distance for ancestor, distance in ancestors.items() if not self._ancestors[ancestor]] or [0])
+
+    def closure(self):
+        """
+        Yields (id, ancestor, distance) for each resource and each of its
+        ancestors, ordered by ID and then distance.
+        """
+        for resource_id in sorted(x['id'] for x in self.resources):
+            ancestors = self._ancestors[self._number(resource_id)]
+            for n, distance in sorted(ancestors.items(), key=lambda x: (x[1], self.id_table[x[0]])):
+                yield resource_id, self.id_table[n], distance
+
+    def write_closure(self, filename, format=None):
+        """
+        Writes the closure table for hierarchical facets.
+
+            - format : 'csv' (columns id, ancestor, distance) or 'json' (an object
+                       mapping each ID to a list of its ancestors, nearest first).
+                       Default: from the file extension.
+        """
+        if format is None:
+            format = 'json' if filename.endswith('.json') else 'csv'
+        if format not in ['csv', 'json']:
+            raise ValueError('Unknown closure format: {}'.format(format))
+
+        tmp = filename + '.tmp'
+        if format == 'csv':
+            with (open(tmp, 'wb') if PY2 else io.open(tmp, 'w', encoding='utf-8', newline='')) as stream:
+                writer = csv.writer(stream)
+                writer.writerow(['id', 'ancestor', 'distance'])
+                for row in self.closure():
+                    writer.writerow(row)
+        else:
+            data = {x['id']: [] for x in self.resources}
+            for resource_id, ancestor, distance in self.closure():
+                data[resource_id].append(ancestor)
+            with open(tmp, 'wb') as stream:
+                stream.write(json.dumps(data, sort_keys=True, indent=0).encode('utf-8'))
+        os.replace(tmp, filename)
+        logger.info('Wrote hierarchy closure to %s', filename)
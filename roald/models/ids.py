@@ -0,0 +1,116 @@
+# encoding=utf-8
+"""
+Dense integer numbering of resource IDs, and relations as integer arrays.
+
+The resources keep their relations as lists of string IDs, which is what the
+adapters and the Roald3 format use. `Resources.load` interns the IDs, so each
+ID is a single string object shared by the resource and all relation lists
+referring to it. For traversals, `Resources.relations` gives a relation
+for all resources at once as `array('i')` of ID numbers.
+"""
+from array import array
+from six.moves import intern
+
+
+class IdTable(object):
+    """
+    Maps string IDs to dense integers (0, 1, 2, ...) in the order they are seen,
+    and back.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.numbers = {}
+
+    def intern(self, resource_id):
+        """Returns the number for `resource_id`, adding it to the table if needed."""
+        n = self.numbers.get(resource_id)
+        if n is None:
+            n = len(self.ids)
+            try:
+                resource_id = intern(resource_id)
+            except TypeError:  # not a str, e.g. unicode on Python 2
+                pass
+            self.ids.append(resource_id)
+            self.numbers[resource_id] = n
+        return n
+
+    def canonical(self, resource_id):
+        """Returns the shared string object for `resource_id`, adding it to the table if needed."""
+        return self.ids[self.intern(resource_id)]
+
+    def number(self, resource_id):
+        """Returns the number for `resource_id`. Raises KeyError if it is not in the table."""
+        return self.numbers[resource_id]
+
+    def __getitem__(self, n):
+        return self.ids[n]
+
+    def __contains__(self, resource_id):
+        return resource_id in self.numbers
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class RelationTable(object):
+    """
+    A relation (like 'broader') for all resources, stored as integer arrays in
+    compressed sparse row form: the targets of the resource numbered n are
+    `targets[offsets[n]:offsets[n + 1]]`.
+    """
+
+    def __init__(self, key, offsets, targets):
+        self.key = key
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def build(cls, key, resources, id_table):
+        """
+            - key : relation, like 'broader'
+            - resources : iterable of resources, all present in `id_table`
+            - id_table : IdTable, extended with any targets not yet in it
+        """
+        by_number = {}
+        for resource in resources:
+            values = resource.get(key)
+            if values:
+                by_number[id_table.number(resource['id'])] = [id_table.intern(x) for x in values]
+
+        offsets = array('i', [0])
+        targets = array('i')
+        for n in range(len(id_table)):
+            targets.extend(by_number.get(n, []))
+            offsets.append(len(targets))
+        return cls(key, offsets, targets)
+
+    def __len__(self):
+        """The number of resource numbers covered."""
+        return len(self.offsets) - 1
+
+    def get(self, n):
+        """The target numbers for the resource numbered n."""
+        if n >= len(self):
+            return self.targets[0:0]
+        return self.targets[self.offsets[n]:self.offsets[n + 1]]
+
+    def inverse(self):
+        """Returns the inverse relation (e.g. 'narrower' for 'broader') as a RelationTable."""
+        size = len(self)
+        for x in self.targets:
+            size = max(size, x + 1)
+        counts = array('i', [0]) * (size + 1)
+        for x in self.targets:
+            counts[x + 1] += 1
+        for n in range(size):
+            counts[n + 1] += counts[n]
+        offsets = array('i', counts)
+
+        targets = array('i', [0]) * len(self.targets)
+        position = array('i', offsets)
+        for source in range(len(self)):
+            for x in self.targets[self.offsets[source]:self.offsets[source + 1]]:
+                targets[position[x]] = source
+                position[x] += 1
+        return RelationTable(self.key + '^-1', offsets, targets)
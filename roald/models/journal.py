@@ -0,0 +1,142 @@
+# encoding=utf-8
+"""
+Append-only journal of changes to a Resources collection.
+
+The journal is stored next to a Roald3 snapshot, as '<snapshot>.journal', one
+JSON object per line. The first line identifies the snapshot by its SHA-1, so
+a journal left behind after the snapshot has been rewritten is never replayed
+on top of it. Each following line records a change made through
+`Resources.load`, `Resource.set`, `Resource.add`, `Resource.replace`,
+`Resource.delete` or `Concept.set_type`:
+
+    {"op": "load", "resource": {...}}
+    {"op": "set", "id": "REAL001", "key": "prefLabel.en", "value": {"value": "Char"}, "label": true}
+    {"op": "add", "id": "REAL001", "key": "broader", "value": "REAL002"}
+    {"op": "replace", "id": "REAL001", "key": "type", "value": ["Geographic"]}
+    {"op": "delete", "id": "REAL001", "key": "usageCount", "value": null}
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+
+from .resources import Label
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Journal(object):
+    """
+    Changes not yet in the snapshot. Changes are recorded in memory, and
+    appended to the journal file by `flush`.
+    """
+
+    def __init__(self, snapshot, snapshot_digest, format='roald3'):
+        """
+            - snapshot : filename of the Roald3 snapshot
+            - snapshot_digest : SHA-1 of the snapshot
+            - format : format of the snapshot ('roald3' or 'roald3-jsonl')
+        """
+        self.snapshot = os.path.abspath(os.path.expanduser(snapshot))
+        self.filename = self.snapshot + '.journal'
+        self.snapshot_digest = snapshot_digest
+        self.format = format
+        self.pending = []
+
+    def record_load(self, resource):
+        self.pending.append({'op': 'load', 'resource': resource.serialize()})
+
+    def record(self, op, resource_id, key, value):
+        entry = {'op': op, 'id': resource_id, 'key': key}
+        if isinstance(value, Label):
+            entry['value'] = value.serialize()
+            entry['label'] = True
+        else:
+            entry['value'] = value
+        self.pending.append(entry)
+
+    def flush(self):
+        """Appends the pending changes to the journal file. Returns the number of changes written."""
+        if not self.pending:
+            return 0
+        with io.open(self.filename, 'ab') as stream:
+            entries = self.pending
+            if stream.tell() == 0:
+                entries = [{'snapshot': self.snapshot_digest}] + entries
+            # In a single write, so that a failed flush can be retried without duplicating entries
+            stream.write(b''.join([self.dumps(entry) for entry in entries]))
+        n = len(self.pending)
+        self.pending = []
+        return n
+
+    @staticmethod
+    def dumps(entry):
+        return (json.dumps(entry, sort_keys=True, ensure_ascii=False) + '\n').encode('utf-8')
+
+    def compacted(self, snapshot_digest):
+        """
+        Call when a new snapshot including all changes has been written. The
+        journal file is removed.
+        """
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+        self.snapshot_digest = snapshot_digest
+        self.pending = []
+
+    @staticmethod
+    def replay(snapshot, snapshot_digest, resources, selection=None):
+        """
+        Applies the changes from the journal of `snapshot` to `resources`, if
+        the journal belongs to this version of the snapshot. Returns the number
+        of changes applied.
+
+            - selection : the `roald.selection.Selection` the snapshot was loaded
+                          with, if any. Changes to resources or fields that were
+                          not loaded are skipped.
+        """
+        filename = os.path.abspath(os.path.expanduser(snapshot)) + '.journal'
+        if not os.path.isfile(filename):
+            return 0
+        with io.open(filename, 'r', encoding='utf-8') as stream:
+            entries = [json.loads(line) for line in stream if line.strip()]
+        if not entries or entries[0].get('snapshot') != snapshot_digest:
+            logger.warning('Ignoring %s, since it was made for another version of the snapshot', filename)
+            return 0
+
+        loads = []
+        for entry in entries[1:]:
+            if entry['op'] == 'load':
+                # Load consecutive resources in one go
+                loads.append(entry['resource'])
+                continue
+            if loads:
+                resources.load(loads if selection is None else selection.apply(loads))
+                loads = []
+            if selection is not None and (entry['id'] not in resources or not selection.wants(entry['key'])):
+                continue
+            value = entry['value']
+            if entry.get('label'):
+                value = Label().load(value)
+            resource = resources.get(id=entry['id'])
+            if entry['op'] == 'set':
+                resource.set(entry['key'], value)
+            elif entry['op'] == 'replace':
+                resource.replace(entry['key'], value)
+            elif entry['op'] == 'delete':
+                resource.delete(entry['key'])
+            else:
+                resource.add(entry['key'], value)
+        if loads:
+            resources.load(loads if selection is None else selection.apply(loads))
+
+        logger.info('Replayed %d changes from %s', len(entries) - 1, filename)
+        return len(entries) - 1
@@ -1,16 +1,20 @@
 # encoding=utf-8
-import isodate
 import json
 import codecs
+import logging
+from bisect import bisect_left, bisect_right, insort
 from copy import deepcopy
-from six import text_type
+from six import text_type, binary_type, string_types
 from ..util import array_set, array_add, array_get
 from ..errors import InvalidDataException
+from ..instrumentation import phase
+from .compound import CompoundHeadings
+from .headings import HeadingIndex
+from .hierarchy import Hierarchy
+from .ids import IdTable, RelationTable
+from .validation import validate_references
 
-try:
-    from functools import reduce  # Python
-except:
-    pass
+logger = logging.getLogger(__name__)
 
 class Label(object):
 
@@ -53,6 +57,9 @@ class Label(object):
 
 class Resource(object):
 
+    journal = None  # Journal recording changes, set by `Resources.attach_journal`
+    owner = None  # Resources object to notify of changes, set by `Resources.load`
+
     def __init__(self, uri_formatter=None):
         super(Resource, self).__init__()
         self.blank = True
@@ -122,14 +129,54 @@ class Resource(object):
     def add(self, key, value):
         self.blank = False
         array_add(self._data, key, value)
+        if self.journal is not None:
+            self.journal.record('add', self._data.get('id'), key, value)
+        if self.owner is not None:
+            self.owner._resource_changed(self, key)
         return self  # for chaining
 
     def set(self, key, value):
         self.blank = False
         if key.split('.')[0] in ['prefLabel', 'altLabel', 'hiddenLabel'] and not isinstance(value, Label):
-            array_set(self._data, key, Label(value), False)
-        else:
-            array_set(self._data, key, value, False)
+            value = Label(value)
+        array_set(self._data, key, value, False)
+        if self.journal is not None:
+            self.journal.record('set', self._data.get('id'), key, value)
+        if self.owner is not None:
+            self.owner._resource_changed(self, key)
+        return self  # for chaining
+
+    def replace(self, key, value):
+        """Like `set`, but replaces any existing value."""
+        self.blank = False
+        if key.split('.')[0] in ['prefLabel', 'altLabel', 'hiddenLabel'] and not isinstance(value, Label):
+            value = Label(value)
+        keys = key.split('.')
+        data = self._data
+        for k in keys[:-1]:
+            data = data.setdefault(k, {})
+        data[keys[-1]] = value
+        if self.journal is not None:
+            self.journal.record('replace', self._data.get('id'), key, value)
+        if self.owner is not None:
+            self.owner._resource_changed(self, key)
+        return self  # for chaining
+
+    def delete(self, key):
+        """Removes `key`, if set."""
+        keys = key.split('.')
+        data = self._data
+        for k in keys[:-1]:
+            data = data.get(k)
+            if not isinstance(data, dict):
+                return self
+        if keys[-1] not in data:
+            return self
+        del data[keys[-1]]
+        if self.journal is not None:
+            self.journal.record('delete', self._data.get('id'), key, None)
+        if self.owner is not None:
+            self.owner._resource_changed(self, key)
         return self  # for chaining
 
     def get(self, key, default=None):
@@ -144,6 +191,9 @@ class Resource(object):
     def __getattr__(self, name):
         if name in ['__bases__']:
             return object.__getattr__(name)
+        if name == '_data':
+            # Not set yet, e.g. during unpickling
+            raise AttributeError(name)
         if name in self._data:
             return self._data[name]
         raise AttributeError
@@ -205,9 +255,87 @@ class Concept(Resource):
         #    conceptTypes.append('Topic')
 
         self._data['type'] = conceptTypes
+        if self.journal is not None:
+            self.journal.record('replace', self._data.get('id'), 'type', conceptTypes)
+        if self.owner is not None:
+            self.owner._resource_changed(self, 'type')
         return self  # for chaining
 
 
+class FieldIndex(object):
+    """
+    Secondary index from the values of a field to resource IDs, used by
+    `Resources.find`. Labels are indexed by their value.
+    """
+
+    def __init__(self, key, presence=False):
+        """
+            - key : field, like 'type' or 'prefLabel.nb'
+            - presence : index whether the field is present and non-empty, rather than its values
+        """
+        self.key = key
+        self.field = key.split('.')[0]
+        self.presence = presence
+        self.ids_by_value = {}
+        self.values_by_id = {}
+        self.sorted_values = None  # Made on the first range query
+
+    def values(self, resource):
+        value = resource.get(self.key)
+        if self.presence:
+            return set([True]) if value not in [None, '', [], {}] else set()
+        if value is None:
+            return set()
+        if not isinstance(value, list):
+            value = [value]
+        return set(x.value if isinstance(x, Label) else x for x in value if not isinstance(x, dict))
+
+    def add(self, resource):
+        rid = resource['id']
+        values = self.values(resource)
+        self.values_by_id[rid] = values
+        for value in values:
+            if value not in self.ids_by_value:
+                self.ids_by_value[value] = set()
+                if self.sorted_values is not None:
+                    insort(self.sorted_values, value)
+            self.ids_by_value[value].add(rid)
+
+    def remove(self, rid):
+        for value in self.values_by_id.pop(rid, []):
+            ids = self.ids_by_value[value]
+            ids.discard(rid)
+            if len(ids) == 0:
+                del self.ids_by_value[value]
+                if self.sorted_values is not None:
+                    del self.sorted_values[bisect_left(self.sorted_values, value)]
+
+    def update(self, resource):
+        self.remove(resource['id'])
+        self.add(resource)
+
+    def lookup(self, op, value):
+        """Returns the set of IDs matching `op` ('eq', 'in', 'gte', 'gt', 'lte' or 'lt') and `value`."""
+        if op == 'eq':
+            return self.ids_by_value.get(value, set())
+        if op == 'in':
+            return set().union(*[self.ids_by_value.get(x, set()) for x in value])
+        if op not in ['gte', 'gt', 'lte', 'lt']:
+            raise ValueError('Unknown operator: {}'.format(op))
+
+        if self.sorted_values is None:
+            self.sorted_values = sorted(self.ids_by_value.keys())
+        if op == 'gte':
+            values = self.sorted_values[bisect_left(self.sorted_values, value):]
+        elif op == 'gt':
+            values = self.sorted_values[bisect_right(self.sorted_values, value):]
+        elif op == 'lte':
+            values = self.sorted_values[:bisect_right(self.sorted_values, value)]
+        else:
+            values = self.sorted_values[:bisect_left(self.sorted_values, value)]
+        return set().union(*[self.ids_by_value[x] for x in values])
+
+
 class Resources(object):
     """
     Resources class
@@ -215,6 +343,10 @@ class Resources(object):
 
     string_separator = ' : '
 
+    # Fields holding IDs of other resources
+    relation_keys = ['broader', 'related', 'replacedBy', 'component', 'memberOf', 'superOrdinate',
+                     'plusUseTerm', 'member']
+
     def __init__(self, uri_format=None):
         """
             - data: dict
@@ -222,6 +354,7 @@ class Resources(object):
         """
         super(Resources, self).__init__()
         self._uri_format = uri_format
+        self.journal = None
         self.reset()
 
     @property
@@ -247,6 +380,14 @@ class Resources(object):
         return self._resources
 
     def reset(self):
+        self.id_table = IdTable()  # ID numbers, see `relations`
+        self._relations = {}  # relation tables, made on first use
+        self._hierarchies = {}  # see `hierarchy`
+        self.validation = None  # see `validate`
+        self.compound_headings = CompoundHeadings(self)  # labels of compound headings
+        self._heading_index = None  # see `heading_index`
+        self._incomplete_compound_headings = set()  # IDs of compound headings with components not yet loaded
+        self._indexes = {}  # secondary indexes for `find`, made on first use
         self._resources = []  # data container
         self._resource_from_id = {}  # fast lookup hash
         self._id_from_term = {}  # fast lookup hash
@@ -254,11 +395,12 @@ class Resources(object):
 
     def load(self, data):
         """
-            data: dict
+            data: iterable of Resource objects or dicts, e.g. a list or a generator
         """
-        if type(data) is not list:
+        if isinstance(data, (dict, text_type, binary_type)) or not hasattr(data, '__iter__'):
             raise InvalidDataException()
 
+        loaded = []
         for el in data:
             rid = el['id']
 
@@ -276,27 +418,179 @@ class Resources(object):
                 else:
                     instance = Concept().load(el)
 
+            # Share a single string object per ID
+            rid = instance._data['id'] = self.id_table.canonical(rid)
+            for key in self.relation_keys:
+                if key in instance._data:
+                    instance._data[key] = [self.id_table.canonical(x) for x in instance._data[key]]
+
             self._resources.append(instance)
+            loaded.append(instance)
             self._resource_from_id[rid] = instance
+            instance.owner = self
+            for index in self._indexes.values():
+                index.add(instance)
+            if self.journal is not None:
+                instance.journal = self.journal
+                self.journal.record_load(instance)
 
             for lang, label in instance.prefLabel.items():
                 array_set(self._id_from_term, text_type('{}.{}').format(label.value, lang), rid)
                 array_set(self._term_from_id, text_type('{}.{}').format(rid, lang), label.value)
 
-        for res in self._resources:
+        self._relations = {}
+        self._hierarchies = {}
+        self._heading_index = None
+        self.validation = None
+
+        with phase('index') as p:
+            p.items = self._index_compound_headings(loaded)
+
+        return self  # make chainable
+
+    def find(self, **criteria):
+        """
+        Returns the resources matching all the criteria, sorted by ID.
+
+        >>> resources.find(type='Topic', modified__gte='2020-01-01', has='mappings.exactMatch', libCode='k')
+
+        Criteria are given as
+
+            - field=value : the field has the value (or, for a list, contains it).
+                            Labels are compared by their value.
+            - field__op=value : op is 'in' (one of a list of values), 'gte', 'gt', 'lte' or 'lt'
+            - has=field : the field (or each of a list of fields) is present and not empty
+
+        Fields with dots are given as `**{'prefLabel.nb': 'Atlas'}`. An index
+        is made for each field the first time it is queried, and kept up to
+        date by `load`, `Resource.set`, `Resource.add` and `Concept.set_type`.
+        Changes made to a resource's data in other ways are not seen.
+        """
+        result = None
+        for name, value in criteria.items():
+            if name == 'has':
+                keys = [value] if isinstance(value, string_types) else value
+                lookups = [self._index(key, True).lookup('eq', True) for key in keys]
+            else:
+                key, _, op = name.partition('__')
+                lookups = [self._index(key).lookup(op or 'eq', value)]
+            for ids in lookups:
+                result = ids if result is None else result & ids
+        if result is None:
+            return list(self._resources)
+        return [self._resource_from_id[x] for x in sorted(result)]
+
+    def _index(self, key, presence=False):
+        if (key, presence) not in self._indexes:
+            index = FieldIndex(key, presence)
+            for resource in self._resources:
+                index.add(resource)
+            self._indexes[(key, presence)] = index
+        return self._indexes[(key, presence)]
+
+    def relations(self, key):
+        """
+        Returns a relation, like 'broader', for all resources as a
+        `roald.models.ids.RelationTable` of ID numbers from `id_table`. The
+        table is made on first use, and remade after changes to the relation.
+
+        >>> table = resources.relations('broader')
+        >>> [resources.id_table[x] for x in table.get(resources.id_table.number('REAL013995'))]
+        ['REAL012789']
+        """
+        if key not in self._relations:
+            self._relations[key] = RelationTable.build(key, self._resources, self.id_table)
+        return self._relations[key]
+
+    def hierarchy(self, keys=None):
+        """
+        Returns a `roald.models.hierarchy.Hierarchy` for ancestor and descendant
+        queries over `keys` (default: 'broader', 'memberOf' and 'superOrdinate').
+        It is made on first use, updated after changes to those relations (see
+        `Hierarchy.update`), and remade when more resources are loaded.
+
+        >>> resources.hierarchy().is_ancestor('REAL012789', 'REAL013995')
+        True
+        """
+        keys = tuple(keys or Hierarchy.default_keys)
+        if keys not in self._hierarchies:
+            with phase('hierarchy'):
+                self._hierarchies[keys] = Hierarchy(self, keys)
+        return self._hierarchies[keys]
+
+    def heading_index(self):
+        """
+        Returns a `roald.models.headings.HeadingIndex` for looking up subject
+        headings from bibliographic records. It is made on first use, and
+        remade after changes to labels, types, components or deprecation.
+        """
+        if self._heading_index is None:
+            with phase('heading_index') as p:
+                self._heading_index = HeadingIndex.build(self)
+                p.items = len(self._heading_index)
+        return self._heading_index
+
+    def validate(self):
+        """
+        Checks that all references to other resources resolve, and returns a
+        `roald.models.validation.ValidationReport`. The report is kept as
+        `validation` until more resources are loaded or a resource is changed.
+        """
+        with phase('validate') as p:
+            self.validation = validate_references(self)
+            p.items = self.validation.checked
+        return self.validation
+
+    def _resource_changed(self, resource, key):
+        field = key.split('.')[0]
+        self._relations.pop(field, None)
+        self.validation = None
+        if field in ['prefLabel', 'type', 'component']:
+            self.compound_headings.invalidate(resource['id'])
+        if field in ['prefLabel', 'type', 'component', 'deprecated']:
+            self._heading_index = None
+        for keys, hierarchy in list(self._hierarchies.items()):
+            if field in keys and not hierarchy.update(resource):
+                del self._hierarchies[keys]
+        for index in self._indexes.values():
+            if index.field == field:
+                index.update(resource)
+
+    def attach_journal(self, journal):
+        """
+        Record changes made through `load`, `Resource.set` and `Resource.add`
+        in `journal` (a `roald.models.journal.Journal`), or stop recording if None.
+        """
+        self.journal = journal
+        for resource in self._resources:
+            resource.journal = journal
+
+    def _index_compound_headings(self, loaded):
+        """
+        Adds the labels of the compound headings in `loaded` to the term index,
+        along with those of earlier loaded compound headings whose components
+        were missing.
+        """
+        n = 0
+        pending = [self._resource_from_id[x] for x in sorted(self._incomplete_compound_headings)]
+        self._incomplete_compound_headings = set()
+        for res in pending + loaded:
             rid = res['id']
             if 'component' in res:
-                components = [self.get(id=x) for x in res['component']]
-                languages = [set(x.prefLabel.keys()) for x in components]
-                # Reduce to languages shared by all components
-                languages = reduce(lambda x, y: x.intersection(y), languages)
-
-                for lang in languages:
-                    term = self.string_separator.join([x.get('prefLabel.{}'.format(lang)).value for x in components])
+                n += 1
+                try:
+                    compound = self.compound_headings.get(rid)
+                except KeyError:
+                    # Some components were not loaded, e.g. when loading with a type filter
+                    self._incomplete_compound_headings.add(rid)
+                    continue
+                for lang, term in compound.labels.items():
                     array_set(self._id_from_term, text_type('{}.{}').format(term, lang), rid)
                     array_set(self._term_from_id, text_type('{}.{}').format(rid, lang), term)
-
-        return self  # make chainable
+        incomplete = len(self._incomplete_compound_headings)
+        if incomplete:
+            logger.warning('%d compound headings have components that are not loaded', incomplete)
+        return n
 
     def serialize(self):
         return [x.serialize() for x in self._resources]
@@ -311,6 +605,9 @@ class Resources(object):
     def __getitem__(self, key):
         return self.get(id=key)
 
+    def __contains__(self, resource_id):
+        return resource_id in self._resource_from_id
+
 
 class Concepts(Resources):
     """
@@ -0,0 +1,83 @@
+# encoding=utf-8
+import re
+
+try:
+    from functools import lru_cache
+except ImportError:  # Python 2
+    lru_cache = None
+
+
+class UriCodec(object):
+    """
+    Converts between local resource IDs and URIs.
+
+    The URI format and ID prefix are compiled once, and conversions in both
+    directions are memoized in bounded LRU caches, since the same IDs are
+    converted over and over again during import and export.
+
+    Example:
+
+    >>> codec = UriCodec('http://data.ub.uio.no/realfagstermer/c{id}', 'REAL')
+    >>> codec.uri('REAL012680')
+    'http://data.ub.uio.no/realfagstermer/c012680'
+    >>> codec.id_from_uri('http://data.ub.uio.no/realfagstermer/c012680')
+    'REAL012680'
+    """
+
+    non_numeric = re.compile('[^0-9]')
+    cache_size = 2 ** 18
+
+    def __init__(self, uri_format=None, id_prefix='', cache_size=None):
+        """
+            - uri_format : the URI format string, example: 'http://data.me/c{id}'
+            - id_prefix : prefix added to IDs extracted from URIs, example: 'REAL'
+            - cache_size : max number of cached conversions in each direction
+        """
+        super(UriCodec, self).__init__()
+        self.uri_format = uri_format
+        self.id_prefix = id_prefix or ''
+        if cache_size is not None:
+            self.cache_size = cache_size
+
+        if uri_format is None:
+            self._pattern = None
+        else:
+            self._pattern = re.compile(uri_format.format(id='([0-9]+)'))
+
+        if lru_cache is not None:
+            self.uri = lru_cache(maxsize=self.cache_size)(self.uri)
+            self.id_from_uri = lru_cache(maxsize=self.cache_size)(self.id_from_uri)
+
+    def __reduce__(self):
+        # The memoized bound methods can't be pickled, so rebuild from the arguments
+        return (self.__class__, (self.uri_format, self.id_prefix, self.cache_size))
+
+    def uri(self, id):
+        if id.startswith('http://'):
+            return id
+        if self.uri_format is None:
+            raise Exception('URI format has not been set.')
+        # Removes the REAL, HUME, SMR prefixes. @TODO: Should probably rather remove these during import.
+        numeric_id = self.non_numeric.sub('', id)
+        if len(numeric_id) < 1:
+            raise Exception('Encountered concept with invalid ID: %s' % id)
+        return self.uri_format.format(id=numeric_id)
+
+    def id_from_uri(self, uri):
+        if self._pattern is None:
+            raise Exception('URI format has not been set.')
+        m = self._pattern.match(uri)
+        if m is None:
+            return None
+        return self.id_prefix + m.group(1)
+
+    def cache_info(self):
+        """
+        Returns a dict with the `functools.lru_cache` statistics for both directions.
+        """
+        if lru_cache is None:
+            return {}
+        return {
+            'uri': self.uri.cache_info(),
+            'id_from_uri': self.id_from_uri.cache_info(),
+        }
@@ -0,0 +1,104 @@
+# encoding=utf-8
+"""
+Checks that the references between resources resolve, in a single pass after
+loading, so that all problems are reported together instead of one at a time
+deep inside an export.
+
+>>> report = roald.vocabulary.resources.validate()
+>>> report.ok
+False
+>>> report.serialize()['problems'][0]
+{'id': 'REAL013995', 'key': 'broader', 'value': 'REAL999999', 'kind': 'unknown-id', ...}
+"""
+from collections import namedtuple
+
+from ..errors import InvalidDataException
+
+
+class Problem(namedtuple('Problem', ['id', 'key', 'value', 'kind', 'message'])):
+    """
+    A single problem: resource `id` refers to `value` in the field `key`.
+    `kind` is 'unknown-id' or 'no-components'.
+    """
+
+    def serialize(self):
+        return dict(self._asdict())
+
+
+class ValidationReport(object):
+    """The problems found by `validate_references`."""
+
+    def __init__(self, problems, checked):
+        """
+            - problems : list of `Problem`
+            - checked : the number of resources checked
+        """
+        self.problems = problems
+        self.checked = checked
+
+    @property
+    def ok(self):
+        return len(self.problems) == 0
+
+    def by_kind(self):
+        """Returns the number of problems of each kind and field, e.g. {('unknown-id', 'broader'): 2}."""
+        counts = {}
+        for problem in self.problems:
+            counts[(problem.kind, problem.key)] = counts.get((problem.kind, problem.key), 0) + 1
+        return counts
+
+    def serialize(self):
+        return {
+            'checked': self.checked,
+            'problems': [x.serialize() for x in self.problems],
+        }
+
+    def summary(self, limit=10):
+        """A human readable summary, listing at most `limit` problems."""
+        lines = ['{} problems in {} resources'.format(len(self.problems), self.checked)]
+        lines += [' - ' + x.message for x in self.problems[:limit]]
+        if len(self.problems) > limit:
+            lines.append(' - ... and {} more'.format(len(self.problems) - limit))
+        return '\n'.join(lines)
+
+    def check(self, keys=None, kinds=None):
+        """
+        Raises InvalidDataException if there are problems (with the fields in
+        `keys` and of the kinds in `kinds`, if given).
+        """
+        problems = [x for x in self.problems
+                    if (keys is None or x.key in keys) and (kinds is None or x.kind in kinds)]
+        if problems:
+            raise InvalidDataException(ValidationReport(problems, self.checked).summary())
+
+    def __iter__(self):
+        return iter(self.problems)
+
+    def __len__(self):
+        return len(self.problems)
+
+
+def validate_references(resources, keys=None):
+    """
+    Checks all resources in a single pass.
+
+        - resources : `Resources`, or a `roald.models.view.ResourcesView` to
+                      check only the resources in the view
+        - keys : the fields holding IDs (default: `resources.relation_keys`)
+    """
+    keys = keys or resources.relation_keys
+    problems = []
+    checked = 0
+    for resource in resources:
+        checked += 1
+        data = resource._data
+        rid = data['id']
+        if 'CompoundHeading' in data.get('type', []) and not data.get('component'):
+            problems.append(Problem(rid, 'component', None, 'no-components',
+                                    'Posten %s er en sammensatt term uten komponenter' % rid))
+        for key in keys:
+            for value in data.get(key, []):
+                if value not in resources:
+                    problems.append(Problem(rid, key, value, 'unknown-id',
+                                            'Posten %s referer til en ugyldig ID: %s (%s)' % (rid, value, key)))
+    return ValidationReport(problems, checked)
@@ -0,0 +1,143 @@
+"""
+Filtered views of a vocabulary, for exporting subsets without copying resources.
+
+>>> view = VocabularyView(roald.vocabulary, lambda resource: not resource.get('deprecated'))
+>>> Marc21(view, vocabulary_code='noubomn').serialize()
+"""
+from ..instrumentation import phase
+from .validation import validate_references
+
+
+class ResourcesView(object):
+    """
+    The resources of a `Resources` object selected by a predicate and/or an ID
+    set. Iteration, `len` and `get()` give the selected resources, while lookups
+    by ID or term go to the full collection, so relations to resources outside
+    the view still resolve.
+    """
+
+    def __init__(self, resources, predicate=None, ids=None):
+        """
+            - resources : the full `Resources` object
+            - predicate : function taking a resource, returning True if it is selected
+            - ids : set of IDs of the selected resources
+        """
+        self.base = resources
+        self.predicate = predicate
+        self.ids = frozenset(ids) if ids is not None else None
+
+    def includes(self, resource):
+        if self.ids is not None and resource['id'] not in self.ids:
+            return False
+        return self.predicate is None or self.predicate(resource)
+
+    @property
+    def string_separator(self):
+        return self.base.string_separator
+
+    @property
+    def uri_format(self):
+        return self.base.uri_format
+
+    @property
+    def compound_headings(self):
+        return self.base.compound_headings
+
+    def heading_index(self):
+        return self.base.heading_index()
+
+    @property
+    def relation_keys(self):
+        return self.base.relation_keys
+
+    @property
+    def validation(self):
+        # A report without problems for the full collection holds for the view
+        # too. Otherwise, problems may be outside the view, so it must be checked.
+        validation = self.base.validation
+        if validation is not None and validation.ok:
+            return validation
+        return None
+
+    def validate(self):
+        """Checks the references from the resources in the view, see `Resources.validate`."""
+        with phase('validate') as p:
+            validation = validate_references(self)
+            p.items = validation.checked
+        return validation
+
+    def get(self, id=None, term=None, lang=None):
+        if id is None and term is None:
+            return [x for x in self.base if self.includes(x)]
+        return self.base.get(id=id, term=term, lang=lang)
+
+    def find(self, **criteria):
+        return [x for x in self.base.find(**criteria) if self.includes(x)]
+
+    def serialize(self):
+        return [x.serialize() for x in self]
+
+    def __iter__(self):
+        for resource in self.base:
+            if self.includes(resource):
+                yield resource
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __getitem__(self, key):
+        return self.base.get(id=key)
+
+    def __contains__(self, resource_id):
+        return resource_id in self.base
+
+    def __getstate__(self):
+        # The predicate may well be a lambda, which can't be pickled, so
+        # worker processes get the selected IDs instead
+        state = self.__dict__.copy()
+        if self.predicate is not None:
+            state['ids'] = frozenset(x['id'] for x in self)
+            state['predicate'] = None
+        return state
+
+
+class VocabularyView(object):
+    """
+    A vocabulary restricted to some of its resources, usable wherever the
+    exporters (`Marc21`, `Skos`, ...) take a `Vocabulary`. The settings
+    (URI format, default language) are those of the full vocabulary.
+    """
+
+    def __init__(self, vocabulary, predicate=None, ids=None):
+        """
+            - vocabulary : the full `Vocabulary`
+            - predicate : function taking a resource, returning True if it is selected
+            - ids : set of IDs of the selected resources
+        """
+        self.base = vocabulary
+        self.resources = ResourcesView(vocabulary.resources, predicate, ids)
+
+    def includes(self, resource):
+        return self.resources.includes(resource)
+
+    @property
+    def uri_format(self):
+        return self.base.uri_format
+
+    @property
+    def id_prefix(self):
+        return self.base.id_prefix
+
+    @property
+    def default_language(self):
+        return self.base.default_language
+
+    @property
+    def uri_codec(self):
+        return self.base.uri_codec
+
+    def uri(self, id):
+        return self.base.uri(id)
+
+    def id_from_uri(self, uri):
+        return self.base.id_from_uri(uri)
@@ -1,7 +1,5 @@
-from iso639 import languages
-import json
-import re
 from .resources import Resources
+from .uri import UriCodec
 # from .collections import Collections
 
 
@@ -9,12 +7,18 @@ class Vocabulary(object):
 
     def __init__(self):
         super(Vocabulary, self).__init__()
-        self.id_prefix = ''
+        self._id_prefix = ''
         self._uri_format = None
         self._default_language = None
+        self.uri_codec = UriCodec()
         self.resources = Resources()
         # self.collections = Collections()
 
+    @property
+    def base(self):
+        """The full vocabulary, for compatibility with `VocabularyView`."""
+        return self
+
     @property
     def uri_format(self):
         return self._uri_format
@@ -23,6 +27,16 @@ class Vocabulary(object):
     def uri_format(self, value):
         # @TODO: Check type
         self._uri_format = value
+        self.uri_codec = UriCodec(self._uri_format, self._id_prefix)
+
+    @property
+    def id_prefix(self):
+        return self._id_prefix
+
+    @id_prefix.setter
+    def id_prefix(self, value):
+        self._id_prefix = value
+        self.uri_codec = UriCodec(self._uri_format, self._id_prefix)
 
     @property
     def default_language(self):
@@ -33,20 +47,22 @@ class Vocabulary(object):
         # @TODO: Check type
         self._default_language = value
 
+    def __getstate__(self):
+        # iso639 language objects can't be unpickled, so store the code instead
+        state = self.__dict__.copy()
+        if hasattr(self._default_language, 'part3'):
+            state['_default_language'] = self._default_language.part3
+            state['_default_language_part3'] = True
+        return state
+
+    def __setstate__(self, state):
+        if state.pop('_default_language_part3', False):
+            from iso639 import languages
+            state['_default_language'] = languages.get(part3=state['_default_language'])
+        self.__dict__.update(state)
+
     def uri(self, id):  # TODO: Move into Concept/Collection class
-        if id.startswith('http://'):
-            return id
-        if self._uri_format is None:
-            raise Exception('URI format has not been set.')
-        numeric_id = re.sub('[^0-9]', '', id)
-        if len(numeric_id) < 1:
-            raise Exception('Encountered concept with invalid ID: %s' % id)
-        return self._uri_format.format(id=numeric_id)
-        # Removes the REAL, HUME, SMR prefixes. @TODO: Should probably rather remove these during import.
+        return self.uri_codec.uri(id)
 
     def id_from_uri(self, uri):
-        pattern = self._uri_format.format(id='([0-9]+)')
-        m = re.match(pattern, uri)
-        if m is None:
-            return None
-        return self.id_prefix + m.group(1)
+        return self.uri_codec.id_from_uri(uri)
@@ -0,0 +1,116 @@
+# encoding=utf-8
+"""
+Per-record cost attribution for the exporters.
+
+Pass a `RecordProfiler` to an exporter to measure the time spent on, and the
+size emitted for, each resource:
+
+>>> profiler = RecordProfiler(top=10)
+>>> roald.export('realfagstermer.marc21.xml', format='marc21', profiler=profiler)
+>>> print(profiler.report())
+
+The emitted size is counted in bytes for MARC21 and in triples for RDF/SKOS.
+The exporters also count how often the more expensive branches of
+`convert_resource` are taken (mapping types, compound headings, acronyms).
+"""
+import heapq
+import itertools
+import time
+from collections import Counter
+
+
+class RecordProfiler(object):
+    """
+    Collects the cost of each exported resource and keeps the `top` most
+    expensive ones, ranked by time ('seconds') or emitted size ('size').
+    """
+
+    def __init__(self, top=20, rank_by='seconds'):
+        if rank_by not in ['seconds', 'size']:
+            raise ValueError('rank_by must be "seconds" or "size"')
+        self.top = top
+        self.rank_by = rank_by
+        self.counts = Counter()
+        self.n_records = 0
+        self.total_seconds = 0.
+        self.total_size = 0
+        self._heap = []
+        self._seq = itertools.count()  # tie-breaker, so records are never compared
+
+    def start(self):
+        """Returns a token to pass to `stop` after the resource has been converted."""
+        return time.perf_counter()
+
+    def stop(self, token, resource, size):
+        self.add(resource.get('id'), resource.get('type', []), time.perf_counter() - token, size)
+
+    def add(self, resource_id, types, seconds, size):
+        self.n_records += 1
+        self.total_seconds += seconds
+        self.total_size += size
+        self._push({'id': resource_id, 'type': list(types), 'seconds': seconds, 'size': size})
+
+    def _push(self, record):
+        item = (record[self.rank_by], next(self._seq), record)
+        if len(self._heap) < self.top:
+            heapq.heappush(self._heap, item)
+        elif item[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def count(self, branch, n=1):
+        """Count that the branch `branch` of `convert_resource` was taken."""
+        self.counts[branch] += n
+
+    def merge(self, other):
+        """Add the measurements from another profiler, e.g. from a worker process."""
+        self.n_records += other.n_records
+        self.total_seconds += other.total_seconds
+        self.total_size += other.total_size
+        self.counts.update(other.counts)
+        for record in other.top_records():
+            self._push(record)
+
+    def top_records(self):
+        """Returns the most expensive records, most expensive first."""
+        return [x[2] for x in sorted(self._heap, key=lambda x: (-x[0], x[1]))]
+
+    def as_dict(self):
+        return {
+            'records': self.n_records,
+            'total_seconds': self.total_seconds,
+            'total_size': self.total_size,
+            'top': self.top_records(),
+            'branches': dict(self.counts),
+        }
+
+    def report(self):
+        """Returns a plain text report."""
+        lines = ['{} records, {:.3f} s, size {}'.format(self.n_records, self.total_seconds, self.total_size),
+                 '',
+                 'Top {} by {}:'.format(len(self._heap), self.rank_by),
+                 '{:>10}  {:>10}  {:<20} {}'.format('ms', 'size', 'id', 'type')]
+        for record in self.top_records():
+            lines.append('{:>10.3f}  {:>10}  {:<20} {}'.format(record['seconds'] * 1000., record['size'],
+                                                               record['id'], ', '.join(record['type'])))
+        if self.counts:
+            lines += ['', 'Branches:']
+            for branch, n in sorted(self.counts.items()):
+                lines.append('{:>10}  {}'.format(n, branch))
+        return '\n'.join(lines)
+
+
+class CountingStream(object):
+    """
+    Wraps a binary stream and counts the bytes written to it.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self.stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
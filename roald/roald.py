@@ -2,18 +2,13 @@
 import codecs
 import json
 import os
-from iso639 import languages
 import logging
-import requests
 
-from .adapters import Mesh
-from .adapters import Bibsys
-from .adapters import Roald2
-from .adapters import Roald3
-from .adapters import Marc21
-from .adapters import Skos
-from .models import Vocabulary
-from .export import PreparedExport
+from .adapters.registry import formats
+from .models import Vocabulary, VocabularyView
+from .export import PreparedExport, FanOutExport, StreamWriter, GraphWriter, BatchWriter
+from .instrumentation import Instrumentation, phase
+from .selection import Selection
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +22,7 @@ class Mailer:
         if self.config is None:
             logger.info('Mail not configured')
         else:
+            import requests
             requests.post(
                 "https://api.mailgun.net/v3/%(domain)s/messages" % self.config,
                 auth=("api", self.config['apikey']),
@@ -50,44 +46,60 @@ class Roald(object):
     >>> roald.set_uri_format('http://data.ub.uio.no/realfagstermer/c{id}')
     >>> roald.save('realfagstermer.json')
     >>> roald.export('realfagstermer.marc21.xml', format='marc21')
+
+    Timing and memory use of each phase of the work is recorded in
+    `roald.instrumentation`, see `roald.instrumentation.Instrumentation`.
     """
 
-    def __init__(self, mail_config=None):
+    def __init__(self, mail_config=None, instrumentation=None):
         super(Roald, self).__init__()
         self.vocabulary = Vocabulary()
         self.default_language = None
+        self.instrumentation = instrumentation or Instrumentation()
         if mail_config is not None:
             self.mailer = Mailer(mail_config)
         else:
             self.mailer = None
 
-    def load(self, filename, format='roald3', language=None, **kwargs):
+    def load(self, filename, format='roald3', language=None, types=None, ids=None, modified_since=None,
+             fields=None, validate=True, **kwargs):
         """
             - filename : the filename to a 'roald3' file or path to a 'roald2' directory.
-            - format : 'roald3', 'roald2' or 'bibsys'.
-            - language : language code (only for 'roald2')
+            - format : 'roald3', 'roald3-jsonl', 'roald3-sharded', 'roald2', 'bibsys', 'mesh', 'skos', 'marc21' or any
+                       other format from `roald.adapters.registry.formats`.
+            - language : language code (not for 'roald3' and 'skos')
+            - types, ids, modified_since, fields : only load some resources, or
+                       only some of their fields, see `roald.selection.Selection`
+                       (the Roald3 formats, 'roald2' and 'marc21')
+            - validate : check the references between resources after loading,
+                       see `roald.models.resources.Resources.validate`. Problems
+                       are logged as a warning, and the report is kept as
+                       `vocabulary.resources.validation`. Skipped when only some
+                       resources are loaded.
         """
         filename = os.path.expanduser(filename)
-        if format == 'roald3':
-            if language is not None:
-                logger.warn('roald.load: Setting language has no effect when loading Roald3 data')
-            Roald3(self.vocabulary).load(filename)
-        elif format == 'roald2':
-            self.vocabulary.default_language = languages.get(alpha2=language)
-            Roald2(self.vocabulary).load(filename)
-        elif format == 'bibsys':
-            self.vocabulary.default_language = languages.get(alpha2=language)
-            Bibsys(self.vocabulary).load(filename, **kwargs)
-        elif format == 'mesh':
-            self.vocabulary.default_language = languages.get(alpha2=language)
-            Mesh(self.vocabulary).load(filename, **kwargs)
-        elif format == 'skos':
-            Skos(self.vocabulary).load(filename)
-        elif format == 'marc21':
+        adapter = formats.reader(format)(self.vocabulary)
+        selection = Selection.create(types, ids, modified_since, fields)
+        if selection is not None:
+            if not getattr(adapter, 'supports_selection', False):
+                raise ValueError('roald.load: Cannot filter or project {} data while loading'.format(format))
+            kwargs['selection'] = selection
+        if getattr(adapter, 'sets_default_language', False):
+            from iso639 import languages
             self.vocabulary.default_language = languages.get(alpha2=language)
-            Marc21(self.vocabulary, mailer=self.mailer).load(filename, **kwargs)
-        else:
-            raise ValueError('Unknown format')
+        elif language is not None:
+            logger.warn('roald.load: Setting language has no effect when loading %s data', format)
+        if hasattr(adapter, 'mailer'):
+            adapter.mailer = self.mailer
+        n0 = len(self.vocabulary.resources)
+        with self.instrumentation.activate():
+            with phase('parse', format=format) as p:
+                adapter.load(filename, **kwargs)
+                p.items = len(self.vocabulary.resources) - n0
+            if validate and selection is None:
+                report = self.vocabulary.resources.validate()
+                if not report.ok:
+                    logger.warning('roald.load: %s', report.summary())
 
         logger.info('Loaded {} resources'.format(len(self.vocabulary.resources)))
 
@@ -95,40 +107,123 @@ class Roald(object):
         self.vocabulary.uri_format = value
         self.vocabulary.id_prefix = prefix
 
-    def save(self, filename):
+    def save(self, filename, format='roald3', **kwargs):
+        """
+            - format : 'roald3', 'roald3-jsonl' or 'roald3-sharded' (filename is then
+                       a directory, see `roald.adapters.roald3.Roald3Sharded.save`
+                       for options)
+        """
         filename = os.path.expanduser(filename)
 
-        Roald3(self.vocabulary).save(filename)
+        with self.instrumentation.activate():
+            formats.get(format)(self.vocabulary).save(filename, **kwargs)
 
         logger.info('Saved {} resources to {}'.format(len(self.vocabulary.resources), filename))
 
-    def prepare_export(self, format, **kwargs):
-        if format == 'marc21':
-            logger.info('Preparing MARC21 export')
-            model = Marc21(self.vocabulary, **kwargs)
-        elif format == 'rdfskos':
-            logger.info('Preparing RDF/SKOS export')
-            model = Skos(self.vocabulary, **kwargs)
-        else:
-            raise Exception('Unknown format')
-        return PreparedExport(model)
+    def compact(self):
+        """
+        Folds the journal into a new snapshot. Only available if the vocabulary
+        was loaded with `load(filename, journal=True)`.
+        """
+        journal = self.vocabulary.resources.journal
+        with self.instrumentation.activate():
+            formats.get(journal.format if journal else 'roald3')(self.vocabulary).compact()
+
+    def view(self, predicate=None, ids=None):
+        """
+        Returns a `VocabularyView` of the resources selected by `predicate` (a
+        function taking a resource) and/or `ids`, for exporting subsets:
+
+        >>> roald.export('hume.marc21.xml', 'marc21', vocabulary=roald.view(lambda x: x['id'].startswith('HUME')))
+        """
+        return VocabularyView(self.vocabulary, predicate, ids)
+
+    def prepare_export(self, format, vocabulary=None, **kwargs):
+        """
+            - vocabulary : optional `VocabularyView` to export instead of the whole vocabulary
+        """
+        adapter = formats.writer(format)
+        logger.info('Preparing %s export', format)
+        model = adapter(vocabulary or self.vocabulary, **kwargs)
+        return PreparedExport(model, self.instrumentation)
 
     def export(self, filename, format, **kwargs):
         try:
             prepared = self.prepare_export(format, **kwargs)
             prepared.write(filename)
         except Exception as error:
-            if self.mailer is not None:
-                hline = '\n\n-----------------------------------------------------\n\n'
-                self.mailer.send(
-                    'Eksport av %s feila' % filename,
-                    'Følgende problem oppsto:' + hline + str(error) + hline
-                )
-                raise Exception("Errors occured during import. Mail sent.")
+            self.notify_failure(filename, error)
             raise error
 
-    def authorize(self, value):
-        # <value> can take a compound heading value like "$a Component1 $x Component2 $x Component3"
-        return self.concepts.get(term=value)
-        # parts = [[x.strip()[0], x.strip()[1:].strip()] for x in value.split('$') if len(x.strip()) > 0]
-        # for part in parts:
+    def export_many(self, targets):
+        """
+        Export the vocabulary to several files in a single traversal of the resources.
+
+            - targets : list of dicts, each having a 'filename', a 'format' ('marc21',
+                        'rdfskos', 'roald3' or any other writable format) and any
+                        options for the adapter. For 'rdfskos', 'serialization' can be
+                        set to 'turtle' or 'nt' (default: guessed from the filename).
+                        'rdfskos' targets with the same options share a single graph.
+                        'vocabulary' can be set to a `VocabularyView` to export a subset.
+
+        Example:
+
+        >>> roald.export_many([
+        ...     {'filename': 'realfagstermer.marc21.xml', 'format': 'marc21', 'vocabulary_code': 'noubomn'},
+        ...     {'filename': 'realfagstermer.ttl', 'format': 'rdfskos', 'include': ['scheme.ttl']},
+        ...     {'filename': 'realfagstermer.nt', 'format': 'rdfskos', 'include': ['scheme.ttl']},
+        ...     {'filename': 'realfagstermer.json', 'format': 'roald3'},
+        ... ])
+        """
+        writers = []
+        graph_writers = {}
+        for target in targets:
+            options = dict(target)
+            filename = options.pop('filename')
+            format = options.pop('format')
+            vocabulary = options.pop('vocabulary', None) or self.vocabulary
+            adapter = formats.writer(format)
+            if getattr(adapter, 'builds_graph', False):
+                serialization = options.pop('serialization', None)
+                if serialization is None:
+                    serialization = 'nt' if filename.endswith('.nt') else 'turtle'
+                key = format + json.dumps(options, sort_keys=True, default=str) + str(id(vocabulary))
+                if key not in graph_writers:
+                    graph_writers[key] = GraphWriter(adapter(vocabulary, **options), [])
+                    writers.append(graph_writers[key])
+                graph_writers[key].outputs.append((os.path.expanduser(filename), serialization))
+            elif hasattr(adapter, 'write_resource'):
+                writers.append(StreamWriter(adapter(vocabulary, **options), filename))
+            else:
+                writers.append(BatchWriter(adapter(vocabulary, **options), filename))
+
+        filenames = ', '.join([target['filename'] for target in targets])
+        logger.info('Exporting to {}'.format(filenames))
+        try:
+            with self.instrumentation.activate():
+                FanOutExport(self.vocabulary, writers).write()
+        except Exception as error:
+            self.notify_failure(filenames, error)
+            raise error
+
+    def notify_failure(self, filename, error):
+        if self.mailer is not None:
+            hline = '\n\n-----------------------------------------------------\n\n'
+            self.mailer.send(
+                'Eksport av %s feila' % filename,
+                'Følgende problem oppsto:' + hline + str(error) + hline
+            )
+            raise Exception("Errors occured during import. Mail sent.")
+
+    def authorize(self, value, tag=None):
+        """
+        Returns the resource having the heading `value`, or None if there is no
+        such resource, or more than one. See `roald.models.headings.HeadingIndex`.
+
+            - value : a label, also of a compound heading ('Fornybar energi : Norge'),
+                      or subfields ('$a Fornybar energi $z Norge')
+            - tag : the subject tag ('650', '651', ...) of the subfields, if known
+        """
+        resources = self.vocabulary.resources
+        resource_id = resources.heading_index().authorize(value, tag, resources.string_separator)
+        return None if resource_id is None else resources.get(id=resource_id)
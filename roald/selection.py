@@ -0,0 +1,101 @@
+# encoding=utf-8
+"""
+Filters and field projection applied by the readers while parsing, so that
+resources that are not wanted are never built.
+
+>>> roald.load('realfagstermer.json', types=['Topic'], fields=['prefLabel'])
+>>> roald.load('realfagstermer.json', modified_since='2020-01-01')
+"""
+from datetime import date, datetime
+from six import string_types
+
+
+class Selection(object):
+    """
+    A filter on type, ID and modification date, and a projection to a set of
+    fields. 'id' and 'type' are always kept.
+    """
+
+    always_included = ['id', 'type']
+
+    # Resource objects expect these to be present, so they are emptied rather than removed
+    label_fields = ['prefLabel', 'altLabel', 'hiddenLabel']
+
+    def __init__(self, types=None, ids=None, modified_since=None, fields=None):
+        """
+            - types : only include resources having one of these types, e.g. ['Topic']
+            - ids : only include resources with these IDs
+            - modified_since : only include resources modified (or, if they have no
+                               'modified' date, created) at or after this date, as a
+                               date, datetime or ISO 8601 string
+            - fields : only keep these fields, e.g. ['prefLabel', 'altLabel']
+        """
+        if isinstance(types, string_types) or isinstance(ids, string_types) or isinstance(fields, string_types):
+            raise ValueError('types, ids and fields must be lists')
+        self.types = set(types) if types is not None else None
+        self.ids = set(ids) if ids is not None else None
+        if isinstance(modified_since, datetime):
+            modified_since = modified_since.strftime('%Y-%m-%dT%H:%M:%S')
+        elif isinstance(modified_since, date):
+            modified_since = modified_since.strftime('%Y-%m-%d')
+        self.modified_since = modified_since
+        self.fields = set(fields) | set(self.always_included) if fields is not None else None
+
+    @classmethod
+    def create(cls, types=None, ids=None, modified_since=None, fields=None):
+        """Returns a Selection, or None if nothing is filtered or projected."""
+        if types is None and ids is None and modified_since is None and fields is None:
+            return None
+        return cls(types, ids, modified_since, fields)
+
+    def accepts_id(self, resource_id):
+        return self.ids is None or resource_id in self.ids
+
+    def accepts_types(self, types):
+        if self.types is None:
+            return True
+        if isinstance(types, string_types):
+            types = [types]
+        return not self.types.isdisjoint(types)
+
+    def accepts_modified(self, modified):
+        """Dates are compared as ISO 8601 strings."""
+        return self.modified_since is None or (modified is not None and modified >= self.modified_since)
+
+    def accepts(self, resource):
+        """
+            - resource : a resource dict or Resource object
+        """
+        return (self.accepts_id(resource.get('id'))
+                and self.accepts_types(resource.get('type', []))
+                and self.accepts_modified(resource.get('modified') or resource.get('created')))
+
+    def wants(self, key):
+        """Whether the field `key` (like 'altLabel.nb') is kept."""
+        return self.fields is None or key.split('.')[0] in self.fields
+
+    def project(self, resource):
+        """
+        Removes the fields that are not wanted. Dicts are copied, Resource
+        objects are changed in place.
+        """
+        if self.fields is None:
+            return resource
+        if isinstance(resource, dict):
+            data = resource = dict(resource)
+        else:
+            data = resource._data
+        for key in list(data.keys()):
+            if key in self.fields:
+                continue
+            if key in self.label_fields:
+                data[key] = {}
+            else:
+                del data[key]
+        return resource
+
+    def apply(self, resources):
+        """Filters and projects an iterable of resource dicts or Resource objects."""
+        for resource in resources:
+            if self.accepts(resource):
+                yield self.project(resource)
@@ -0,0 +1,329 @@
+# encoding=utf-8
+"""
+A small HTTP service answering lookups against a vocabulary kept in memory,
+for tools that would otherwise load the whole vocabulary for a single label.
+
+    roald serve realfagstermer.json --port 8080
+
+    GET /id/REAL012789                               the resource, as in Roald3
+    GET /term?q=Fornybar+energi[&lang=nb]            resources having the label
+    GET /search?q=fornyb[&lang=nb][&limit=20]        resources with labels starting with q
+    GET /authorize?q=$a+Fornybar+energi+$z+Norge[&tag=650]
+    GET /status
+
+Responses are JSON. Labels are compared as by `roald.models.headings.normalize`
+(ignoring case and whitespace differences), and /term and /search look at both
+preferred and alternative labels of resources that are not deprecated.
+
+Requests are handled by a fixed pool of threads. Each request uses the
+`LookupIndex` that was current when it started. When the vocabulary file or
+its journal (see `roald.models.journal`) changes, a new `LookupIndex` is built in the background and swapped in once
+it is complete, so requests in progress finish against the old one and no
+request sees a partly loaded vocabulary.
+"""
+from __future__ import division
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.urllib.parse import parse_qs, unquote, urlparse
+
+from .roald import Roald
+from .models.headings import normalize
+
+logger = logging.getLogger(__name__)
+
+
+class LookupIndex(object):
+    """
+    The indexes for a loaded vocabulary. Not changed after it is built, so
+    it can be shared by any number of threads.
+    """
+
+    def __init__(self, vocabulary):
+        """
+            - vocabulary : `Vocabulary`, which must not be changed afterwards
+        """
+        self.vocabulary = vocabulary
+        self.resources = vocabulary.resources
+        self.headings = self.resources.heading_index()
+        # Sorted (normalized label, language, ID, label, preferred), for /term and /search
+        labels = []
+        for resource in self.resources:
+            if resource.get('deprecated'):
+                continue
+            rid = resource['id']
+            if 'component' in resource:
+                try:
+                    compound = self.resources.compound_headings.get(rid)
+                except KeyError:
+                    continue
+                labels += [(normalize(label), lang, rid, label, True) for lang, label in compound.labels.items()]
+                continue
+            for lang, label in resource.prefLabel.items():
+                labels.append((normalize(label.value), lang, rid, label.value, True))
+            for lang, values in resource.get('altLabel', {}).items():
+                labels += [(normalize(x.value), lang, rid, x.value, False) for x in values]
+        labels.sort()
+        self.labels = labels
+        self.keys = [x[0] for x in labels]
+
+    def __len__(self):
+        return len(self.resources)
+
+    def resource(self, resource_id):
+        """Returns the resource as in Roald3, with its URI, or None."""
+        try:
+            resource = self.resources.get(id=resource_id)
+        except KeyError:
+            return None
+        data = resource.serialize()
+        if self.vocabulary.uri_format is not None:
+            data['uri'] = self.vocabulary.uri(resource_id)
+        return data
+
+    def hit(self, entry):
+        _, lang, rid, label, preferred = entry
+        return {'id': rid, 'label': label, 'lang': lang, 'preferred': preferred,
+                'type': self.resources.get(id=rid).get('type', [])}
+
+    def term(self, value, lang=None):
+        """Returns the resources having `value` as a preferred or alternative label."""
+        key = normalize(value)
+        hits = []
+        for n in range(bisect_left(self.keys, key), len(self.keys)):
+            if self.keys[n] != key:
+                break
+            if lang is None or self.labels[n][1] == lang:
+                hits.append(self.hit(self.labels[n]))
+        return hits
+
+    def search(self, prefix, lang=None, limit=20):
+        """
+        Returns up to `limit` resources with a label starting with `prefix`, in
+        the order of the labels, each with the first matching label.
+        """
+        key = normalize(prefix)
+        hits = []
+        seen = set()
+        for n in range(bisect_left(self.keys, key), len(self.keys)):
+            if len(hits) >= limit or not self.keys[n].startswith(key):
+                break
+            entry = self.labels[n]
+            if entry[2] in seen or (lang is not None and entry[1] != lang):
+                continue
+            seen.add(entry[2])
+            hits.append(self.hit(entry))
+        return hits
+
+    def authorize(self, value, tag=None):
+        """Returns the ID for a heading, see `roald.models.headings.HeadingIndex.authorize`, or None."""
+        return self.headings.authorize(value, tag, self.resources.string_separator)
+
+
+class LookupService(object):
+    """
+    Keeps a `LookupIndex` for a vocabulary file, and replaces it when the file
+    or its journal changes.
+    """
+
+    def __init__(self, filename, format='roald3'):
+        """
+            - filename : a 'roald3' or 'roald3-jsonl' file
+            - format : the format of the file
+        """
+        self.filename = os.path.expanduser(filename)
+        self.format = format
+        self.index = None  # the current LookupIndex, replaced as a whole by `reload`
+        self.loaded = None  # `stat` when `index` was loaded
+        self.reloads = 0
+        self._seen = None  # `stat` at the previous `check`
+        self._failed = None  # `stat` when loading last failed
+        self._lock = threading.Lock()  # one reload at a time
+        self._stop = threading.Event()
+
+    def stat(self):
+        """
+        Returns (mtime, size, inode) of the file, followed by the same for its
+        journal, or None if there is none. `Roald.save` on a vocabulary loaded
+        with a journal only appends to the journal.
+        """
+        st = os.stat(self.filename)
+        try:
+            journal = os.stat(self.filename + '.journal')
+        except OSError:
+            return (st.st_mtime, st.st_size, st.st_ino, None)
+        return (st.st_mtime, st.st_size, st.st_ino, (journal.st_mtime, journal.st_size, journal.st_ino))
+
+    @staticmethod
+    def modified(stat):
+        """The latest modification time of the file and its journal in a `stat` signature."""
+        return max(stat[0], stat[3][0]) if stat[3] is not None else stat[0]
+
+    def reload(self):
+        """Loads the file and swaps in a new `LookupIndex`. Returns the index."""
+        with self._lock:
+            stat = self.stat()
+            t0 = time.time()
+            roald = Roald()
+            roald.load(self.filename, format=self.format)
+            index = LookupIndex(roald.vocabulary)
+            # A single assignment, so requests see either the old or the new index
+            self.index = index
+            self.loaded = self._seen = stat
+            self.reloads += 1
+            logger.info('Loaded %d resources from %s in %.1f s', len(index), self.filename, time.time() - t0)
+            return index
+
+    def check(self):
+        """
+        Reloads if the file has changed since it was loaded, and has not changed
+        since the previous check, so a file still being written is not read.
+        Returns True if it was reloaded. If loading fails, the current index is
+        kept and the error logged.
+        """
+        try:
+            stat = self.stat()
+        except OSError as error:
+            logger.warning('Cannot read %s: %s', self.filename, error)
+            return False
+        settled = stat == self._seen
+        self._seen = stat
+        if stat in (self.loaded, self._failed) or not settled:
+            return False
+        try:
+            self.reload()
+        except Exception:
+            logger.exception('Reloading %s failed, keeping the vocabulary loaded %s', self.filename,
+                             time.ctime(self.modified(self.loaded)) if self.loaded else 'never')
+            self._failed = stat  # don't retry until the file changes again
+            return False
+        return True
+
+    def watch(self, interval=2.0):
+        """Starts a thread calling `check` every `interval` seconds until `stop` is called."""
+        def run():
+            while not self._stop.wait(interval):
+                self.check()
+        thread = threading.Thread(target=run, name='roald-watch')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        index = self.index
+        return {
+            'filename': self.filename,
+            'resources': len(index) if index is not None else 0,
+            'loaded': self.modified(self.loaded) if self.loaded else None,
+            'reloads': self.reloads,
+        }
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    """Answers the requests listed in the module docstring."""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    server_version = 'roald'
+    timeout = 10  # seconds before an idle connection is closed, giving its thread back to the pool
+    disable_nagle_algorithm = True  # the headers and body are written separately
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        index = self.server.service.index  # used for the whole request
+        try:
+            status, data = self.route(index, url.path, params)
+        except ValueError as error:
+            status, data = 400, {'error': str(error)}
+        self.send_json(status, data)
+
+    def route(self, index, path, params):
+        if path == '/status':
+            return 200, self.server.service.status()
+        if index is None:
+            return 503, {'error': 'Not loaded yet'}
+        if path.startswith('/id/'):
+            data = index.resource(unquote(path[4:]))
+            return (200, data) if data is not None else (404, {'error': 'Not found'})
+        if path in ['/term', '/search', '/authorize'] and not params.get('q'):
+            raise ValueError('Missing parameter: q')
+        if path == '/term':
+            return 200, index.term(params['q'], params.get('lang'))
+        if path == '/search':
+            return 200, index.search(params['q'], params.get('lang'), int(params.get('limit', 20)))
+        if path == '/authorize':
+            resource_id = index.authorize(params['q'], params.get('tag'))
+            if resource_id is None:
+                return 404, {'error': 'Not found'}
+            return 200, index.resource(resource_id)
+        return 404, {'error': 'Unknown path'}
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug('%s %s', self.address_string(), format % args)
+
+
+class LookupServer(HTTPServer):
+    """An `HTTPServer` handling connections in a fixed pool of threads."""
+
+    allow_reuse_address = True
+
+    def __init__(self, address, service, threads=8):
+        """
+            - address : (host, port), port 0 picks a free port
+            - service : `LookupService`
+            - threads : number of connections handled at the same time
+        """
+        HTTPServer.__init__(self, address, LookupHandler)
+        self.service = service
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        self.executor.shutdown(wait=False)
+
+
+def serve(filename, host='127.0.0.1', port=8080, format='roald3', threads=8, interval=2.0):
+    """
+    Loads a vocabulary file and answers lookups until interrupted, reloading
+    the file when it changes (checked every `interval` seconds, 0: never).
+    """
+    service = LookupService(filename, format)
+    service.reload()
+    if interval:
+        service.watch(interval)
+    server = LookupServer((host, port), service, threads)
+    logger.warning('Serving %s on http://%s:%d/', service.filename, *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
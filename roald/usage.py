@@ -0,0 +1,223 @@
+# encoding=utf-8
+"""
+Counts how many bibliographic records use each concept as a subject, for
+prioritising mapping work.
+
+>>> report = count_usage(roald.vocabulary, ['bib1.xml', 'bib2.mrc'], vocabulary_code='noubomn', jobs=4)
+>>> report.counts.most_common(1)
+[('REAL012789', 1520)]
+>>> store_usage(roald.vocabulary.resources, report.counts)
+>>> roald.save('realfagstermer.json')  # with 'usageCount' on the resources in use
+>>> write_usage(roald.vocabulary.resources, 'usage.csv')
+
+A record counts once for each resource among its subject fields
+(648/650/651/655 with $2 set to the vocabulary code). A $0 referring to a
+resource in the vocabulary is used as is; other fields are resolved with
+`Resources.heading_index`. Compound headings are counted for themselves,
+not for their components.
+
+The records are read as for `roald.enrichment.enrich`, in chunks that are
+counted in worker processes. Each chunk gives a counter, which is merged
+into the total as it arrives, so memory use is bounded by the number of
+resources rather than the size of the dumps.
+"""
+from __future__ import division
+import csv
+import io
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from six import PY2
+
+from .enrichment import (MarcXmlSplitter, guess_marc_format, iso2709_chunks, iso2709_subject_fields,
+                         marcxml_records, marcxml_subject_fields, ordered_map)
+from .instrumentation import phase, track
+
+logger = logging.getLogger(__name__)
+
+
+class UsageReport(object):
+    """Records per resource ID, and the number of records and fields processed."""
+
+    def __init__(self):
+        self.counts = Counter()  # resource ID: number of records
+        self.records = 0
+        self.fields = 0
+        self.unmatched = 0
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.records += other.records
+        self.fields += other.fields
+        self.unmatched += other.unmatched
+
+    def summary(self):
+        return '{} records, {} subject fields ({} unmatched), {} resources in use'.format(
+            self.records, self.fields, self.unmatched, len(self.counts))
+
+
+class UsageCounter(object):
+    """
+    Counts the subject fields of chunks of records. Picklable, so it can be
+    sent to worker processes.
+    """
+
+    def __init__(self, index, ids, uri_codec, vocabulary_code):
+        """
+            - index : `roald.models.headings.HeadingIndex`
+            - ids : set of the resource IDs in the vocabulary
+            - uri_codec : `roald.models.UriCodec`, for $0 given as URIs
+            - vocabulary_code : only fields with this $2 are counted, e.g. 'noubomn'
+        """
+        self.index = index
+        self.ids = ids
+        self.uri_codec = uri_codec
+        self.vocabulary_code = vocabulary_code
+
+    def resolve(self, tag, subfields, report):
+        """Returns the resource ID for a subject field, or None."""
+        if (u'2', self.vocabulary_code) not in subfields:
+            return None
+        report.fields += 1
+        for code, value in subfields:
+            if code == u'0':
+                if value in self.ids:
+                    return value
+                if self.uri_codec.uri_format is not None:
+                    resource_id = self.uri_codec.id_from_uri(value)
+                    if resource_id in self.ids:
+                        return resource_id
+        resource_id = self.index.lookup(tag, subfields)
+        if resource_id is None:
+            report.unmatched += 1
+        return resource_id
+
+    def count_record(self, fields, report):
+        report.records += 1
+        ids = set([self.resolve(tag, subfields, report) for tag, subfields in fields])
+        ids.discard(None)
+        report.counts.update(ids)
+
+    def count_iso2709(self, records):
+        report = UsageReport()
+        for record in records:
+            self.count_record(iso2709_subject_fields(record), report)
+        return report
+
+    def count_marcxml(self, header, chunk):
+        report = UsageReport()
+        for record in marcxml_records(header, chunk):
+            self.count_record([(tag, subfields) for _, tag, subfields in marcxml_subject_fields(record)], report)
+        return report
+
+
+# The UsageCounter used by the worker processes, see `_init_worker`
+_worker_counter = None
+
+
+def _init_worker(counter):
+    global _worker_counter
+    _worker_counter = counter
+
+
+def _count_iso2709(records):
+    return _worker_counter.count_iso2709(records)
+
+
+def _count_marcxml(args):
+    return _worker_counter.count_marcxml(*args)
+
+
+def count_usage(vocabulary, sources, vocabulary_code, format=None, jobs=1, batch_size=500):
+    """
+    Returns a `UsageReport` for the bibliographic records in `sources`.
+
+        - vocabulary : `Vocabulary`
+        - sources : list of MARCXML or ISO 2709 files
+        - vocabulary_code : the $2 value of the fields to count, e.g. 'noubomn'
+        - format : 'marcxml' or 'iso2709' (default: guessed from the content of each file)
+        - jobs : number of worker processes (1: no workers)
+        - batch_size : number of records per chunk sent to a worker
+    """
+    resources = vocabulary.resources
+    counter = UsageCounter(resources.heading_index(), frozenset(x['id'] for x in resources),
+                           vocabulary.uri_codec, vocabulary_code)
+    report = UsageReport()
+
+    if jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(counter,))
+    else:
+        executor = None
+        _init_worker(counter)
+
+    try:
+        for source in sources:
+            source = os.path.expanduser(source)
+            source_format = format or guess_marc_format(source)
+            if source_format not in ['marcxml', 'iso2709']:
+                raise ValueError('Unknown MARC format: {}'.format(source_format))
+            size = float(os.path.getsize(source)) or 1.
+            with phase('usage', format=source_format, filename=source) as p, open(source, 'rb') as stream:
+                if source_format == 'iso2709':
+                    chunks = iso2709_chunks(stream, batch_size)
+                    fn = _count_iso2709
+                else:
+                    splitter = MarcXmlSplitter(stream, batch_size)
+                    chunks = ((splitter.header, chunk) for chunk in splitter.chunks())
+                    fn = _count_marcxml
+                results = ordered_map(executor, fn, chunks, jobs * 2) if executor else (fn(x) for x in chunks)
+                records = report.records
+                for chunk_report in track(results, 'usage', fraction=lambda: stream.tell() / size):
+                    report.merge(chunk_report)
+                p.items = report.records - records
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    logger.info('Counted usage: %s', report.summary())
+    return report
+
+
+def store_usage(resources, counts, key='usageCount'):
+    """
+    Sets `key` on the resources to their number of records, and removes it from
+    resources no longer in use. Returns the number of resources in use.
+    """
+    n = 0
+    for resource in resources:
+        count = counts.get(resource['id'], 0)
+        if count:
+            n += 1
+        if resource.get(key) == (count or None):
+            continue
+        if count:
+            resource.replace(key, count)
+        else:
+            resource.delete(key)
+    return n
+
+
+def label(resources, resource, lang):
+    """The preferred label of a resource in `lang`, made from the components for compound headings."""
+    if 'component' in resource:
+        try:
+            return resources.compound_headings.get(resource['id']).label(lang) or ''
+        except KeyError:
+            return ''
+    return resource.prefLabel[lang].value if lang in resource.prefLabel else ''
+
+
+def write_usage(resources, filename, key='usageCount', lang='nb'):
+    """
+    Writes the resources in use as CSV (id, label, count), the most used first.
+    """
+    rows = [(x['id'], label(resources, x, lang), x.get(key)) for x in resources if x.get(key)]
+    rows.sort(key=lambda x: (-x[2], x[0]))
+    tmp = filename + '.tmp'
+    with (open(tmp, 'wb') if PY2 else io.open(tmp, 'w', encoding='utf-8', newline='')) as stream:
+        writer = csv.writer(stream)
+        writer.writerow(['id', 'label', 'count'])
+        for row in rows:
+            writer.writerow(row)
+    os.replace(tmp, filename)
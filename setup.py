@@ -14,6 +14,9 @@ setup(name='roald',
       url='https://github.com/scriptotek/roald',
       license='MIT',
       packages=['roald', 'roald.models', 'roald.adapters'],
+      entry_points={
+          'console_scripts': ['roald = roald.cli:main'],
+      },
       install_requires=['xmlwitch==0.3.0',  # Note: we need to use the danmichaelo fork, since I haven't been able to get it merged (or get any response from the original author at all).
                         'isodate',
                         'lxml',
@@ -0,0 +1,121 @@
+# encoding=utf-8
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+from iso639 import languages
+
+import roald
+from roald import Roald
+from roald.changes import patch, read_jsonl, write_jsonl, PatchConflict
+from roald.errors import InvalidDataException
+
+
+class TestChanges(unittest.TestCase):
+
+    old = [
+        {
+            'id': 'REAL012789',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Fornybar energi'}, 'en': {'value': 'Renewable energy'}},
+            'mappings': {'closeMatch': ['http://dewey.info/class/333.794/e23/']},
+        },
+        {
+            'id': 'REAL013995',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}},
+            'broader': ['REAL012789'],
+        },
+        {
+            'id': 'REAL020000',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Solenergi'}},
+        },
+    ]
+
+    new = [
+        {
+            'id': 'REAL012789',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Fornybar energi'}, 'en': {'value': 'Renewable energy'}},
+            'mappings': {'closeMatch': ['http://dewey.info/class/333.794/e23/'],
+                         'exactMatch': ['http://www.wikidata.org/entity/Q12705']},
+        },
+        {
+            'id': 'REAL013995',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Livsløpsanalyse'}},
+            'broader': ['REAL020000'],
+        },
+        {
+            'id': 'REAL030000',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Vindkraft'}},
+        },
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_diff(self):
+        changes = list(roald.diff(self.old, self.new))
+
+        assert [('change', 'REAL012789'), ('change', 'REAL013995'), ('remove', 'REAL020000'),
+                ('add', 'REAL030000')] == [(x['op'], x['id']) for x in changes]
+
+        assert [{'field': 'mappings.exactMatch', 'new': ['http://www.wikidata.org/entity/Q12705']}] == \
+            changes[0]['changes']
+
+        fields = {x['field']: x for x in changes[1]['changes']}
+        assert ['broader', 'prefLabel.nb'] == sorted(fields.keys())
+        assert ['REAL020000'] == fields['broader']['added']
+        assert ['REAL012789'] == fields['broader']['removed']
+        assert {'value': 'Livsløpsanalyse'} == fields['prefLabel.nb']['new']
+
+    def test_patch(self):
+        filename = os.path.join(self.tmp, 'changes.jsonl')
+        counts = write_jsonl(roald.diff(self.old, self.new), filename)
+        assert {'add': 1, 'remove': 1, 'change': 2} == counts
+
+        assert self.new == list(patch(self.old, read_jsonl(filename)))
+
+    def test_patch_conflict(self):
+        changes = list(roald.diff(self.old, self.new))
+        old = [dict(x) for x in self.old]
+        old[1]['broader'] = ['REAL099999']
+        with self.assertRaises(PatchConflict):
+            list(patch(old, changes))
+
+    def test_unsorted(self):
+        with self.assertRaises(InvalidDataException):
+            list(roald.diff(list(reversed(self.old)), self.new))
+
+    def test_diff_files(self):
+        filenames = []
+        for name, data in [('old.json', self.old), ('new.json', self.new)]:
+            voc = Roald()
+            voc.vocabulary.default_language = languages.get(alpha2='nb')
+            # Unsorted files are sorted when read
+            voc.vocabulary.resources.load(reversed(data))
+            voc.save(os.path.join(self.tmp, name))
+            filenames.append(os.path.join(self.tmp, name))
+
+        assert list(roald.diff(self.old, self.new)) == list(roald.diff(*filenames))
+
+    def test_diff_jsonl_files(self):
+        filenames = []
+        for name, data in [('old.jsonl', self.old), ('new.jsonl', self.new)]:
+            voc = Roald()
+            voc.vocabulary.default_language = languages.get(alpha2='nb')
+            voc.vocabulary.resources.load(reversed(data))
+            voc.save(os.path.join(self.tmp, name), format='roald3-jsonl')
+            filenames.append(os.path.join(self.tmp, name))
+
+        changes = roald.diff(*filenames)
+        assert not isinstance(changes, list)
+        assert list(roald.diff(self.old, self.new)) == list(changes)
+        assert self.new == list(patch(filenames[0], roald.diff(*filenames)))
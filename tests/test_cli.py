@@ -0,0 +1,132 @@
+# encoding=utf-8
+from __future__ import print_function
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from io import StringIO
+from iso639 import languages
+
+from roald import Roald
+from roald.cli import main, group_targets, ProgressPrinter
+
+
+class TestCli(unittest.TestCase):
+
+    testdata = [
+        {
+            'id': 'REAL012789',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Fornybar energi'}},
+            'created': '2015-02-20T13:08:04Z',
+        },
+        {
+            'id': 'REAL013995',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}},
+            'broader': ['REAL012789'],
+            'created': '2015-02-20T13:08:04Z',
+        },
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        with open(self.path('scheme.ttl'), 'w') as f:
+            f.write('<http://data.ub.uio.no/realfagstermer/> a <http://www.w3.org/2004/02/skos/core#ConceptScheme> .\n')
+
+        roald = Roald()
+        roald.vocabulary.default_language = languages.get(alpha2='nb')
+        roald.vocabulary.resources.load(self.testdata)
+        roald.save(self.path('source.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, filename):
+        return os.path.join(self.tmp, filename)
+
+    def read(self, filename):
+        with open(self.path(filename), 'rb') as f:
+            return f.read()
+
+    def write_config(self, prefix, jobs):
+        config = {
+            'uri_format': 'http://data.ub.uio.no/realfagstermer/c{id}',
+            'sources': [{'filename': self.path('source.json'), 'format': 'roald3'}],
+            'targets': [
+                {'filename': self.path(prefix + '.json'), 'format': 'roald3'},
+                {'filename': self.path(prefix + '.marc21.xml'), 'format': 'marc21', 'vocabulary_code': 'noubomn'},
+                {'filename': self.path(prefix + '.ttl'), 'format': 'rdfskos', 'include': [self.path('scheme.ttl')]},
+                {'filename': self.path(prefix + '.nt'), 'format': 'rdfskos', 'include': [self.path('scheme.ttl')]},
+            ],
+            'jobs': jobs,
+        }
+        filename = self.path(prefix + '.pipeline.json')
+        with open(filename, 'w') as f:
+            json.dump(config, f)
+        return filename
+
+    def test_run(self):
+        main(['run', self.write_config('serial', 1), '--no-progress', '--phases', self.path('phases.jsonl')])
+        main(['run', self.write_config('parallel', 1), '--no-progress', '--jobs', '2'])
+
+        assert b'REAL013995' in self.read('serial.marc21.xml')
+        assert self.read('serial.marc21.xml') == self.read('parallel.marc21.xml')
+        assert self.read('serial.json') == self.read('parallel.json')
+        assert len(self.read('parallel.nt')) > 0
+
+        with open(self.path('phases.jsonl')) as f:
+            phases = [json.loads(line)['phase'] for line in f]
+        assert 'parse' in phases
+        assert 'traverse' in phases
+
+    def test_run_marc21_language(self):
+        filename = self.path('language.pipeline.json')
+        with open(filename, 'w') as f:
+            json.dump({
+                'sources': [{'filename': self.path('source.json'), 'format': 'roald3'}],
+                'targets': [{'filename': self.path('nb.marc21.xml'), 'format': 'marc21',
+                             'vocabulary_code': 'noubomn', 'language': 'nb'}],
+            }, f)
+        main(['run', filename, '--no-progress'])
+        assert b'<subfield code="b">nob</subfield>' in self.read('nb.marc21.xml')
+
+    def test_group_targets(self):
+        groups = group_targets([
+            {'filename': 'a.ttl', 'format': 'rdfskos', 'include': ['scheme.ttl']},
+            {'filename': 'a.json', 'format': 'roald3'},
+            {'filename': 'a.nt', 'format': 'rdfskos', 'include': ['scheme.ttl']},
+            {'filename': 'b.nt', 'format': 'rdfskos'},
+        ])
+        assert [['a.ttl', 'a.nt'], ['a.json'], ['b.nt']] == [[x['filename'] for x in group] for group in groups]
+
+    def test_invalid_config(self):
+        filename = self.path('invalid.json')
+        with open(filename, 'w') as f:
+            json.dump({'sources': [{'filename': 'x.json'}], 'targets': []}, f)
+        with self.assertRaises(ValueError):
+            main(['run', filename])
+
+    def test_convert(self):
+        main(['convert', self.path('source.json'), self.path('source.jsonl')])
+        main(['convert', self.path('source.jsonl'), self.path('roundtrip.json')])
+        assert self.read('source.json') == self.read('roundtrip.json')
+
+    def test_closure(self):
+        main(['closure', self.path('source.json'), self.path('closure.csv')])
+        assert b'id,ancestor,distance\r\nREAL013995,REAL012789,1\r\n' == self.read('closure.csv')
+
+        main(['closure', self.path('source.json'), self.path('closure.json')])
+        assert {'REAL012789': [], 'REAL013995': ['REAL012789']} == json.loads(self.read('closure.json').decode('utf-8'))
+
+    def test_progress_printer(self):
+        stream = StringIO()
+        printer = ProgressPrinter(stream)
+        printer({'name': 'marc21', 'items': 500, 'total': 1000, 'fraction': 0.5, 'elapsed': 2.,
+                 'rate': 250., 'eta': 2., 'finished': False})
+        printer({'name': 'marc21', 'items': 1000, 'total': 1000, 'fraction': 1., 'elapsed': 4.,
+                 'rate': 250., 'eta': 0., 'finished': True})
+        lines = stream.getvalue().split('\r')
+        assert 'marc21: 500/1000 (50%), 250/s, ETA 0:02' == lines[1].strip()
+        assert 'marc21: 1000/1000, 250/s, 0:04' == lines[2].strip()
@@ -0,0 +1,52 @@
+# encoding=utf-8
+from __future__ import print_function
+import unittest
+
+from roald.models.resources import Resources
+
+
+class TestCompoundHeadings(unittest.TestCase):
+
+    testdata = [
+        {'id': 'REAL012789', 'type': ['Topic'],
+         'prefLabel': {'nb': {'value': 'Fornybar energi'}, 'en': {'value': 'Renewable energy'}}},
+        {'id': 'REAL013995', 'type': ['Geographic'],
+         'prefLabel': {'nb': {'value': 'Norge'}, 'nn': {'value': 'Noreg'}}},
+        {'id': 'REAL022146', 'type': ['Topic', 'CompoundHeading'], 'prefLabel': {},
+         'component': ['REAL012789', 'REAL013995']},
+    ]
+
+    def test_labels(self):
+        resources = Resources().load(self.testdata)
+        compound = resources.compound_headings.get('REAL022146')
+
+        assert ['REAL012789', 'REAL013995'] == [x['id'] for x in compound.components]
+        assert {'nb': 'Fornybar energi : Norge'} == compound.labels
+        assert {'nb': [('a', 'Fornybar energi'), ('z', 'Norge')]} == compound.subfields
+        assert 'REAL022146' == resources.get(term='Fornybar energi : Norge', lang='nb')['id']
+
+        assert 'Fornybar energi : Noreg' == compound.label('nn', 'nb')
+        assert 'Renewable energy : Norge' == compound.label('en', 'nb')
+        assert compound.label('en') is None
+        assert compound is resources.compound_headings.get('REAL022146')
+
+    def test_changes(self):
+        resources = Resources().load(self.testdata)
+        compound = resources.compound_headings.get('REAL022146')
+
+        resources['REAL013995'].set('prefLabel.en', 'Norway')
+        changed = resources.compound_headings.get('REAL022146')
+        assert changed is not compound
+        assert {'nb': 'Fornybar energi : Norge', 'en': 'Renewable energy : Norway'} == changed.labels
+
+        resources['REAL022146'].set('definition.nb', 'Energi i Norge')
+        assert changed is resources.compound_headings.get('REAL022146')
+
+    def test_components_loaded_later(self):
+        resources = Resources()
+        resources.load(self.testdata[2:])
+        with self.assertRaises(KeyError):
+            resources.compound_headings.get('REAL022146')
+
+        resources.load(self.testdata[:2])
+        assert 'REAL022146' == resources.get(term='Fornybar energi : Norge', lang='nb')['id']
@@ -0,0 +1,158 @@
+# encoding=utf-8
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+from lxml import etree
+
+from roald import Roald
+from roald.enrichment import enrich, closing_tags
+
+
+def iso2709_record(fields):
+    """Builds an ISO 2709 record from a list of (tag, indicators, [(code, value), ...])."""
+    data = b''
+    directory = b''
+    for tag, indicators, subfields in fields:
+        body = indicators + b''.join([b'\x1f' + c + v.encode('utf-8') for c, v in subfields]) + b'\x1e'
+        directory += tag + b'%04d%05d' % (len(body), len(data))
+        data += body
+    base = 24 + len(directory) + 1
+    return b'%05d' % (base + len(data) + 1) + b'nam a22' + b'%05d' % base + b' i 4500' + directory + b'\x1e' + data + b'\x1d'
+
+
+def iso2709_fields(record):
+    base = int(record[12:17])
+    directory = record[24:base - 1]
+    out = []
+    for n in range(0, len(directory), 12):
+        length, start = int(directory[n + 3:n + 7]), int(directory[n + 7:n + 12])
+        body = record[base + start:base + start + length]
+        assert body.endswith(b'\x1e')
+        out.append((directory[n:n + 3], [(x[:1], x[1:].decode('utf-8')) for x in body[2:-1].split(b'\x1f')[1:]]))
+    return out
+
+
+class TestEnrichment(unittest.TestCase):
+
+    testdata = [
+        {'id': 'REAL012789', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Fornybar energi'},
+                                                               'en': {'value': 'Renewable energy'}}},
+        {'id': 'REAL013995', 'type': ['Geographic'], 'prefLabel': {'nb': {'value': 'Norge'}}},
+        {'id': 'REAL022146', 'type': ['Topic', 'CompoundHeading'], 'prefLabel': {},
+         'component': ['REAL012789', 'REAL013995']},
+        {'id': 'REAL030070', 'type': ['GenreForm'], 'prefLabel': {'nb': {'value': 'Atlas'}}},
+        {'id': 'REAL030071', 'type': ['GenreForm'], 'prefLabel': {'nb': {'value': 'Atlas'}}},
+        {'id': 'REAL030072', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Foreldet'}}, 'deprecated': True},
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.roald = Roald()
+        self.roald.set_uri_format('http://data.ub.uio.no/realfagstermer/c{id}', 'REAL')
+        self.roald.vocabulary.resources.load(self.testdata)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, filename):
+        return os.path.join(self.tmp, filename)
+
+    def test_authorize(self):
+        authorize = self.roald.authorize
+        assert 'REAL012789' == authorize('Fornybar energi')['id']
+        assert 'REAL012789' == authorize('renewable  energy')['id']
+        assert 'REAL022146' == authorize('Fornybar energi : Norge')['id']
+        assert 'REAL022146' == authorize('$a Fornybar energi $z Norge')['id']
+        assert 'REAL022146' == authorize('$a Fornybar energi $z Norge', tag='650')['id']
+        assert authorize('$a Fornybar energi $x Norge', tag='650') is None
+        assert authorize('$a Fornybar energi', tag='651') is None
+        assert authorize('Atlas') is None  # ambiguous
+        assert authorize('Foreldet') is None  # deprecated
+        assert authorize('Ukjent') is None
+
+        assert authorize('Noreg') is None
+        self.roald.vocabulary.resources.get(id='REAL013995').set('prefLabel.nn', 'Noreg')
+        assert 'REAL013995' == authorize('Noreg')['id']
+
+    def records(self):
+        return [
+            [(b'001', b'', []),
+             (b'245', b'10', [(b'a', u'Atlas over Norge')]),
+             (b'650', b' 7', [(b'a', u'Fornybar energi'), (b'z', u'Norge'), (b'2', u'noubomn')]),
+             (b'651', b' 7', [(b'a', u'Norge'), (b'2', u'noubomn')]),
+             (b'655', b' 7', [(b'a', u'Atlas'), (b'2', u'noubomn')]),
+             (b'650', b' 7', [(b'a', u'Solenergi'), (b'2', u'noubomn')]),
+             (b'650', b' 0', [(b'a', u'Renewable energy'), (b'2', u'lcsh')])],
+            [(b'650', b' 7', [(b'a', u'Fornybar energi'), (b'2', u'noubomn'), (b'0', u'http://example.org/x')]),
+             (b'650', b' 7', [(b'a', u'Solenergi'), (b'2', u'noubomn')])],
+        ]
+
+    def check_counts(self, report):
+        assert {'records': 2, 'fields': 6, 'linked': 2, 'unmatched': 2, 'ambiguous': 1,
+                'already_linked': 1} == report.counts
+        assert [('650 $a Solenergi', 2)] == report.unmatched.most_common()
+
+    def test_iso2709(self):
+        records = self.records()
+        with open(self.path('bib.mrc'), 'wb') as f:
+            for fields in records:
+                f.write(iso2709_record(fields))
+
+        for jobs in [1, 2]:
+            report = enrich(self.roald.vocabulary, self.path('bib.mrc'), self.path('out.mrc'), 'noubomn',
+                            jobs=jobs, batch_size=1)
+            self.check_counts(report)
+
+            with open(self.path('out.mrc'), 'rb') as f:
+                out = f.read().split(b'\x1d')
+            assert b'' == out[-1]
+            fields = iso2709_fields(out[0] + b'\x1d')
+            assert (b'650', [(b'a', u'Fornybar energi'), (b'z', u'Norge'), (b'2', u'noubomn'),
+                             (b'0', u'http://data.ub.uio.no/realfagstermer/c022146')]) == fields[2]
+            assert (b'0', u'http://data.ub.uio.no/realfagstermer/c013995') == fields[3][1][-1]
+            assert [(b'a', u'Atlas'), (b'2', u'noubomn')] == fields[4][1]
+            assert [(b'a', u'Renewable energy'), (b'2', u'lcsh')] == fields[6][1]
+            # Unchanged records are kept as they were
+            assert iso2709_record(records[1]) == out[1] + b'\x1d'
+
+        report = enrich(self.roald.vocabulary, self.path('bib.mrc'), self.path('out.mrc'), 'noubomn', overwrite=True)
+        assert 3 == report.counts['linked']
+        with open(self.path('out.mrc'), 'rb') as f:
+            fields = iso2709_fields(f.read().split(b'\x1d')[1] + b'\x1d')
+        assert [(b'a', u'Fornybar energi'), (b'2', u'noubomn'),
+                (b'0', u'http://data.ub.uio.no/realfagstermer/c012789')] == fields[0][1]
+
+    def test_marcxml(self):
+        def record(fields):
+            return u''.join([u'<record><leader>00000nam a2200000 i 4500</leader>'] + [
+                u'<datafield tag="{}" ind1="{}" ind2="{}">{}</datafield>'.format(
+                    tag.decode('ascii'), ind[:1].decode('ascii'), ind[1:].decode('ascii'),
+                    u''.join([u'<subfield code="{}">{}</subfield>'.format(c.decode('ascii'), v) for c, v in sf]))
+                for tag, ind, sf in fields if sf
+            ] + [u'</record>\n'])
+
+        with open(self.path('bib.xml'), 'wb') as f:
+            f.write(u'<?xml version="1.0" encoding="UTF-8"?>\n<marc:collection '
+                    u'xmlns:marc="http://www.loc.gov/MARC21/slim">\n'.encode('utf-8'))
+            body = u''.join([record(x) for x in self.records()])
+            f.write(body.replace(u'<', u'<marc:').replace(u'<marc:/', u'</marc:').encode('utf-8'))
+            f.write(b'</marc:collection>\n')
+
+        for jobs in [1, 2]:
+            report = enrich(self.roald.vocabulary, self.path('bib.xml'), self.path('out.xml'), 'noubomn',
+                            jobs=jobs, batch_size=1)
+            self.check_counts(report)
+
+            doc = etree.parse(self.path('out.xml'))
+            ns = {'marc': 'http://www.loc.gov/MARC21/slim'}
+            assert 2 == len(doc.xpath('/marc:collection/marc:record', namespaces=ns))
+            links = doc.xpath('//marc:datafield/marc:subfield[@code="0"]/text()', namespaces=ns)
+            assert ['http://data.ub.uio.no/realfagstermer/c022146', 'http://data.ub.uio.no/realfagstermer/c013995',
+                    'http://example.org/x'] == links
+
+    def test_closing_tags(self):
+        assert b'</collection>' == closing_tags(b'<?xml version="1.0"?>\n<!-- x -->\n<collection xmlns="x">\n')
+        assert b'</b></a>' == closing_tags(b'<a><b><c/><d></d>')
+        assert b'' == closing_tags(b'')
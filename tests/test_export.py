@@ -0,0 +1,174 @@
+# encoding=utf-8
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+from iso639 import languages
+from rdflib.graph import Graph
+
+from roald import Roald
+
+
+class ExportTestCase(unittest.TestCase):
+
+    testdata = [
+        {
+            'id': 'REAL012789',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Fornybar energi'}, 'en': {'value': 'Renewable energy'}},
+            'altLabel': {'nb': [{'value': 'Fornybare energikilder'}]},
+            'created': '2015-02-20T13:08:04Z',
+        },
+        {
+            'id': 'REAL013995',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}},
+            'broader': ['REAL012789'],
+            'created': '2015-02-20T13:08:04Z',
+            'modified': '2016-03-01T10:00:00Z',
+        },
+        {
+            'id': 'REAL022146',
+            'type': ['CompoundHeading'],
+            'component': ['REAL012789', 'REAL013995'],
+            'prefLabel': {}
+        },
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        with open(self.path('scheme.ttl'), 'w') as f:
+            f.write('<http://data.ub.uio.no/realfagstermer/> a <http://www.w3.org/2004/02/skos/core#ConceptScheme> .\n')
+
+        self.roald = Roald()
+        self.roald.vocabulary.default_language = languages.get(alpha2='nb')
+        self.roald.set_uri_format('http://data.ub.uio.no/realfagstermer/c{id}')
+        self.roald.vocabulary.resources.load(self.testdata)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, filename):
+        return os.path.join(self.tmp, filename)
+
+    def read(self, filename):
+        with open(self.path(filename), 'rb') as f:
+            return f.read()
+
+
+class TestExportMany(ExportTestCase):
+
+    def test_same_output_as_single_exports(self):
+        marc21options = {'vocabulary_code': 'noubomn', 'created_by': 'NoOU', 'include_narrower': True}
+        self.roald.export(self.path('single.marc21.xml'), format='marc21', **marc21options)
+        self.roald.save(self.path('single.json'))
+
+        self.roald.export_many([
+            dict(filename=self.path('many.marc21.xml'), format='marc21', **marc21options),
+            {'filename': self.path('many.json'), 'format': 'roald3'},
+            {'filename': self.path('many.ttl'), 'format': 'rdfskos', 'include': [self.path('scheme.ttl')]},
+            {'filename': self.path('many.nt'), 'format': 'rdfskos', 'include': [self.path('scheme.ttl')]},
+        ])
+
+        assert self.read('single.marc21.xml') == self.read('many.marc21.xml')
+        assert self.read('single.json') == self.read('many.json')
+
+        ttl = Graph().parse(self.path('many.ttl'), format='turtle')
+        nt = Graph().parse(self.path('many.nt'), format='nt')
+        assert len(ttl) > 0
+        assert set(ttl) == set(nt)
+
+    def test_shared_values(self):
+        import isodate
+        parse_datetime = isodate.parse_datetime
+        calls = []
+
+        def counting_parse_datetime(value):
+            calls.append(value)
+            return parse_datetime(value)
+
+        isodate.parse_datetime = counting_parse_datetime
+        try:
+            self.roald.export_many([
+                {'filename': self.path('a.marc21.xml'), 'format': 'marc21', 'vocabulary_code': 'noubomn'},
+                {'filename': self.path('b.marc21.xml'), 'format': 'marc21', 'vocabulary_code': 'noubomn',
+                 'include_narrower': True},
+            ])
+        finally:
+            isodate.parse_datetime = parse_datetime
+        # Each date is parsed once, not once per target
+        assert ['2015-02-20T13:08:04Z', '2015-02-20T13:08:04Z', '2016-03-01T10:00:00Z'] == calls
+
+    def test_manifest_saved_after_output(self):
+        target = {'filename': self.path('a.marc21.xml'), 'format': 'marc21', 'vocabulary_code': 'noubomn',
+                  'manifest': self.path('manifest.json')}
+        missing = self.path(os.path.join('missing', 'a.ttl'))
+
+        # The MARC21 file is written, but the export fails before it completes
+        with self.assertRaises(IOError):
+            self.roald.export_many([target, {'filename': missing, 'format': 'rdfskos',
+                                             'include': [self.path('scheme.ttl')]}])
+        assert not os.path.exists(self.path('manifest.json'))
+        with self.assertRaises(IOError):
+            self.roald.export(missing, 'marc21', vocabulary_code='noubomn', manifest=self.path('manifest.json'))
+        assert not os.path.exists(self.path('manifest.json'))
+
+        self.roald.export_many([target])
+        assert os.path.isfile(self.path('manifest.json'))
+        assert ['a.marc21.xml', 'manifest.json', 'scheme.ttl'] == sorted(os.listdir(self.tmp))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            self.roald.export_many([{'filename': self.path('x'), 'format': 'pdf'}])
+
+
+class TestVocabularyView(ExportTestCase):
+
+    def topics(self):
+        return self.roald.view(lambda resource: 'Topic' in resource.get('type', []))
+
+    def test_view(self):
+        view = self.topics()
+        assert ['REAL012789', 'REAL013995'] == [x['id'] for x in view.resources]
+        assert 2 == len(view.resources)
+        # Lookups resolve against the full vocabulary
+        assert 'REAL022146' == view.resources['REAL022146']['id']
+        assert view.resources['REAL012789'] is self.roald.vocabulary.resources['REAL012789']
+
+        view = self.roald.view(ids=['REAL013995'])
+        assert ['REAL013995'] == [x['id'] for x in view.resources.find(type='Topic')]
+
+    def test_marc21(self):
+        options = {'vocabulary_code': 'noubomn', 'include_narrower': True}
+        self.roald.export(self.path('view.marc21.xml'), format='marc21',
+                          vocabulary=self.roald.view(ids=['REAL012789']), **options)
+        data = self.read('view.marc21.xml').decode('utf-8')
+        assert 'REAL012789' in data
+        assert '<controlfield tag="001">REAL013995</controlfield>' not in data
+        # Narrower resources outside the view are still referred to
+        assert 'Livssyklusanalyse' in data
+
+    def test_skos(self):
+        self.roald.export(self.path('view.ttl'), format='rdfskos', include=[self.path('scheme.ttl')],
+                          vocabulary=self.topics())
+        graph = Graph().parse(self.path('view.ttl'), format='turtle')
+        subjects = set(str(x) for x in graph.subjects())
+        assert 'http://data.ub.uio.no/realfagstermer/c012789' in subjects
+        assert 'http://data.ub.uio.no/realfagstermer/c022146' not in subjects
+
+    def test_skos_parallel(self):
+        self.roald.export(self.path('view.ttl'), format='rdfskos', include=[self.path('scheme.ttl')],
+                          vocabulary=self.topics(), workers=2)
+        graph = Graph().parse(self.path('view.ttl'), format='turtle')
+        assert 'http://data.ub.uio.no/realfagstermer/c022146' not in set(str(x) for x in graph.subjects())
+
+    def test_export_many(self):
+        self.roald.export_many([
+            {'filename': self.path('all.json'), 'format': 'roald3'},
+            {'filename': self.path('topics.json'), 'format': 'roald3', 'vocabulary': self.topics()},
+            {'filename': self.path('topics.marc21.xml'), 'format': 'marc21', 'vocabulary': self.topics()},
+        ])
+        assert b'REAL022146' in self.read('all.json')
+        assert b'REAL022146' not in self.read('topics.json')
+        assert b'REAL022146' not in self.read('topics.marc21.xml')
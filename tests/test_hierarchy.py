@@ -0,0 +1,105 @@
+# encoding=utf-8
+from __future__ import print_function
+import unittest
+
+from roald.models.hierarchy import Hierarchy
+from roald.models.resources import Resources
+
+
+class TestHierarchy(unittest.TestCase):
+
+    #          A       G (collection)
+    #         / \\      |
+    #        B   C     H
+    #         \\ / \\
+    #          D   E
+    #          |
+    #          F
+    testdata = [
+        {'id': 'A', 'type': ['Topic'], 'prefLabel': {}},
+        {'id': 'B', 'type': ['Topic'], 'prefLabel': {}, 'broader': ['A']},
+        {'id': 'C', 'type': ['Topic'], 'prefLabel': {}, 'broader': ['A']},
+        {'id': 'D', 'type': ['Topic'], 'prefLabel': {}, 'broader': ['B', 'C']},
+        {'id': 'E', 'type': ['Topic'], 'prefLabel': {}, 'broader': ['C']},
+        {'id': 'F', 'type': ['Topic'], 'prefLabel': {}, 'broader': ['D']},
+        {'id': 'G', 'type': ['Collection'], 'prefLabel': {}, 'superOrdinate': ['C']},
+        {'id': 'H', 'type': ['Topic'], 'prefLabel': {}, 'memberOf': ['G']},
+    ]
+
+    def setUp(self):
+        self.resources = Resources().load(self.testdata)
+
+    def test_ancestors(self):
+        hierarchy = self.resources.hierarchy()
+        assert ['D', 'B', 'C', 'A'] == hierarchy.ancestors('F')
+        assert ['G', 'C', 'A'] == hierarchy.ancestors('H')
+        assert [] == hierarchy.ancestors('A')
+        with self.assertRaises(KeyError):
+            hierarchy.ancestors('X')
+
+        assert ['F', 'D', 'B', 'C', 'A'] == [x for x in 'FDBCA' if x == 'F' or hierarchy.is_ancestor(x, 'F')]
+        assert not hierarchy.is_ancestor('E', 'F')
+        assert not hierarchy.is_ancestor('F', 'F')
+
+    def test_descendants(self):
+        hierarchy = self.resources.hierarchy()
+        assert ['B', 'C', 'D', 'E', 'G', 'F', 'H'] == hierarchy.descendants('A')
+        assert ['D', 'E', 'G', 'F', 'H'] == hierarchy.descendants('C')
+        assert [] == hierarchy.descendants('F')
+
+        broader_only = self.resources.hierarchy(['broader'])
+        assert ['D', 'E', 'F'] == broader_only.descendants('C')
+
+    def test_depth(self):
+        hierarchy = self.resources.hierarchy()
+        assert [0, 1, 2, 3, 3] == [hierarchy.depth(x) for x in 'ABDFH']
+
+    def test_closure(self):
+        rows = list(self.resources.hierarchy(['broader']).closure())
+        assert ('B', 'A', 1) == rows[0]
+        assert [('F', 'D', 1), ('F', 'B', 2), ('F', 'C', 2), ('F', 'A', 3)] == [x for x in rows if x[0] == 'F']
+
+    def test_changes(self):
+        hierarchy = self.resources.hierarchy()
+        self.resources['E'].add('broader', 'B')
+        assert hierarchy is self.resources.hierarchy()
+        assert self.resources.hierarchy().is_ancestor('B', 'E')
+
+        hierarchy = self.resources.hierarchy()
+        self.resources['E'].set('prefLabel.nb', 'E')
+        assert hierarchy is self.resources.hierarchy()
+
+        self.resources.load([{'id': 'I', 'type': ['Topic'], 'prefLabel': {}, 'broader': ['F']}])
+        assert 4 == self.resources.hierarchy().depth('I')
+
+    def test_update_equals_rebuild(self):
+        hierarchy = self.resources.hierarchy()
+        assert ['D', 'E', 'G', 'F', 'H'] == hierarchy.descendants('C')
+        self.resources['D'].replace('broader', ['B'])
+        self.resources['C'].add('broader', 'B')
+        self.resources['H'].delete('memberOf')
+        self.resources['E'].add('broader', 'X')  # not loaded
+        assert hierarchy is self.resources.hierarchy()
+
+        rebuilt = Hierarchy(self.resources)
+        for x in 'ABCDEFGHX':
+            assert rebuilt.ancestors(x) == hierarchy.ancestors(x)
+            assert rebuilt.descendants(x) == hierarchy.descendants(x)
+        assert ['C', 'D', 'E', 'F', 'G'] == hierarchy.descendants('B')
+        assert 3 == hierarchy.depth('F')
+
+    def test_change_making_a_cycle(self):
+        hierarchy = self.resources.hierarchy()
+        self.resources['A'].add('broader', 'F')
+        assert hierarchy is not self.resources.hierarchy()
+        assert ['F', 'D', 'B', 'C'] == self.resources.hierarchy().ancestors('A')
+
+    def test_cycles(self):
+        resources = Resources().load([
+            {'id': 'A', 'type': ['Topic'], 'prefLabel': {}, 'broader': ['C']},
+            {'id': 'B', 'type': ['Topic'], 'prefLabel': {}, 'broader': ['A']},
+            {'id': 'C', 'type': ['Topic'], 'prefLabel': {}, 'broader': ['B']},
+        ])
+        hierarchy = resources.hierarchy()
+        assert ['C', 'B'] == hierarchy.ancestors('A')
+        assert [] == hierarchy.ancestors('B')
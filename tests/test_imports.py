@@ -0,0 +1,38 @@
+# encoding=utf-8
+from __future__ import print_function
+import subprocess
+import sys
+import unittest
+
+
+class TestLazyImports(unittest.TestCase):
+
+    heavy_modules = ['rdflib', 'skosify', 'otsrdflib', 'lxml', 'xmlwitch', 'isodate', 'requests', 'iso639']
+
+    def imported_modules(self, statement):
+        # Use a fresh interpreter, since the test session has imported everything already
+        code = statement + '; import sys; print(",".join(sorted(sys.modules)))'
+        return subprocess.check_output([sys.executable, '-c', code], universal_newlines=True).strip().split(',')
+
+    def test_import_roald_is_light(self):
+        modules = self.imported_modules('import roald')
+        assert [] == [x for x in self.heavy_modules if x in modules]
+
+    def test_import_cli_is_light(self):
+        # The enrich, usage and serve commands import their modules when run
+        modules = self.imported_modules('import roald.cli')
+        assert [] == [x for x in self.heavy_modules if x in modules]
+        assert [] == [x for x in ['roald.enrichment', 'roald.usage', 'roald.server', 'http.server', 'BaseHTTPServer']
+                      if x in modules]
+
+        modules = self.imported_modules('import roald.enrichment')
+        assert 'lxml' not in modules
+
+    def test_adapters_are_imported_on_first_use(self):
+        modules = self.imported_modules('import roald.adapters; roald.adapters.Roald3')
+        assert 'roald.adapters.roald3' in modules
+        assert 'roald.adapters.skos' not in modules
+        assert 'rdflib' not in modules
+
+        modules = self.imported_modules('from roald.adapters import Marc21')
+        assert 'lxml' in modules
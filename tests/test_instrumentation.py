@@ -0,0 +1,161 @@
+# encoding=utf-8
+from __future__ import print_function
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from iso639 import languages
+
+from roald import Roald
+from roald import instrumentation
+from roald.instrumentation import Instrumentation, phase, track
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_phase_without_active_instrumentation(self):
+        with phase('parse') as p:
+            p.items = 10
+        assert p.items == 10
+
+    def test_nested_phases(self):
+        instr = Instrumentation()
+        with instr.activate():
+            with phase('graph', format='rdfskos') as p:
+                with phase('skosify'):
+                    pass
+                p.items = 3
+
+        assert [x['phase'] for x in instr.records] == ['skosify', 'graph']
+        assert instr.records[0]['parent'] == 'graph'
+        assert instr.records[1]['parent'] is None
+        assert instr.records[1]['items'] == 3
+        assert instr.records[1]['format'] == 'rdfskos'
+
+        for record in instr.records:
+            for key in ['wall_seconds', 'cpu_seconds', 'process_peak_rss_mb', 'peak_rss_increase_mb']:
+                assert key in record
+
+    def test_peak_rss_increase(self):
+        # The process peak at the start and end of each phase
+        peaks = iter([100., 180., 180., 180.])
+        peak_rss_mb = instrumentation.peak_rss_mb
+        instrumentation.peak_rss_mb = lambda: next(peaks)
+        instr = Instrumentation()
+        try:
+            with instr.activate():
+                with phase('parse'):
+                    pass
+                with phase('index'):
+                    pass
+        finally:
+            instrumentation.peak_rss_mb = peak_rss_mb
+
+        parse, index = instr.records
+        assert (180., 80.) == (parse['process_peak_rss_mb'], parse['peak_rss_increase_mb'])
+        assert (180., 0.) == (index['process_peak_rss_mb'], index['peak_rss_increase_mb'])
+
+    def test_error_is_recorded(self):
+        instr = Instrumentation()
+        with self.assertRaises(ValueError):
+            with instr.activate():
+                with phase('parse'):
+                    raise ValueError()
+        assert instr.records[0]['error'] == 'ValueError'
+
+    def test_callbacks(self):
+        received = []
+
+        def failing(record):
+            raise RuntimeError()
+
+        instr = Instrumentation(callbacks=[failing, received.append])
+        with instr.activate():
+            with phase('write'):
+                pass
+        assert len(received) == 1
+        assert received[0]['phase'] == 'write'
+
+    def test_as_dict_and_jsonl(self):
+        instr = Instrumentation()
+        with instr.activate():
+            for n in [2, 3]:
+                with phase('write') as p:
+                    p.items = n
+
+        data = instr.as_dict()
+        assert len(data['phases']) == 2
+        assert data['totals']['write']['count'] == 2
+        assert data['totals']['write']['items'] == 5
+
+        lines = instr.to_jsonl().splitlines()
+        assert [json.loads(x)['items'] for x in lines] == [2, 3]
+
+    def test_progress(self):
+        states = []
+        instr = Instrumentation(progress=states.append)
+        instr.progress_interval = 0
+        with instr.activate():
+            items = list(track(range(200), 'marc21'))
+
+        assert list(range(200)) == items
+        assert [64, 128, 192, 200] == [x['items'] for x in states]
+        assert 200 == states[0]['total']
+        assert states[-1]['finished']
+        assert 1. == states[-1]['fraction']
+
+    def test_track_without_progress(self):
+        items = [1, 2, 3]
+        assert items is track(items, 'marc21')
+        with Instrumentation().activate():
+            assert items is track(items, 'marc21')
+
+
+class TestRoaldInstrumentation(unittest.TestCase):
+
+    testdata = [
+        {
+            'id': 'REAL012789',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Fornybar energi'}},
+            'created': '2015-02-20T13:08:04Z',
+        },
+        {
+            'id': 'REAL013995',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}},
+            'broader': ['REAL012789'],
+            'created': '2015-02-20T13:08:04Z',
+        },
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.roald = Roald()
+        self.roald.vocabulary.default_language = languages.get(alpha2='nb')
+        self.roald.set_uri_format('http://data.ub.uio.no/realfagstermer/c{id}')
+        self.roald.vocabulary.resources.load(self.testdata)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_load_and_export(self):
+        filename = os.path.join(self.tmp, 'test.json')
+        self.roald.save(filename)
+
+        roald = Roald()
+        roald.load(filename, format='roald3')
+        roald.export(os.path.join(self.tmp, 'test.marc21.xml'), format='marc21',
+                     vocabulary_code='noubomn', created_by='NoOU')
+
+        records = roald.instrumentation.records
+        phases = [x['phase'] for x in records]
+        assert phases == ['index', 'parse', 'validate', 'index', 'serialize', 'write']
+
+        parse = records[1]
+        assert parse['format'] == 'roald3'
+        assert parse['items'] == 2
+        assert records[2]['items'] == 2
+        assert records[4]['items'] == 2
+        assert records[5]['items'] == os.path.getsize(os.path.join(self.tmp, 'test.marc21.xml'))
@@ -0,0 +1,137 @@
+# encoding=utf-8
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+from iso639 import languages
+
+from roald import Roald
+from roald.models.journal import file_digest
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, 'vocabulary.json')
+        roald = Roald()
+        roald.vocabulary.default_language = languages.get(alpha2='nb')
+        roald.vocabulary.resources.load([
+            {'id': 'REAL012789', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Fornybar energi'}}},
+            {'id': 'REAL013995', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}}},
+        ])
+        roald.save(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def edit(self):
+        roald = Roald()
+        roald.load(self.filename, journal=True)
+        resources = roald.vocabulary.resources
+        resources.get(id='REAL013995').set('prefLabel.en', 'Life cycle assessment').add('broader', 'REAL012789')
+        resources.load([
+            {'id': 'REAL020000', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Solenergi'}}},
+        ])
+        return roald
+
+    def test_save_appends_to_journal(self):
+        digest = file_digest(self.filename)
+        roald = self.edit()
+        roald.save(self.filename)
+
+        assert digest == file_digest(self.filename)
+        with open(self.filename + '.journal') as stream:
+            assert 4 == len(stream.readlines())  # header + 3 changes
+
+        roald.vocabulary.resources.get(id='REAL012789').set('prefLabel.en', 'Renewable energy')
+        roald.save(self.filename)
+        with open(self.filename + '.journal') as stream:
+            assert 5 == len(stream.readlines())
+
+    def test_load_replays_journal(self):
+        self.edit().save(self.filename)
+
+        roald = Roald()
+        roald.load(self.filename)
+        resources = roald.vocabulary.resources
+        assert 3 == len(resources)
+        resource = resources.get(id='REAL013995')
+        assert 'Life cycle assessment' == resource.prefLabel['en'].value
+        assert ['REAL012789'] == resource.get('broader')
+        assert 'Solenergi' == resources.get(id='REAL020000').prefLabel['nb'].value
+
+    def test_compact(self):
+        roald = self.edit()
+        roald.save(self.filename)
+        roald.compact()
+
+        assert not os.path.exists(self.filename + '.journal')
+        expected = [x.serialize() for x in roald.vocabulary.resources]
+
+        # Changes after compaction are journaled against the new snapshot
+        roald.vocabulary.resources.get(id='REAL012789').set('prefLabel.en', 'Renewable energy')
+        roald.save(self.filename)
+        expected[0]['prefLabel']['en'] = {'value': 'Renewable energy'}
+
+        roald2 = Roald()
+        roald2.load(self.filename)
+        assert expected == [x.serialize() for x in roald2.vocabulary.resources]
+
+    def test_journal_for_other_snapshot_is_ignored(self):
+        self.edit().save(self.filename)
+        journal = open(self.filename + '.journal').read()
+
+        # Writing a full snapshot elsewhere and moving it in place leaves a stale journal
+        roald = Roald()
+        roald.load(self.filename)
+        roald.vocabulary.resources.get(id='REAL012789').set('prefLabel.en', 'Renewable energy')
+        other = os.path.join(self.tmp, 'other.json')
+        roald.save(other)
+        os.replace(other, self.filename)
+        with open(self.filename + '.journal', 'w') as stream:
+            stream.write(journal)
+
+        roald = Roald()
+        roald.load(self.filename)
+        assert 3 == len(roald.vocabulary.resources)
+        assert 'Renewable energy' == roald.vocabulary.resources.get(id='REAL012789').prefLabel['en'].value
+
+    def test_full_save_removes_stale_journal(self):
+        self.edit().save(self.filename)
+        roald = Roald()
+        roald.load(self.filename)
+        roald.save(self.filename)
+        assert not os.path.exists(self.filename + '.journal')
+
+    def test_replace_and_delete(self):
+        roald = Roald()
+        roald.load(self.filename, journal=True)
+        resources = roald.vocabulary.resources
+        resources.get(id='REAL012789').set_type('Geographic')
+        resource = resources.get(id='REAL013995')
+        resource.replace('prefLabel.nb', 'LCA').set('note', 'x').replace('note', 'y')
+        resource.set('editorialNote', 'z').delete('editorialNote').delete('unknown')
+        roald.save(self.filename)
+
+        roald = Roald()
+        roald.load(self.filename)
+        resources = roald.vocabulary.resources
+        assert ['Geographic'] == resources.get(id='REAL012789').get('type')
+        resource = resources.get(id='REAL013995')
+        assert 'LCA' == resource.prefLabel['nb'].value
+        assert 'y' == resource.get('note')
+        assert 'editorialNote' not in resource
+
+    def test_failed_flush_is_retried(self):
+        roald = Roald()
+        roald.load(self.filename, journal=True)
+        journal = roald.vocabulary.resources.journal
+        roald.vocabulary.resources.get(id='REAL012789').set('prefLabel.en', 'Renewable energy')
+        journal.pending.append({'op': 'set', 'value': object()})  # fails to serialize
+        self.assertRaises(TypeError, journal.flush)
+        journal.pending.pop()
+        assert 1 == journal.flush()
+        with open(self.filename + '.journal') as stream:
+            assert 2 == len(stream.readlines())
@@ -1,5 +1,8 @@
 # encoding=utf-8
 from __future__ import print_function
+import os
+import shutil
+import tempfile
 import unittest
 from lxml import etree
 import pytest
@@ -95,3 +98,71 @@ class TestConverter(unittest.TestCase):
         c = tree.xpath('count(//m:record)',
                        namespaces={'m': 'info:lc/xmlns/marcxchange-v1'})
         self.assertEqual(2, c)
+
+
+class TestIncrementalExport(unittest.TestCase):
+
+    testdata = [
+        {
+            'id': 'REAL012789',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Fornybar energi'}},
+            'created': '2015-02-20T13:08:04Z',
+        },
+        {
+            'id': 'REAL013995',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}},
+            'broader': ['REAL012789'],
+            'created': '2015-02-20T13:08:04Z',
+        },
+        {
+            'id': 'REAL020000',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Solenergi'}},
+            'created': '2015-02-20T13:08:04Z',
+        },
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.manifest = os.path.join(self.tmp, 'manifest.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def export(self, data):
+        voc = Vocabulary()
+        voc.default_language = languages.get(alpha2='nb')
+        voc.resources.load(data)
+        m21 = Marc21(voc, created_by='NoOU', include_narrower=True, manifest=self.manifest)
+        tree = etree.parse(BytesIO(m21.serialize()))
+        m21.commit()
+        ns = {'m': 'info:lc/xmlns/marcxchange-v1'}
+        return [(r.xpath('string(m:controlfield[@tag="001"])', namespaces=ns),
+                 r.xpath('string(m:leader)', namespaces=ns)[5])
+                for r in tree.xpath('//m:record', namespaces=ns)]
+
+    def test_first_export_includes_all(self):
+        assert 3 == len(self.export(self.testdata))
+        assert os.path.isfile(self.manifest)
+
+    def test_unchanged(self):
+        self.export(self.testdata)
+        assert [] == self.export(self.testdata)
+
+    def test_changed_label_affects_related_records(self):
+        self.export(self.testdata)
+        data = [dict(x) for x in self.testdata]
+        data[0]['prefLabel'] = {'nb': {'value': 'Fornybare energikilder'}}
+
+        # The narrower concept refers to the changed concept by label
+        assert [('REAL012789', 'n'), ('REAL013995', 'n')] == self.export(data)
+
+    def test_deleted_and_deprecated(self):
+        self.export(self.testdata)
+        data = [dict(x) for x in self.testdata[:2]]
+        data[1]['deprecated'] = '2020-01-01T00:00:00Z'
+
+        assert [('REAL013995', 'd'), ('REAL020000', 'd')] == self.export(data)
+        assert [] == self.export(data)
@@ -0,0 +1,125 @@
+# encoding=utf-8
+from __future__ import print_function
+import unittest
+from io import BytesIO
+from iso639 import languages
+from rdflib.graph import Graph
+from rdflib.namespace import URIRef
+
+from roald.adapters.marc21 import Marc21
+from roald.adapters.skos import Skos
+from roald.models.vocabulary import Vocabulary
+from roald.profiling import RecordProfiler
+
+
+class TestRecordProfiler(unittest.TestCase):
+
+    def test_keeps_top_records(self):
+        profiler = RecordProfiler(top=2)
+        for n, seconds in enumerate([0.1, 0.5, 0.2, 0.4]):
+            profiler.add('R%d' % n, ['Topic'], seconds, 10)
+
+        assert ['R1', 'R3'] == [x['id'] for x in profiler.top_records()]
+        assert 4 == profiler.n_records
+        assert 40 == profiler.total_size
+
+    def test_rank_by_size(self):
+        profiler = RecordProfiler(top=1, rank_by='size')
+        profiler.add('R1', ['Topic'], 0.5, 10)
+        profiler.add('R2', ['Topic'], 0.1, 20)
+        assert ['R2'] == [x['id'] for x in profiler.top_records()]
+
+    def test_merge(self):
+        a = RecordProfiler(top=2)
+        b = RecordProfiler(top=2)
+        a.add('R1', ['Topic'], 0.1, 1)
+        a.count('acronym')
+        b.add('R2', ['Topic'], 0.3, 1)
+        b.add('R3', ['Topic'], 0.2, 1)
+        b.count('acronym', 2)
+        a.merge(b)
+
+        assert ['R2', 'R3'] == [x['id'] for x in a.top_records()]
+        assert 3 == a.n_records
+        assert 3 == a.counts['acronym']
+        assert 'R2' in a.report()
+
+
+class TestExportProfiling(unittest.TestCase):
+
+    testdata = [
+        {
+            'id': 'REAL012789',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Fornybar energi'}},
+            'altLabel': {'nb': [{'value': 'FE', 'acronymFor': 'Fornybar energi'}]},
+            'mappings': {'closeMatch': ['http://dewey.info/class/333.794/e23/',
+                                        'http://data.ub.uio.no/humord/c12345']},
+            'created': '2015-02-20T13:08:04Z',
+        },
+        {
+            'id': 'REAL013995',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}},
+            'created': '2015-02-20T13:08:04Z',
+        },
+        {
+            'id': 'REAL022146',
+            'type': ['CompoundHeading'],
+            'component': ['REAL012789', 'REAL013995'],
+            'prefLabel': {},
+            'created': '2015-02-20T13:08:04Z',
+        },
+    ]
+
+    def get_vocabulary(self):
+        voc = Vocabulary()
+        voc.default_language = languages.get(alpha2='nb')
+        voc.uri_format = 'http://data.ub.uio.no/realfagstermer/c{id}'
+        voc.resources.load(self.testdata)
+        return voc
+
+    def test_marc21(self):
+        profiler = RecordProfiler(top=2, rank_by='size')
+        marc21 = Marc21(self.get_vocabulary(), vocabulary_code='noubomn', created_by='NoOU', profiler=profiler)
+        out = marc21.serialize()
+
+        assert 3 == profiler.n_records
+        assert 'REAL012789' == profiler.top_records()[0]['id']
+        # Everything except the XML declaration and the collection element
+        assert 0 < profiler.total_size < len(out)
+        assert 2 == profiler.counts['mapping.closeMatch']
+        assert 1 == profiler.counts['compound_heading']
+        assert 1 == profiler.counts['acronym']
+
+    def test_marc21_output_unchanged(self):
+        plain = Marc21(self.get_vocabulary(), vocabulary_code='noubomn').serialize()
+        profiled = Marc21(self.get_vocabulary(), vocabulary_code='noubomn', profiler=RecordProfiler()).serialize()
+        assert plain == profiled
+
+        stream = BytesIO()
+        Marc21(self.get_vocabulary(), vocabulary_code='noubomn', profiler=RecordProfiler()).serialize(stream)
+        assert plain == stream.getvalue()
+
+    def convert_skos(self, profiler, workers):
+        graph = Graph()
+        skos = Skos(self.get_vocabulary(), workers=workers, profiler=profiler)
+        skos.convert_resources(graph, URIRef('http://data.ub.uio.no/realfagstermer/'))
+        return graph
+
+    def test_skos(self):
+        profiler = RecordProfiler()
+        graph = self.convert_skos(profiler, workers=1)
+
+        assert 3 == profiler.n_records
+        assert len(graph) == profiler.total_size
+        assert 2 == profiler.counts['mapping.closeMatch']
+        assert 1 == profiler.counts['compound_heading']
+
+    def test_skos_parallel(self):
+        serial = RecordProfiler()
+        parallel = RecordProfiler()
+        assert set(self.convert_skos(serial, workers=1)) == set(self.convert_skos(parallel, workers=2))
+        assert serial.n_records == parallel.n_records
+        assert serial.total_size == parallel.total_size
+        assert serial.counts == parallel.counts
@@ -0,0 +1,100 @@
+# encoding=utf-8
+from __future__ import print_function
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import pytest
+from iso639 import languages
+
+from roald import Roald
+from roald.adapters.registry import FormatRegistry, formats
+from roald.adapters.roald3 import Roald3
+from roald.models.vocabulary import Vocabulary
+
+
+class UpperCaseWriter(object):
+    """A third-party style writer implementing only `write_resources`."""
+
+    def __init__(self, vocabulary):
+        self.vocabulary = vocabulary
+
+    def write_resources(self, resources, sink):
+        for resource in resources:
+            sink.write(resource.prefLabel['nb'].value.upper().encode('utf-8') + b'\n')
+
+
+class TestFormatRegistry(unittest.TestCase):
+
+    def test_builtin_formats(self):
+        registry = FormatRegistry(entry_point_group=None)
+        assert Roald3 is registry.get('roald3')
+        assert 'marc21' in registry.names()
+
+    def test_unknown_format(self):
+        registry = FormatRegistry(entry_point_group=None)
+        with pytest.raises(ValueError):
+            registry.get('pdf')
+
+    def test_register_lazy(self):
+        registry = FormatRegistry(entry_point_group=None)
+        registry.register('upper', __name__ + ':UpperCaseWriter')
+        assert UpperCaseWriter is registry.writer('upper')
+
+    def test_unregister(self):
+        registry = FormatRegistry(entry_point_group=None)
+        registry.register('upper', UpperCaseWriter)
+        registry.unregister('upper')
+        with pytest.raises(ValueError):
+            registry.get('upper')
+
+    def test_reader_and_writer(self):
+        registry = FormatRegistry(entry_point_group=None)
+        registry.register('upper', UpperCaseWriter)
+        with pytest.raises(ValueError):
+            registry.reader('upper')
+        with pytest.raises(ValueError):
+            registry.writer('roald2')
+
+
+class TestPipeline(unittest.TestCase):
+
+    testdata = [
+        {'id': 'REAL012789', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Fornybar energi'}}},
+        {'id': 'REAL013995', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}},
+         'broader': ['REAL012789']},
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, 'voc.json')
+        voc = Vocabulary()
+        voc.default_language = languages.get(alpha2='nb')
+        voc.resources.load(x for x in self.testdata)
+        Roald3(voc).save(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_generator_pipeline(self):
+        voc = Vocabulary()
+        voc.resources.load(formats.reader('roald3')(voc).iter_resources(self.filename))
+        assert 2 == len(voc.resources)
+        assert 'nb' == voc.default_language.alpha2
+
+        sink = io.BytesIO()
+        formats.writer('roald3')(voc).write_resources(voc.resources, sink)
+        with open(self.filename, 'rb') as f:
+            assert f.read() == sink.getvalue()
+
+    def test_third_party_writer(self):
+        formats.register('upper', UpperCaseWriter)
+        self.addCleanup(formats.unregister, 'upper')
+        roald = Roald()
+        roald.load(self.filename)
+        roald.export_many([{'filename': os.path.join(self.tmp, 'voc.txt'), 'format': 'upper'}])
+        roald.export(os.path.join(self.tmp, 'voc2.txt'), format='upper')
+        for filename in ['voc.txt', 'voc2.txt']:
+            with open(os.path.join(self.tmp, filename), 'rb') as f:
+                assert b'FORNYBAR ENERGI\nLIVSSYKLUSANALYSE\n' == f.read()
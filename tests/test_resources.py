@@ -112,6 +112,60 @@ class TestResources(unittest.TestCase):
         assert 'REAL013995' == resources.get(term='Livssyklusanalyse').id
         assert 'REAL022146' == resources.get(term='Fornybar energi : Livssyklusanalyse').id
 
+    def test_find(self):
+        resources = Resources().load(self.testdata1)
+
+        def ids(result):
+            return [x['id'] for x in result]
+
+        assert ['REAL012789', 'REAL013995'] == ids(resources.find(type='Topic'))
+        assert ['REAL012789', 'REAL013995'] == ids(resources.find(memberOf='REAL022147', has='prefLabel.nb'))
+        assert ['REAL013995'] == ids(resources.find(**{'prefLabel.nb': 'Livssyklusanalyse'}))
+        assert ['REAL022146', 'REAL022147'] == ids(resources.find(type__in=['Collection', 'VirtualCompoundConcept']))
+        assert ['REAL013995', 'REAL022146'] == ids(resources.find(id__gte='REAL013', id__lt='REAL022147'))
+        assert [] == resources.find(type='Topic', has='component')
+        assert 4 == len(resources.find())
+        with pytest.raises(ValueError):
+            resources.find(type__like='Top')
+
+    def test_find_after_changes(self):
+        resources = Resources().load(self.testdata1)
+        assert [] == resources.find(modified__gte='2020-01-01')
+        assert [] == resources.find(has='mappings.exactMatch')
+
+        resources['REAL013995'].set('modified', '2020-05-01T00:00:00Z')
+        resources['REAL013995'].add('mappings.exactMatch', 'http://www.wikidata.org/entity/Q12705')
+        resources['REAL013995'].set_type('Geographic')
+        resources.load([{'id': 'REAL030000', 'type': ['Topic'], 'modified': '2021-01-01T00:00:00Z'}])
+
+        assert ['REAL013995', 'REAL030000'] == [x['id'] for x in resources.find(modified__gte='2020-01-01')]
+        assert ['REAL030000'] == [x['id'] for x in resources.find(modified__gt='2020-05-01T00:00:00Z')]
+        assert ['REAL013995'] == [x['id'] for x in resources.find(has='mappings.exactMatch')]
+        assert ['REAL012789', 'REAL030000'] == [x['id'] for x in resources.find(type='Topic')]
+
+    def test_interned_ids(self):
+        data = [dict(x) for x in self.testdata1]
+        data[1]['memberOf'] = [''.join(['REAL', '022147'])]  # not the same object as the ID
+        resources = Resources().load(data)
+        assert resources['REAL013995']['memberOf'][0] is resources['REAL022147']['id']
+
+    def test_relations(self):
+        resources = Resources().load(self.testdata1)
+        ids = resources.id_table
+        table = resources.relations('memberOf')
+        assert ['REAL022147'] == [ids[x] for x in table.get(ids.number('REAL013995'))]
+        assert [] == list(table.get(ids.number('REAL022147')))
+
+        members = table.inverse()
+        assert ['REAL012789', 'REAL013995'] == [ids[x] for x in members.get(ids.number('REAL022147'))]
+
+        # Tables are remade after changes
+        resources['REAL022146'].add('memberOf', 'REAL022147')
+        resources.load([{'id': 'REAL030000', 'type': ['Topic'], 'memberOf': ['REAL022147']}])
+        members = resources.relations('memberOf').inverse()
+        assert ['REAL012789', 'REAL013995', 'REAL022146', 'REAL030000'] == \
+            [ids[x] for x in members.get(ids.number('REAL022147'))]
+
     # def test_builder(self):
     #     c = Resources()
     #     # c.add('REAL012789').setPrefLabel('Fornybar energi', 'nb')
@@ -0,0 +1,168 @@
+# encoding=utf-8
+from __future__ import print_function
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from iso639 import languages
+
+from roald import Roald
+from roald.adapters.roald3 import Roald3Jsonl, Roald3Sharded
+
+
+class TestRoald3Jsonl(unittest.TestCase):
+
+    testdata = [
+        {'id': 'REAL%06d' % i, 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Term %d' % i}}}
+        for i in range(50, 0, -1)
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.roald = Roald()
+        self.roald.vocabulary.default_language = languages.get(alpha2='nb')
+        self.roald.vocabulary.uri_format = 'http://data.ub.uio.no/realfagstermer/c{id}'
+        self.roald.vocabulary.resources.load(self.testdata)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, filename):
+        return os.path.join(self.tmp, filename)
+
+    def test_write(self):
+        self.roald.save(self.path('out.jsonl'), format='roald3-jsonl')
+        with open(self.path('out.jsonl'), 'rb') as f:
+            lines = [json.loads(line.decode('utf-8')) for line in f]
+
+        assert {'default_language': 'nb', 'uri_format': 'http://data.ub.uio.no/realfagstermer/c{id}'} == lines[0]
+        assert sorted(self.testdata, key=lambda x: x['id']) == lines[1:]
+
+    def test_write_resource_streams_in_id_order(self):
+        # The resources are loaded in reverse ID order, so each is held back until the last
+        stream = io.BytesIO()
+        writer = Roald3Jsonl(self.roald.vocabulary)
+        writer.begin(stream)
+        resources = list(self.roald.vocabulary.resources)
+        for resource in resources[:-1]:
+            writer.write_resource(resource)
+        assert 49 == len(writer.waiting)
+        writer.write_resource(resources[-1])
+        assert {} == writer.waiting
+        writer.end()
+        unordered = stream.getvalue()
+
+        stream = io.BytesIO()
+        writer.begin(stream)
+        for resource in reversed(resources):
+            writer.write_resource(resource)
+            assert {} == writer.waiting
+        writer.end()
+        assert unordered == stream.getvalue()
+        assert [x['id'] for x in sorted(self.testdata, key=lambda x: x['id'])] == [
+            json.loads(line)['id'] for line in stream.getvalue().decode('utf-8').splitlines()[1:]]
+
+    def test_roundtrip(self):
+        self.roald.save(self.path('out.jsonl'), format='roald3-jsonl')
+        roald = Roald()
+        roald.load(self.path('out.jsonl'), format='roald3-jsonl')
+
+        assert 'nb' == roald.vocabulary.default_language.alpha2
+        assert self.roald.vocabulary.uri_format == roald.vocabulary.uri_format
+        assert sorted(self.testdata, key=lambda x: x['id']) == [x.serialize() for x in roald.vocabulary.resources]
+
+    def test_split(self):
+        self.roald.save(self.path('out.jsonl'), format='roald3-jsonl')
+        ranges = Roald3Jsonl.split(self.path('out.jsonl'), 7)
+
+        assert 7 == len(ranges)
+        resources = []
+        for start, end in ranges:
+            resources += list(Roald3Jsonl.iter_range(self.path('out.jsonl'), start, end))
+        assert sorted(self.testdata, key=lambda x: x['id']) == resources
+
+        # More ranges than lines
+        assert 50 == len(Roald3Jsonl.split(self.path('out.jsonl'), 200))
+
+    def test_parallel_load(self):
+        self.roald.save(self.path('out.jsonl'), format='roald3-jsonl')
+        roald = Roald()
+        roald.load(self.path('out.jsonl'), format='roald3-jsonl', jobs=2)
+        assert sorted(self.testdata, key=lambda x: x['id']) == [x.serialize() for x in roald.vocabulary.resources]
+
+    def test_journal(self):
+        self.roald.save(self.path('out.jsonl'), format='roald3-jsonl')
+        roald = Roald()
+        roald.load(self.path('out.jsonl'), format='roald3-jsonl', journal=True)
+        roald.vocabulary.resources.get(id='REAL000001').set('prefLabel.en', 'Term')
+        roald.save(self.path('out.jsonl'), format='roald3-jsonl')
+        assert os.path.exists(self.path('out.jsonl.journal'))
+
+        roald.compact()
+        assert not os.path.exists(self.path('out.jsonl.journal'))
+        roald = Roald()
+        roald.load(self.path('out.jsonl'), format='roald3-jsonl')
+        assert 'Term' == roald.vocabulary.resources.get(id='REAL000001').prefLabel['en'].value
+
+
+class TestRoald3Sharded(unittest.TestCase):
+
+    testdata = [
+        {'id': 'REAL000001', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Fornybar energi'}}},
+        {'id': 'REAL000002', 'type': ['Place'], 'prefLabel': {'nb': {'value': 'Oslo'}}},
+        {'id': 'HUME000001', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Filosofi'}}},
+        {'id': 'SMR000001', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Menneskerettigheter'}}},
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dirname = os.path.join(self.tmp, 'vocabulary')
+        self.roald = Roald()
+        self.roald.vocabulary.default_language = languages.get(alpha2='nb')
+        self.roald.vocabulary.resources.load(self.testdata)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def load(self, **kwargs):
+        roald = Roald()
+        roald.load(self.dirname, format='roald3-sharded', **kwargs)
+        return sorted(x['id'] for x in roald.vocabulary.resources)
+
+    def test_shard_by_prefix(self):
+        self.roald.save(self.dirname, format='roald3-sharded')
+
+        assert ['HUME.jsonl', 'REAL.jsonl', 'SMR.jsonl', 'manifest.json'] == sorted(os.listdir(self.dirname))
+        manifest = Roald3Sharded.read_manifest(self.dirname)
+        assert {'Topic': 1, 'Place': 1} == manifest['shards']['REAL']['types']
+
+        assert sorted(x['id'] for x in self.testdata) == self.load()
+        assert ['HUME000001', 'SMR000001'] == self.load(shards=['HUME', 'SMR'])
+        with self.assertRaises(ValueError):
+            self.load(shards=['XYZ'])
+
+    def test_shard_by_hash(self):
+        self.roald.save(self.dirname, format='roald3-sharded', shard_by='hash', n_shards=2)
+
+        manifest = Roald3Sharded.read_manifest(self.dirname)
+        assert set(manifest['shards'].keys()) <= {'00', '01'}
+        assert 4 == sum(x['count'] for x in manifest['shards'].values())
+        assert sorted(x['id'] for x in self.testdata) == self.load(jobs=2)
+
+    def test_unchanged_shards_are_not_rewritten(self):
+        self.roald.save(self.dirname, format='roald3-sharded')
+        for name in os.listdir(self.dirname):
+            os.utime(os.path.join(self.dirname, name), (0, 0))
+
+        self.roald.vocabulary.resources.get(id='HUME000001').set('prefLabel.en', 'Philosophy')
+        self.roald.save(self.dirname, format='roald3-sharded')
+
+        changed = sorted(x for x in os.listdir(self.dirname) if os.path.getmtime(os.path.join(self.dirname, x)) > 0)
+        assert ['HUME.jsonl', 'manifest.json'] == changed
+
+    def test_removed_shards_are_deleted(self):
+        self.roald.save(self.dirname, format='roald3-sharded')
+        self.roald.save(self.dirname, format='roald3-sharded', shard_by='hash', n_shards=1)
+        assert ['00.jsonl', 'manifest.json'] == sorted(os.listdir(self.dirname))
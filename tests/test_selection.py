@@ -0,0 +1,179 @@
+# encoding=utf-8
+from __future__ import print_function
+import codecs
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from iso639 import languages
+
+from roald import Roald
+from roald.selection import Selection
+
+
+class TestSelection(unittest.TestCase):
+
+    testdata = [
+        {
+            'id': 'REAL012789',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Fornybar energi'}},
+            'definition': {'nb': 'Energi fra kilder som fornyes'},
+            'created': '2015-02-20T13:08:04Z',
+            'modified': '2019-05-01T10:00:00Z',
+        },
+        {
+            'id': 'REAL013995',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}},
+            'broader': ['REAL012789'],
+            'created': '2020-02-20T13:08:04Z',
+        },
+        {
+            'id': 'REAL030070',
+            'type': ['GenreForm'],
+            'prefLabel': {'nb': {'value': 'Atlas'}},
+            'created': '2015-02-20T13:08:04Z',
+            'modified': '2021-01-01T00:00:00Z',
+        },
+        {
+            'id': 'REAL040000',
+            'type': ['CompoundHeading'],
+            'prefLabel': {},
+            'component': ['REAL012789', 'REAL030070'],
+            'created': '2015-02-20T13:08:04Z',
+        },
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, 'vocabulary.json')
+        roald = Roald()
+        roald.vocabulary.default_language = languages.get(alpha2='nb')
+        roald.vocabulary.resources.load(self.testdata)
+        roald.save(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def load(self, filename=None, **kwargs):
+        roald = Roald()
+        roald.load(filename or self.filename, **kwargs)
+        return roald.vocabulary.resources
+
+    def test_accepts(self):
+        selection = Selection(types=['Topic'], modified_since=date(2020, 1, 1))
+        assert [False, True, False, False] == [selection.accepts(x) for x in self.testdata]
+
+        with self.assertRaises(ValueError):
+            Selection(types='Topic')
+        assert Selection.create() is None
+
+    def test_types(self):
+        resources = self.load(types=['Topic'])
+        assert ['REAL012789', 'REAL013995'] == [x['id'] for x in resources]
+
+    def test_ids(self):
+        resources = self.load(ids=['REAL013995', 'REAL999999'])
+        assert ['REAL013995'] == [x['id'] for x in resources]
+
+    def test_modified_since(self):
+        resources = self.load(modified_since='2020-01-01')
+        assert ['REAL013995', 'REAL030070'] == [x['id'] for x in resources]
+
+    def test_fields(self):
+        resources = self.load(fields=['prefLabel'])
+        resource = resources.get(id='REAL012789')
+        assert ['id', 'prefLabel', 'type'] == sorted(resource._data.keys())
+        assert 'Fornybar energi' == resource.prefLabel['nb'].value
+        assert 'REAL012789' == resources.get(term='Fornybar energi', lang='nb')['id']
+
+        resources = self.load(fields=['definition'])
+        assert {} == resources.get(id='REAL012789').prefLabel
+
+    def test_compound_heading_without_components(self):
+        resources = self.load(types=['CompoundHeading', 'Topic'])
+        assert 3 == len(resources)
+
+    def test_jsonl_and_sharded(self):
+        roald = Roald()
+        roald.load(self.filename)
+        roald.save(self.filename + 'l', format='roald3-jsonl')
+        roald.save(os.path.join(self.tmp, 'shards'), format='roald3-sharded', shard_by='hash', n_shards=4)
+
+        resources = self.load(self.filename + 'l', format='roald3-jsonl', types=['GenreForm'])
+        assert ['REAL030070'] == [x['id'] for x in resources]
+        resources = self.load(self.filename + 'l', format='roald3-jsonl', types=['GenreForm'], jobs=2)
+        assert ['REAL030070'] == [x['id'] for x in resources]
+        resources = self.load(os.path.join(self.tmp, 'shards'), format='roald3-sharded', ids=['REAL030070'])
+        assert ['REAL030070'] == [x['id'] for x in resources]
+
+    def test_journal_replay(self):
+        roald = Roald()
+        roald.load(self.filename, journal=True)
+        roald.vocabulary.resources.get(id='REAL012789').set('definition.en', 'Renewable energy')
+        roald.vocabulary.resources.get(id='REAL030070').set('prefLabel.en', 'Atlas')
+        roald.save(self.filename)
+
+        resources = self.load(types=['Topic'], fields=['prefLabel'])
+        assert 2 == len(resources)
+        assert 'definition' not in resources.get(id='REAL012789')
+
+        with self.assertRaises(ValueError):
+            Roald().load(self.filename, types=['Topic'], journal=True)
+
+    def marc21_record(self, rec_id, tag, label, modified):
+        return (
+            '<record><leader>00000nz  a2200000n  4500</leader>'
+            '<controlfield tag="005">{modified}.0</controlfield>'
+            '<controlfield tag="008">150220nn zzzzzza                        </controlfield>'
+            '<datafield tag="035" ind1=" " ind2=" "><subfield code="a">(NO-TrBIB){id}</subfield></datafield>'
+            '<datafield tag="{tag}" ind1=" " ind2=" "><subfield code="a">{label}</subfield></datafield>'
+            '<datafield tag="677" ind1=" " ind2=" "><subfield code="a">Definisjon</subfield></datafield>'
+            '</record>'
+        ).format(id=rec_id, tag=tag, label=label, modified=modified)
+
+    def test_marc21(self):
+        filename = os.path.join(self.tmp, 'authorities.xml')
+        with codecs.open(filename, 'w', 'utf-8') as f:
+            f.write('<collection>' + ''.join([
+                self.marc21_record('REAL012789', '150', 'Fornybar energi', '20190501100000'),
+                self.marc21_record('REAL013995', '150', 'Livssyklusanalyse', '20200501100000'),
+                # With whitespace around the control number, which is ignored
+                self.marc21_record('REAL030070', '155', 'Atlas', '20210101000000').replace(
+                    '>(NO-TrBIB)REAL030070<', '>\n  (NO-TrBIB)REAL030070\n<'),
+            ]) + '</collection>')
+
+        resources = self.load(filename, format='marc21', language='nb', types=['Topic'], fields=['prefLabel'])
+        assert ['REAL012789', 'REAL013995'] == [x['id'] for x in resources]
+        resource = resources.get(id='REAL013995')
+        assert 'Livssyklusanalyse' == resource.prefLabel['nb'].value
+        assert 'definition' not in resource and 'modified' not in resource
+
+        resources = self.load(filename, format='marc21', language='nb', ids=['REAL030070'])
+        assert ['REAL030070'] == [x['id'] for x in resources]
+        assert 'Definisjon' == resources.get(id='REAL030070').get('definition.nb')
+
+        resources = self.load(filename, format='marc21', language='nb', modified_since='2020-01-01')
+        assert ['REAL013995', 'REAL030070'] == [x['id'] for x in resources]
+
+    def test_roald2(self):
+        path = os.path.join(self.tmp, 'roald2') + os.sep
+        os.mkdir(path)
+        with codecs.open(path + 'idtermer.txt', 'w', 'utf-8') as f:
+            f.write('id= REAL012789\nte= Fornybar energi\nde= Energi\ntie= 2019-05-01T10:00:00Z\n\n'
+                    'id= REAL013995\nte= Livssyklusanalyse\ntie= 2020-05-01T10:00:00Z\n\n')
+        with codecs.open(path + 'idformer.txt', 'w', 'utf-8') as f:
+            f.write('id= REAL030070\nte= Atlas\n\n')
+
+        resources = self.load(path, format='roald2', language='nb', modified_since='2020-01-01',
+                              fields=['prefLabel'])
+        assert ['REAL013995'] == [x['id'] for x in resources]
+
+        resources = self.load(path, format='roald2', language='nb', types=['GenreForm'])
+        assert ['REAL030070'] == [x['id'] for x in resources]
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            Roald().load(self.filename, format='skos', types=['Topic'])
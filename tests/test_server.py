@@ -0,0 +1,127 @@
+# encoding=utf-8
+from __future__ import print_function
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from iso639 import languages
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.parse import quote
+from six.moves.urllib.request import urlopen
+
+from roald import Roald
+from roald.server import LookupServer, LookupService
+
+
+class TestServer(unittest.TestCase):
+
+    testdata = [
+        {'id': 'REAL012789', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Fornybar energi'},
+                                                               'en': {'value': 'Renewable energy'}},
+         'altLabel': {'nb': [{'value': 'Fornybare energikilder'}]}},
+        {'id': 'REAL013995', 'type': ['Geographic'], 'prefLabel': {'nb': {'value': 'Norge'}}},
+        {'id': 'REAL022146', 'type': ['Topic', 'CompoundHeading'], 'prefLabel': {},
+         'component': ['REAL012789', 'REAL013995']},
+        {'id': 'REAL030072', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Fornybar kraft'}}, 'deprecated': True},
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, 'vocabulary.json')
+        self.write(self.testdata)
+        self.service = LookupService(self.filename)
+        self.service.reload()
+        self.server = LookupServer(('127.0.0.1', 0), self.service, threads=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmp)
+
+    def write(self, data):
+        roald = Roald()
+        roald.vocabulary.default_language = languages.get(alpha2='nb')
+        roald.set_uri_format('http://data.ub.uio.no/realfagstermer/c{id}', 'REAL')
+        roald.vocabulary.resources.load(data)
+        roald.save(self.filename)
+
+    def get(self, path):
+        url = 'http://127.0.0.1:%d%s' % (self.server.server_address[1], path)
+        try:
+            response = urlopen(url)
+            status = response.getcode()
+        except HTTPError as error:
+            response, status = error, error.code
+        return status, json.loads(response.read().decode('utf-8'))
+
+    def test_id(self):
+        status, data = self.get('/id/REAL012789')
+        assert 200 == status
+        assert 'Fornybar energi' == data['prefLabel']['nb']['value']
+        assert 'http://data.ub.uio.no/realfagstermer/c012789' == data['uri']
+        assert 404 == self.get('/id/REAL999999')[0]
+        assert 404 == self.get('/unknown')[0]
+
+    def test_term(self):
+        status, data = self.get('/term?q=fornybar+ENERGI')
+        assert 200 == status
+        assert [{'id': 'REAL012789', 'label': 'Fornybar energi', 'lang': 'nb', 'preferred': True,
+                 'type': ['Topic']}] == data
+        assert ['REAL012789'] == [x['id'] for x in self.get('/term?q=Fornybare+energikilder')[1]]
+        assert ['REAL022146'] == [x['id'] for x in self.get('/term?q=' + quote('Fornybar energi : Norge'))[1]]
+        assert [] == self.get('/term?q=Renewable+energy&lang=nb')[1]
+        assert [] == self.get('/term?q=Fornybar+kraft')[1]  # deprecated
+        assert 400 == self.get('/term')[0]
+
+    def test_search(self):
+        status, data = self.get('/search?q=forny')
+        assert 200 == status
+        assert [('REAL012789', 'Fornybar energi'), ('REAL022146', 'Fornybar energi : Norge')] == \
+            [(x['id'], x['label']) for x in data]
+        assert ['REAL012789'] == [x['id'] for x in self.get('/search?q=forny&limit=1')[1]]
+        assert ['REAL012789'] == [x['id'] for x in self.get('/search?q=renew&lang=en')[1]]
+        assert [] == self.get('/search?q=renew&lang=nb')[1]
+
+    def test_authorize(self):
+        status, data = self.get('/authorize?q=' + quote('$a Fornybar energi $z Norge') + '&tag=650')
+        assert 200 == status
+        assert 'REAL022146' == data['id']
+        assert 404 == self.get('/authorize?q=Ukjent')[0]
+
+    def test_reload_journal(self):
+        roald = Roald()
+        roald.load(self.filename, journal=True)
+        roald.vocabulary.resources['REAL013995'].replace('prefLabel.nb', 'Noreg')
+        roald.save(self.filename)
+        assert os.path.isfile(self.filename + '.journal')
+
+        assert not self.service.check()
+        assert self.service.check()
+        assert 'Noreg' == self.get('/id/REAL013995')[1]['prefLabel']['nb']['value']
+        assert [] == self.get('/term?q=Norge')[1]
+
+    def test_reload(self):
+        index = self.service.index
+        assert not self.service.check()
+
+        self.write(self.testdata + [{'id': 'REAL040000', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Solenergi'}}}])
+        assert not self.service.check()  # not reloaded until the file is unchanged between two checks
+        assert 404 == self.get('/id/REAL040000')[0]
+        assert self.service.check()
+        assert 200 == self.get('/id/REAL040000')[0]
+        assert 2 == self.get('/status')[1]['reloads']
+        # The previous index is not changed, for requests still using it
+        assert index.resource('REAL040000') is None
+
+        # A broken file is not loaded, and the last good index is kept
+        with open(self.filename, 'w') as f:
+            f.write('{"resources": [')
+        assert not self.service.check()
+        assert not self.service.check()
+        assert 200 == self.get('/id/REAL040000')[0]
+        assert not self.service.check()
@@ -0,0 +1,120 @@
+# encoding=utf-8
+from __future__ import print_function
+import pickle
+import unittest
+from iso639 import languages
+from rdflib.graph import Graph
+from rdflib.namespace import URIRef
+
+from roald.adapters.skos import Skos
+from roald.models import VocabularyView
+from roald.models.vocabulary import Vocabulary
+
+
+class TestSkos(unittest.TestCase):
+
+    testdata = [
+        {
+            'id': 'REAL012789',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Fornybar energi'}, 'en': {'value': 'Renewable energy'}},
+            'altLabel': {'nb': [{'value': 'Fornybare energikilder'}]},
+            'memberOf': ['REAL022147'],
+            'created': '2015-02-20T13:08:04Z',
+        },
+        {
+            'id': 'REAL013995',
+            'type': ['Topic'],
+            'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}},
+            'broader': ['REAL012789'],
+            'related': ['REAL012789'],
+        },
+        {
+            'id': 'REAL022146',
+            'type': ['CompoundHeading'],
+            'component': ['REAL012789', 'REAL013995'],
+            'prefLabel': {}
+        },
+        {
+            'id': 'REAL022147',
+            'type': ['Collection'],
+            'prefLabel': {'nb': {'value': 'Energi'}}
+        }
+    ]
+
+    scheme_uri = URIRef('http://data.ub.uio.no/realfagstermer/')
+
+    def get_vocabulary(self):
+        voc = Vocabulary()
+        voc.default_language = languages.get(alpha2='nb')
+        voc.uri_format = 'http://data.ub.uio.no/realfagstermer/c{id}'
+        voc.resources.load(self.testdata)
+        return voc
+
+    def convert(self, workers):
+        graph = Graph()
+        Skos(self.get_vocabulary(), workers=workers).convert_resources(graph, self.scheme_uri)
+        return graph
+
+    def test_convert_resources(self):
+        graph = self.convert(workers=1)
+        uri = URIRef('http://data.ub.uio.no/realfagstermer/c022146')
+        labels = [x.value for x in graph.objects(uri, URIRef('http://www.w3.org/2004/02/skos/core#prefLabel'))
+                  if x.language == 'nb']
+        assert ['Fornybar energi : Livssyklusanalyse'] == labels
+
+    def test_parallel_equals_serial(self):
+        serial = self.convert(workers=1)
+        parallel = self.convert(workers=2)
+        assert len(serial) > 0
+        assert set(serial) == set(parallel)
+
+    def test_parallel_view_equals_serial(self):
+        graphs = []
+        for workers in [1, 2]:
+            view = VocabularyView(self.get_vocabulary(), ids=['REAL012789', 'REAL013995', 'REAL022147'])
+            graph = Graph()
+            Skos(view, workers=workers).convert_resources(graph, self.scheme_uri)
+            graphs.append(set(graph))
+        assert len(graphs[0]) > 0
+        assert graphs[0] == graphs[1]
+        assert not [x for x in graphs[1] if x[0] == URIRef('http://data.ub.uio.no/realfagstermer/c022146')]
+
+    def test_view_ignores_problems_outside_the_view(self):
+        voc = self.get_vocabulary()
+        voc.resources.load([
+            {'id': 'REAL030000', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Foreldet'}},
+             'broader': ['REAL999999']},
+            {'id': 'REAL030001', 'type': ['CompoundHeading'], 'prefLabel': {}},
+        ])
+        assert not voc.resources.validate().ok
+
+        view = VocabularyView(voc, ids=['REAL012789', 'REAL013995', 'REAL022147'])
+        skos = Skos(view)
+        skos.check_references()
+        graph = Graph()
+        skos.convert_resources(graph, self.scheme_uri)
+        assert len(graph) > 0
+        with self.assertRaisesRegex(Exception, 'ugyldig ID: REAL999999'):
+            Skos(voc).check_references()
+
+        # A compound heading without components doesn't stop the export
+        skos = Skos(VocabularyView(voc, lambda x: x['id'] != 'REAL030000'))
+        skos.check_references()
+        skos.convert_resources(Graph(), self.scheme_uri)
+
+    def test_change_after_validation_is_checked(self):
+        voc = self.get_vocabulary()
+        assert voc.resources.validate().ok
+        voc.resources['REAL013995'].add('broader', 'REAL999999')
+        with self.assertRaisesRegex(Exception, 'ugyldig ID: REAL999999'):
+            Skos(voc).check_references()
+        with self.assertRaisesRegex(Exception, 'ugyldig ID: REAL999999'):
+            Skos(voc).convert_resources(Graph(), self.scheme_uri)
+
+    def test_adapter_can_be_pickled(self):
+        # Needed for the process pool when the vocabulary can't be inherited by forking
+        skos = pickle.loads(pickle.dumps(Skos(self.get_vocabulary(), workers=2)))
+        assert 'Livssyklusanalyse' == skos.vocabulary.resources['REAL013995'].prefLabel['nb'].value
+        assert 'http://data.ub.uio.no/realfagstermer/c013995' == skos.vocabulary.uri('REAL013995')
+        assert 'nb' == skos.vocabulary.default_language.alpha2
@@ -0,0 +1,115 @@
+# encoding=utf-8
+from __future__ import print_function
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from iso639 import languages
+from rdflib import Graph, Literal, Namespace, URIRef
+from rdflib.namespace import XSD
+
+from roald import Roald
+from roald.usage import count_usage, store_usage, write_usage
+from tests.test_enrichment import iso2709_record
+
+
+class TestUsage(unittest.TestCase):
+
+    testdata = [
+        {'id': 'REAL012789', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Fornybar energi'}}},
+        {'id': 'REAL013995', 'type': ['Geographic'], 'prefLabel': {'nb': {'value': 'Norge'}}},
+        {'id': 'REAL022146', 'type': ['Topic', 'CompoundHeading'], 'prefLabel': {},
+         'component': ['REAL012789', 'REAL013995']},
+        {'id': 'REAL030070', 'type': ['GenreForm'], 'prefLabel': {'nb': {'value': 'Atlas'}}},
+        {'id': 'REAL030071', 'type': ['GenreForm'], 'prefLabel': {'nb': {'value': 'Atlas'}}},
+    ]
+
+    records = [
+        [(b'650', b' 7', [(b'a', u'Fornybar energi'), (b'z', u'Norge'), (b'2', u'noubomn')]),
+         (b'651', b' 7', [(b'a', u'Norge'), (b'2', u'noubomn')]),
+         (b'655', b' 7', [(b'a', u'Atlas'), (b'2', u'noubomn')]),
+         (b'650', b' 0', [(b'a', u'Norway'), (b'2', u'lcsh')])],
+        # The same resource twice, by $0 and by label
+        [(b'650', b' 7', [(b'a', u'Renewable energy'), (b'2', u'noubomn'),
+                          (b'0', u'http://data.ub.uio.no/realfagstermer/c012789')]),
+         (b'650', b' 7', [(b'a', u'fornybar  energi'), (b'2', u'noubomn')]),
+         (b'651', b' 7', [(b'a', u'Norge'), (b'2', u'noubomn'), (b'0', u'REAL013995')])],
+        [(b'245', b'10', [(b'a', u'Uten emneord')])],
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.roald = Roald()
+        self.roald.vocabulary.default_language = languages.get(alpha2='nb')
+        self.roald.set_uri_format('http://data.ub.uio.no/realfagstermer/c{id}', 'REAL')
+        self.roald.vocabulary.resources.load(self.testdata)
+        with open(self.path('bib.mrc'), 'wb') as f:
+            for fields in self.records:
+                f.write(iso2709_record(fields))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, filename):
+        return os.path.join(self.tmp, filename)
+
+    def test_count_usage(self):
+        for jobs in [1, 2]:
+            report = count_usage(self.roald.vocabulary, [self.path('bib.mrc')], 'noubomn', jobs=jobs, batch_size=1)
+            assert {'REAL022146': 1, 'REAL013995': 2, 'REAL012789': 1} == report.counts
+            assert (3, 6, 1) == (report.records, report.fields, report.unmatched)
+
+        report = count_usage(self.roald.vocabulary, [self.path('bib.mrc'), self.path('bib.mrc')], 'noubomn')
+        assert 4 == report.counts['REAL013995']
+        assert 6 == report.records
+
+    def test_store_usage(self):
+        resources = self.roald.vocabulary.resources
+        report = count_usage(self.roald.vocabulary, [self.path('bib.mrc')], 'noubomn')
+        assert 3 == store_usage(resources, report.counts)
+        assert 2 == resources['REAL013995'].get('usageCount')
+        assert resources['REAL030070'].get('usageCount') is None
+
+        # Counts are replaced, and removed from resources no longer in use
+        assert 2 == store_usage(resources, {'REAL013995': 5, 'REAL022146': 1})
+        assert 5 == resources['REAL013995'].get('usageCount')
+        assert resources['REAL012789'].get('usageCount') is None
+
+        self.roald.save(self.path('out.json'))
+        roald = Roald()
+        roald.load(self.path('out.json'), format='roald3')
+        assert 5 == roald.vocabulary.resources['REAL013995'].get('usageCount')
+
+        write_usage(resources, self.path('usage.csv'))
+        with io.open(self.path('usage.csv'), encoding='utf-8') as f:
+            assert [u'id,label,count', u'REAL013995,Norge,5',
+                    u'REAL022146,Fornybar energi : Norge,1'] == f.read().splitlines()
+
+    def test_skos(self):
+        with open(self.path('scheme.ttl'), 'w') as f:
+            f.write('<http://data.ub.uio.no/realfagstermer/> a <http://www.w3.org/2004/02/skos/core#ConceptScheme> .\n')
+        store_usage(self.roald.vocabulary.resources, {'REAL013995': 2})
+        local = Namespace('http://data.ub.uio.no/onto#')
+        uri = URIRef('http://data.ub.uio.no/realfagstermer/c013995')
+        for with_usage, expected in [(False, None), (True, Literal(2, datatype=XSD.integer))]:
+            self.roald.export(self.path('out.ttl'), format='rdfskos', include=[self.path('scheme.ttl')],
+                              with_usage=with_usage)
+            graph = Graph()
+            graph.parse(self.path('out.ttl'), format='turtle')
+            assert expected == graph.value(uri, local.usageCount)
+
+    def test_store_usage_journaled(self):
+        filename = self.path('vocabulary.json')
+        self.roald.save(filename)
+        for counts in [{'REAL013995': 2, 'REAL012789': 1}, {'REAL013995': 5}]:
+            roald = Roald()
+            roald.load(filename, journal=True)
+            store_usage(roald.vocabulary.resources, counts)
+            roald.save(filename)
+
+        roald = Roald()
+        roald.load(filename)
+        resources = roald.vocabulary.resources
+        assert 5 == resources['REAL013995'].get('usageCount')
+        assert resources['REAL012789'].get('usageCount') is None
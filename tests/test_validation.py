@@ -0,0 +1,94 @@
+# encoding=utf-8
+from __future__ import print_function
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from iso639 import languages
+
+from roald import Roald
+from roald.errors import InvalidDataException
+from roald.models.resources import Resources
+from roald.models.view import ResourcesView
+
+
+class TestValidation(unittest.TestCase):
+
+    testdata = [
+        {'id': 'REAL012789', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Fornybar energi'}}},
+        {'id': 'REAL013995', 'type': ['Topic'], 'prefLabel': {'nb': {'value': 'Livssyklusanalyse'}},
+         'broader': ['REAL012789', 'REAL999999'], 'related': ['REAL888888']},
+        {'id': 'REAL022146', 'type': ['Topic', 'CompoundHeading'], 'prefLabel': {},
+         'component': ['REAL012789', 'REAL777777']},
+        {'id': 'REAL022147', 'type': ['Topic', 'CompoundHeading'], 'prefLabel': {}},
+    ]
+
+    def test_report(self):
+        report = Resources().load(self.testdata).validate()
+        assert not report.ok
+        assert 4 == report.checked
+        assert [
+            ('REAL013995', 'broader', 'REAL999999', 'unknown-id'),
+            ('REAL013995', 'related', 'REAL888888', 'unknown-id'),
+            ('REAL022146', 'component', 'REAL777777', 'unknown-id'),
+            ('REAL022147', 'component', None, 'no-components'),
+        ] == [(x.id, x.key, x.value, x.kind) for x in report]
+        assert {('unknown-id', 'broader'): 1, ('unknown-id', 'related'): 1, ('unknown-id', 'component'): 1,
+                ('no-components', 'component'): 1} == report.by_kind()
+        assert 'REAL999999' == report.serialize()['problems'][0]['value']
+        assert report.summary(limit=1).endswith('... and 3 more')
+
+        report.check(['memberOf'])
+        with self.assertRaisesRegex(InvalidDataException, 'ugyldig ID: REAL888888'):
+            report.check(['related'])
+
+    def test_check_kinds(self):
+        report = Resources().load(self.testdata[3:]).validate()
+        report.check(kinds=['unknown-id'])
+        with self.assertRaisesRegex(InvalidDataException, 'uten komponenter'):
+            report.check(['component'])
+
+    def test_view(self):
+        resources = Resources().load(self.testdata)
+        view = ResourcesView(resources, ids=['REAL012789', 'REAL022146'])
+        assert [('REAL022146', 'REAL777777')] == [(x.id, x.value) for x in view.validate()]
+        assert view.validation is None
+
+        view = ResourcesView(resources, ids=['REAL012789'])
+        assert view.validate().ok
+
+    def test_valid(self):
+        resources = Resources().load(self.testdata[:1])
+        assert resources.validate().ok
+        assert resources.validation is not None
+
+        # Kept until a resource is changed or more resources are loaded
+        resources['REAL012789'].set('prefLabel.en', 'Renewable energy')
+        assert resources.validation is None
+        resources.validate()
+        resources['REAL012789'].add('related', 'REAL999999')
+        assert resources.validation is None
+        resources.validate()
+        resources.load(self.testdata[1:2])
+        assert resources.validation is None
+
+    def test_load(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            roald = Roald()
+            roald.vocabulary.default_language = languages.get(alpha2='nb')
+            roald.vocabulary.resources.load(self.testdata)
+            roald.save(os.path.join(tmp, 'vocabulary.json'))
+
+            roald = Roald()
+            with self.assertLogs('roald.roald', logging.WARNING) as logs:
+                roald.load(os.path.join(tmp, 'vocabulary.json'))
+            assert '4 problems in 4 resources' in logs.output[0]
+            assert 4 == len(roald.vocabulary.resources.validation)
+
+            roald = Roald()
+            roald.load(os.path.join(tmp, 'vocabulary.json'), validate=False)
+            assert roald.vocabulary.resources.validation is None
+        finally:
+            shutil.rmtree(tmp)
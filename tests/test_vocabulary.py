@@ -1,10 +1,57 @@
 # encoding=utf-8
 from __future__ import print_function
+import pickle
 import unittest
+import pytest
 
+from roald.models.uri import UriCodec
 from roald.models.vocabulary import Vocabulary
 
 
 class TestVocabulary(unittest.TestCase):
 
-	pass
\ No newline at end of file
+    def test_uri(self):
+        voc = Vocabulary()
+        voc.uri_format = 'http://data.ub.uio.no/realfagstermer/c{id}'
+        assert 'http://data.ub.uio.no/realfagstermer/c012680' == voc.uri('REAL012680')
+        assert 'http://example.com/x' == voc.uri('http://example.com/x')
+
+    def test_uri_without_format(self):
+        voc = Vocabulary()
+        with pytest.raises(Exception):
+            voc.uri('REAL012680')
+
+    def test_id_from_uri(self):
+        voc = Vocabulary()
+        voc.uri_format = 'http://data.ub.uio.no/realfagstermer/c{id}'
+        voc.id_prefix = 'REAL'
+        assert 'REAL012680' == voc.id_from_uri('http://data.ub.uio.no/realfagstermer/c012680')
+        assert voc.id_from_uri('http://data.ub.uio.no/humord/c012680') is None
+
+    def test_codec_is_rebuilt_on_change(self):
+        voc = Vocabulary()
+        voc.uri_format = 'http://data.ub.uio.no/realfagstermer/c{id}'
+        assert 'http://data.ub.uio.no/realfagstermer/c1' == voc.uri('REAL1')
+        voc.uri_format = 'http://data.ub.uio.no/humord/c{id}'
+        assert 'http://data.ub.uio.no/humord/c1' == voc.uri('REAL1')
+
+
+class TestUriCodec(unittest.TestCase):
+
+    def test_invalid_id(self):
+        codec = UriCodec('http://data.me/c{id}')
+        with pytest.raises(Exception):
+            codec.uri('REAL')
+
+    def test_cache_is_bounded(self):
+        codec = UriCodec('http://data.me/c{id}', cache_size=2)
+        for x in range(5):
+            codec.uri('REAL%d' % x)
+        codec.uri('REAL4')
+        info = codec.cache_info()['uri']
+        assert 2 == info.currsize
+        assert 1 == info.hits
+
+    def test_pickle(self):
+        codec = pickle.loads(pickle.dumps(UriCodec('http://data.me/c{id}', 'REAL')))
+        assert 'REAL12' == codec.id_from_uri('http://data.me/c12')